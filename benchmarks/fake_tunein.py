@@ -0,0 +1,235 @@
+"""Local stand-in for opml.radiotime.com and the stream hosts it points to."""
+
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# The start of an MPEG audio frame, repeated as stream content.
+AUDIO_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class FakeTuneIn:
+    """
+    Serve a made-up TuneIn directory with ``categories`` categories of
+    ``sections`` genres, each holding ``stations`` stations.
+
+    Every response is delayed by ``latency`` seconds and fails with a 503
+    for ``failure_rate`` of requests. Tuning a station gives
+    ``dead_mirrors`` stream URLs nobody is listening on before a playlist
+    of a working stream. Point a client at it with :attr:`base_uri`.
+    """
+
+    def __init__(
+        self,
+        categories=4,
+        sections=10,
+        stations=50,
+        latency=0.0,
+        failure_rate=0.0,
+        dead_mirrors=0,
+        seed=0,
+    ):
+        self.categories = categories
+        self.sections = sections
+        self.stations = stations
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.dead_mirrors = dead_mirrors
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+        self.dead_host = f"127.0.0.1:{_unused_port()}"
+
+    @property
+    def host(self):
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def base_uri(self):
+        """Value for :attr:`TuneIn._base_uri`."""
+        return f"http://{self.host}/%s"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def station_ids(self):
+        return [
+            f"s{c}{g:03d}{n:04d}"
+            for c in range(self.categories)
+            for g in range(self.sections)
+            for n in range(self.stations)
+        ]
+
+    def fail(self):
+        with self._lock:
+            self.requests += 1
+            return self._random.random() < self.failure_rate
+
+    def respond(self, path, query):
+        """Return ``(status, content_type, body)`` for a request."""
+        if path == "/Browse.ashx":
+            return self._json(self._browse(query))
+        if path == "/Search.ashx":
+            return self._json(self._stations("0000", query.get("query", "")))
+        if path == "/Describe.ashx":
+            return self._json(self._describe(query.get("id", "")))
+        if path == "/Tune.ashx":
+            return self._json(self._tune(query.get("id", "")))
+        if path.startswith("/stream/") and path.endswith(".pls"):
+            station_id = path[len("/stream/") : -len(".pls")]
+            return (
+                200,
+                "audio/x-scpls",
+                (
+                    "[playlist]\nNumberOfEntries=1\n"
+                    f"File1=http://{self.host}/stream/{station_id}\n"
+                ).encode(),
+            )
+        if path.startswith("/stream/"):
+            return 200, "audio/mpeg", AUDIO_FRAME * 16
+        return 404, "text/plain", b"Not found"
+
+    def _json(self, body):
+        return (
+            200,
+            "application/json",
+            json.dumps({"head": {"status": "200"}, "body": body}).encode(),
+        )
+
+    def _browse(self, query):
+        category = query.get("c")
+        guide_id = query.get("id", "")
+        if not category and not guide_id:
+            return [
+                self._link(f"Category {c}", f"c{c}", key=f"category{c}")
+                for c in range(self.categories)
+            ]
+        if category == "trending":
+            return self._stations("0000")
+        if category and category.startswith("category"):
+            c = category[len("category") :]
+            return [
+                self._link(f"Genre {c}.{g}", f"g{c}{g:03d}")
+                for g in range(self.sections)
+            ]
+        if guide_id.startswith("g"):
+            return [
+                {
+                    "element": "outline",
+                    "text": "Stations",
+                    "key": "stations",
+                    "children": self._stations(guide_id[1:]),
+                }
+            ]
+        return []
+
+    def _link(self, text, guide_id, key=None):
+        link = {
+            "element": "outline",
+            "type": "link",
+            "text": text,
+            "URL": self.base_uri % f"Browse.ashx?id={guide_id}",
+            "guide_id": guide_id,
+        }
+        if key is not None:
+            link["key"] = key
+        return link
+
+    def _stations(self, genre, text=""):
+        return [
+            {
+                "element": "outline",
+                "type": "audio",
+                "text": f"Station {genre}.{n} {text}".strip(),
+                "URL": self.base_uri % f"Tune.ashx?id=s{genre}{n:04d}",
+                "guide_id": f"s{genre}{n:04d}",
+                "subtext": "Now playing",
+                "image": f"http://{self.host}/images/s{genre}{n:04d}.png",
+            }
+            for n in range(self.stations)
+        ]
+
+    def _describe(self, station_id):
+        return [
+            {
+                "element": "outline",
+                "text": "Listing",
+                "key": "listing",
+                "children": [
+                    {
+                        "element": "station",
+                        "guide_id": station_id,
+                        "name": f"Station {station_id}",
+                        "logo": f"http://{self.host}/images/{station_id}.png",
+                        "slogan": "Now playing",
+                    }
+                ],
+            }
+        ]
+
+    def _tune(self, station_id):
+        mirrors = [
+            {"element": "audio", "url": f"http://{self.dead_host}/{n}"}
+            for n in range(self.dead_mirrors)
+        ]
+        mirrors.append(
+            {
+                "element": "audio",
+                "url": f"http://{self.host}/stream/{station_id}.pls",
+            }
+        )
+        return mirrors
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each response in one go, not stalled by delayed ACKs.
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def do_GET(self):  # noqa: N802
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlparse(self.path)
+        if fake.fail():
+            status, content_type, body = 503, "text/plain", b"Unavailable"
+        else:
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            status, content_type, body = fake.respond(url.path, query)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
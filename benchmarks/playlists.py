@@ -0,0 +1,185 @@
+"""
+Benchmark playlist parsing against the configparser based parsers it
+replaced.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.playlists --entries 1000 --output results.json
+"""
+
+import argparse
+import configparser
+import json
+import platform
+import re
+import time
+import timeit
+
+import mopidy_tunein
+from mopidy_tunein import tunein
+
+
+def legacy_fix_asf_uri(uri):
+    return re.sub(r"http://(.+\?mswmext=\.asf)", r"mms://\1", uri, flags=re.I)
+
+
+def legacy_pls(data):
+    try:
+        cp = configparser.RawConfigParser(strict=False)
+        cp.read_string(data.decode())
+    except configparser.Error:
+        return
+    for section in cp.sections():
+        if section.lower() != "playlist":
+            continue
+        for i in range(cp.getint(section, "numberofentries")):
+            try:
+                if cp.get(section, f"length{i + 1}", fallback="-1") == "-1":
+                    yield cp.get(section, f"file{i + 1}").strip("\"'")
+            except configparser.NoOptionError:
+                return
+
+
+def legacy_old_asx(data):
+    try:
+        cp = configparser.RawConfigParser()
+        cp.read_string(data.decode())
+    except configparser.Error:
+        return
+    for section in cp.sections():
+        if section.lower() != "reference":
+            continue
+        for option in cp.options(section):
+            if option.lower().startswith("ref"):
+                uri = cp.get(section, option).lower()
+                yield legacy_fix_asf_uri(uri.strip())
+
+
+def legacy_new_asx(data):
+    try:
+        for _event, element in tunein.elementtree.iterparse(
+            tunein.io.BytesIO(data)
+        ):
+            element.tag = element.tag.lower()
+    except tunein.elementtree.ParseError:
+        return
+    for ref in element.findall("entry/ref[@href]"):
+        yield legacy_fix_asf_uri(ref.get("href", "").strip())
+    for entry in element.findall("entry[@href]"):
+        yield legacy_fix_asf_uri(entry.get("href", "").strip())
+
+
+def legacy_xspf(data):
+    try:
+        root = tunein.elementtree.fromstring(data)
+    except tunein.elementtree.ParseError:
+        return
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == "location" and element.text:
+            yield element.text.strip()
+
+
+def playlists(entries):
+    """Return ``{name: (data, parser, legacy_parser)}`` of ``entries``
+    stream URLs each."""
+    uris = [f"http://stream{n}.example.com:8000/live" for n in range(entries)]
+    pls = "".join(
+        f"File{n}={uri}\nTitle{n}=Station\nLength{n}=-1\n"
+        for n, uri in enumerate(uris, 1)
+    )
+    asx = "".join(
+        f'<entry><title>Station</title><ref href="{uri}"/></entry>\n'
+        for uri in uris
+    )
+    xspf = "".join(
+        f"<track><location>{uri}</location></track>\n" for uri in uris
+    )
+    m3u = "".join(f"#EXTINF:-1,Station\n{uri}\n" for uri in uris)
+    return {
+        "pls": (
+            f"[playlist]\nNumberOfEntries={entries}\n{pls}Version=2\n",
+            tunein.parse_pls,
+            legacy_pls,
+        ),
+        "asx_old": (
+            "[Reference]\n"
+            + "".join(f"Ref{n}={uri}\n" for n, uri in enumerate(uris, 1)),
+            tunein.parse_old_asx,
+            legacy_old_asx,
+        ),
+        "asx": (
+            f'<asx version="3.0">\n{asx}</asx>\n',
+            tunein.parse_new_asx,
+            legacy_new_asx,
+        ),
+        "xspf": (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<playlist version="1" xmlns="http://xspf.org/ns/0/">\n'
+            f"<trackList>\n{xspf}</trackList>\n</playlist>\n",
+            tunein.parse_xspf,
+            legacy_xspf,
+        ),
+        "m3u": (f"#EXTM3U\n{m3u}", tunein.parse_m3u, None),
+    }
+
+
+def best(func, data, repeat):
+    """Best time of ``repeat`` runs of ``func`` over ``data``, in seconds."""
+    return min(timeit.repeat(lambda: list(func(data)), number=1, repeat=repeat))
+
+
+def bench_playlist(data, parser, legacy, repeat):
+    result = {
+        "bytes": len(data),
+        "detect": min(
+            timeit.repeat(
+                lambda: tunein.detect_playlist(data), number=1, repeat=repeat
+            )
+        ),
+        "parse": best(parser, data, repeat),
+        "first_uri": min(
+            timeit.repeat(
+                lambda: next(iter(parser(data))), number=1, repeat=repeat
+            )
+        ),
+    }
+    if legacy is not None:
+        result["legacy_parse"] = best(legacy, data, repeat)
+        result["speedup"] = result["legacy_parse"] / result["parse"]
+    return result
+
+
+def bench(entries, repeat):
+    results = {}
+    for name, (text, parser, legacy) in playlists(entries).items():
+        data = text.encode()
+        assert tunein.detect_playlist(data), name
+        results[name] = bench_playlist(data, parser, legacy, repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--entries", type=int, default=1000, help="stream URLs per playlist"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="file to write JSON results to")
+    args = parser.parse_args(argv)
+
+    report = {
+        "version": mopidy_tunein.__version__,
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "options": vars(args),
+        "results": bench(args.entries, args.repeat),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark TuneIn browsing, searching and tuning against a local fake.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.run --latency 0.05 --output results.json
+
+Backend benchmarks need Mopidy with GStreamer, as the backend does, and are
+skipped without it. They run with the extension's default configuration,
+which is what users get, and again with each of ``VARIANTS``.
+"""
+
+import argparse
+import configparser
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent import futures
+
+from mopidy.models import Ref
+
+import mopidy_tunein
+from benchmarks.fake_tunein import FakeTuneIn
+from mopidy_tunein import tunein
+
+# Backend configurations benchmarked besides the defaults.
+VARIANTS = {
+    # Without persistence, rate limiting, prefetching or library workers.
+    "minimal": {
+        "persistent_cache": False,
+        "request_rate": 0,
+        "prefetch_depth": 0,
+        "library_workers": 0,
+    },
+}
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def walk_api(client):
+    """Browse every category, genre and station list through the API."""
+    for category in client.categories():
+        for section in client.categories(category["key"]):
+            if section.get("type", "link") == "link":
+                client.stations(section["guide_id"])
+
+
+def walk_library(library, depth=3):
+    todo = deque([("tunein:root", 1)])
+    while todo:
+        uri, level = todo.popleft()
+        for ref in library.browse(uri):
+            if ref.type == Ref.DIRECTORY and level < depth:
+                todo.append((ref.uri, level + 1))
+
+
+def bench_api(fake, args):
+    client = tunein.TuneIn(args.timeout, session=None)
+    client._base_uri = fake.base_uri
+    before = fake.requests
+    cold = timed(walk_api, client)
+    cold_requests = fake.requests - before
+    warm = timed(walk_api, client)
+    return {
+        "api_browse_cold": {"seconds": cold, "requests": cold_requests},
+        "api_browse_warm": {
+            "seconds": warm,
+            "requests": fake.requests - before - cold_requests,
+        },
+    }
+
+
+def make_backend(fake, args, data_dir, overrides=None):
+    from mopidy_tunein import actor
+
+    extension = mopidy_tunein.Extension()
+    schema = extension.get_config_schema()
+    defaults = extension.get_default_config()
+    parser = configparser.RawConfigParser()
+    parser.read_string(defaults)
+    config = {
+        key: schema[key].deserialize(value)
+        for key, value in parser.items("tunein")
+    }
+    # Only what's needed to use the fake, on top of any variant's changes.
+    config.update(overrides or {}, timeout=args.timeout)
+    backend = actor.TuneInBackend(
+        config={
+            "tunein": config,
+            "proxy": {},
+            "core": {"data_dir": data_dir, "cache_dir": data_dir},
+        },
+        audio=None,
+    )
+    backend.tunein._base_uri = fake.base_uri
+    return backend
+
+
+def bench_backend(fake, args):
+    try:
+        from mopidy_tunein import actor  # noqa: F401
+    except ImportError as e:
+        print(f"Skipping backend benchmarks: {e}", file=sys.stderr)
+        return {}
+
+    results = {"defaults": bench_config(fake, args)}
+    for name, overrides in VARIANTS.items():
+        results[name] = bench_config(fake, args, overrides)
+    return {"backend": results}
+
+
+def bench_config(fake, args, overrides=None):
+    results = {"config": overrides or {}}
+    with tempfile.TemporaryDirectory() as data_dir:
+        backend = make_backend(fake, args, data_dir, overrides)
+        try:
+            library = backend.library
+            results["library_browse_cold"] = {
+                "seconds": timed(walk_library, library)
+            }
+            results["library_browse_warm"] = {
+                "seconds": timed(walk_library, library)
+            }
+
+            queries = [{"any": [f"query {n}"]} for n in range(args.searches)]
+            seconds = timed(lambda: [library.search(q) for q in queries])
+            results["search"] = {
+                "seconds": seconds,
+                "per_second": len(queries) / seconds,
+            }
+
+            # Images for stations never browsed, so each is looked up.
+            uris = [f"tunein:station:s9{n:07d}" for n in range(args.images)]
+            results["get_images_cold"] = {
+                "seconds": timed(library.get_images, uris),
+                "uris": len(uris),
+            }
+            results["get_images_warm"] = {
+                "seconds": timed(library.get_images, uris),
+                "uris": len(uris),
+            }
+
+            results["resolve"] = bench_resolve(backend, fake, args)
+        finally:
+            backend.on_stop()
+    return results
+
+
+def bench_resolve(backend, fake, args):
+    station_ids = fake.station_ids()[: args.clients * args.resolves]
+    chunks = [station_ids[n :: args.clients] for n in range(args.clients)]
+    samples = []
+    lock = threading.Lock()
+
+    def client(ids):
+        for station_id in ids:
+            seconds = timed(backend.playback.resolve, station_id)
+            with lock:
+                samples.append(seconds)
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(client, chunks))
+    result = summarize(samples)
+    result["clients"] = args.clients
+    result["wall_seconds"] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument(
+        "--stations", type=int, default=50, help="stations per genre"
+    )
+    parser.add_argument("--dead-mirrors", type=int, default=1)
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument(
+        "--resolves", type=int, default=5, help="stations per client"
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=5000, help="milliseconds"
+    )
+    parser.add_argument("--output", help="file to write JSON results to")
+    args = parser.parse_args(argv)
+    # Dead mirrors are expected, don't log every attempt to use them.
+    logging.basicConfig(level=logging.ERROR)
+
+    fake = FakeTuneIn(
+        categories=args.categories,
+        sections=args.sections,
+        stations=args.stations,
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        dead_mirrors=args.dead_mirrors,
+    )
+    with fake:
+        results = bench_api(fake, args)
+        results.update(bench_backend(fake, args))
+
+    report = {
+        "version": mopidy_tunein.__version__,
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "options": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,43 @@ class Extension(ext.Extension):
         schema["filter"] = config.String(
             optional=True, choices=("station", "program")
         )
+        schema["cache_max_entries"] = config.Integer(minimum=1)
+        schema["cache_max_bytes"] = config.Integer(minimum=0)
+        schema["resolve_workers"] = config.Integer(minimum=1)
+        schema["stream_cache_size"] = config.Integer(minimum=0)
+        schema["stream_cache_ttl"] = config.Integer(minimum=0)
+        schema["prefetch_depth"] = config.Integer(minimum=0)
+        schema["prefetch_workers"] = config.Integer(minimum=1)
+        schema["lookup_workers"] = config.Integer(minimum=1)
+        schema["station_cache_size"] = config.Integer(minimum=1)
+        schema["playlist_max_size"] = config.Integer(minimum=1)
+        schema["library_workers"] = config.Integer(minimum=0)
+        schema["persistent_cache"] = config.Boolean()
+        schema["persistent_cache_max_age"] = config.Integer(minimum=0)
+        schema["cache_backend"] = config.String(choices=("memory", "shared"))
+        schema["cache_shared_path"] = config.Path(optional=True)
+        schema["circuit_breaker_threshold"] = config.Integer(minimum=0)
+        schema["circuit_breaker_max_backoff"] = config.Integer(minimum=1)
+        schema["crawl_depth"] = config.Integer(minimum=0)
+        schema["crawl_rate"] = config.Integer(minimum=1)
+        schema["crawl_interval"] = config.Integer(minimum=60)
+        schema["request_rate"] = config.Integer(minimum=0)
+        schema["request_burst"] = config.Integer(minimum=0)
+        schema["connection_pool_size"] = config.Integer(minimum=1)
+        schema["adaptive_timeouts"] = config.Boolean()
+        schema["timeout_floor"] = config.Integer(minimum=0)
+        schema["mirror_penalty"] = config.Integer(minimum=0)
+        schema["mirror_verify_interval"] = config.Integer(minimum=0)
+        schema["stream_fast_path"] = config.Boolean()
+        schema["metrics_file"] = config.Path(optional=True)
+        schema["metrics_interval"] = config.Integer(minimum=1)
         return schema
 
+    def get_command(self):
+        from .commands import TuneInCommand
+
+        return TuneInCommand()
+
     def setup(self, registry):
         from .actor import TuneInBackend
 
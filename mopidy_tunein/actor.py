@@ -1,39 +1,102 @@
 import logging
-import time
+from concurrent import futures
 
 import pykka
 import requests
-from mopidy import backend, exceptions, httpclient
-from mopidy.audio import scan
-from mopidy.internal import http, playlists
-from mopidy.models import Ref, SearchResult
-
-from mopidy_tunein import Extension, translator, tunein
+from mopidy import backend, core, httpclient
+from mopidy.audio import AudioListener, PlaybackState, scan
+
+from mopidy_tunein import (
+    Extension,
+    crawler,
+    dispatch,
+    health,
+    latency,
+    library,
+    metrics,
+    persist,
+    playback,
+    resolver,
+    scheduler,
+    tunein,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def get_requests_session(proxy_config):
+def get_requests_session(
+    proxy_config, request_scheduler, pool_size=10, timeouts=None
+):
     user_agent = f"{Extension.dist_name}/{Extension.version}"
     proxy = httpclient.format_proxy(proxy_config)
     full_user_agent = httpclient.format_user_agent(user_agent)
 
-    session = requests.Session()
+    session = scheduler.ScheduledSession(
+        request_scheduler, pool_size=pool_size, timeouts=timeouts
+    )
     session.proxies.update({"http": proxy, "https": proxy})
-    session.headers.update({"user-agent": full_user_agent})
+    session.headers.update(
+        {
+            "user-agent": full_user_agent,
+            # Compressed responses save bandwidth on large listings.
+            "accept-encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
+        }
+    )
 
     return session
 
 
-class TuneInBackend(pykka.ThreadingActor, backend.Backend):
+class TuneInBackend(
+    dispatch.OffloadingActor,
+    backend.Backend,
+    AudioListener,
+    core.CoreListener,
+):
     uri_schemes = ["tunein"]
 
+    # Playback calls stay on the actor thread so they keep their order.
+    offloaded_calls = frozenset(
+        ("library", method)
+        for method in ("browse", "get_images", "lookup", "refresh", "search")
+    )
+
     def __init__(self, config, audio):
         super().__init__()
 
-        self._session = get_requests_session(config["proxy"])
+        self._scheduler = scheduler.Scheduler(
+            rate=config["tunein"]["request_rate"],
+            burst=config["tunein"]["request_burst"],
+        )
+        self._timeouts = None
+        if config["tunein"]["adaptive_timeouts"]:
+            self._timeouts = latency.AdaptiveTimeouts(
+                floor=config["tunein"]["timeout_floor"] / 1000.0
+            )
+        self._session = get_requests_session(
+            config["proxy"],
+            self._scheduler,
+            pool_size=config["tunein"]["connection_pool_size"],
+            timeouts=self._timeouts,
+        )
         self._timeout = config["tunein"]["timeout"]
         self._filter = config["tunein"]["filter"]
+        self._stream_cache_size = config["tunein"]["stream_cache_size"]
+        self._stream_cache_ttl = config["tunein"]["stream_cache_ttl"]
+        self._stream_fast_path = config["tunein"]["stream_fast_path"]
+
+        cache_backend = None
+        if config["tunein"]["cache_backend"] == "shared":
+            cache_backend = persist.SharedCache(
+                config["tunein"]["cache_shared_path"]
+                or Extension.get_cache_dir(config) / "shared.sqlite3",
+                max_age=config["tunein"]["persistent_cache_max_age"],
+                lock_timeout=self._timeout / 1000.0,
+            )
+        elif config["tunein"]["persistent_cache"]:
+            cache_backend = persist.Snapshot(
+                Extension.get_data_dir(config) / "cache.sqlite3",
+                max_age=config["tunein"]["persistent_cache_max_age"],
+            )
 
         self._scanner = scan.Scanner(
             timeout=config["tunein"]["timeout"], proxy_config=config["proxy"]
@@ -42,222 +105,158 @@ class TuneInBackend(pykka.ThreadingActor, backend.Backend):
             config["tunein"]["timeout"],
             config["tunein"]["filter"],
             self._session,
+            cache_options={
+                "max_entries": config["tunein"]["cache_max_entries"],
+                "max_bytes": config["tunein"]["cache_max_bytes"],
+            },
+            max_stations=config["tunein"]["station_cache_size"],
+            max_playlist_size=config["tunein"]["playlist_max_size"] * 1024,
+            cache_backend=cache_backend,
+            breaker_options={
+                "threshold": config["tunein"]["circuit_breaker_threshold"],
+                "max_backoff": config["tunein"]["circuit_breaker_max_backoff"],
+            },
+            registry=metrics.REGISTRY,
         )
-        self.library = TuneInLibrary(self)
-        self.playback = TuneInPlayback(audio=audio, backend=self)
-
-
-class TuneInLibrary(backend.LibraryProvider):
-    root_directory = Ref.directory(uri="tunein:root", name="TuneIn")
-
-    def __init__(self, backend):
-        super().__init__(backend)
-
-    def browse(self, uri):
-        result = []
-        variant, identifier = translator.parse_uri(uri)
-        logger.debug(f"Browsing {uri!r}")
-        if variant == "root":
-            for category in self.backend.tunein.categories():
-                result.append(translator.category_to_ref(category))
-        elif variant == "category" and identifier:
-            for section in self.backend.tunein.categories(identifier):
-                result.append(translator.section_to_ref(section, identifier))
-        elif variant == "location" and identifier:
-            for location in self.backend.tunein.locations(identifier):
-                result.append(translator.section_to_ref(location, "local"))
-            for station in self.backend.tunein.stations(identifier):
-                result.append(translator.station_to_ref(station))
-        elif variant == "section" and identifier:
-            if self.backend.tunein.related(identifier):
-                result.append(
-                    Ref.directory(
-                        uri=f"tunein:related:{identifier}", name="Related"
-                    )
-                )
-            if self.backend.tunein.shows(identifier):
-                result.append(
-                    Ref.directory(
-                        uri=f"tunein:shows:{identifier}", name="Shows"
-                    )
-                )
-            for station in self.backend.tunein.featured(identifier):
-                result.append(translator.section_to_ref(station))
-            for station in self.backend.tunein.local(identifier):
-                result.append(translator.station_to_ref(station))
-            for station in self.backend.tunein.stations(identifier):
-                result.append(translator.station_to_ref(station))
-        elif variant == "related" and identifier:
-            for section in self.backend.tunein.related(identifier):
-                result.append(translator.section_to_ref(section))
-        elif variant == "shows" and identifier:
-            for show in self.backend.tunein.shows(identifier):
-                result.append(translator.show_to_ref(show))
-        elif variant == "episodes" and identifier:
-            for episode in self.backend.tunein.episodes(identifier):
-                result.append(translator.station_to_ref(episode))
-        else:
-            logger.debug(f"Unknown URI: {uri!r}")
-
-        return result
-
-    def refresh(self, uri=None):
-        self.backend.tunein.reload()
-
-    def lookup(self, uri):
-        variant, identifier = translator.parse_uri(uri)
-        if variant != "station":
-            return []
-        station = self.backend.tunein.station(identifier)
-        if not station:
-            return []
-
-        track = translator.station_to_track(station)
-        return [track]
-
-    def get_images(self, uris):
-        results = {}
-        for uri in uris:
-            variant, identifier = translator.parse_uri(uri)
-            if variant != "station":
-                continue
-            station = self.backend.tunein.station(identifier)
-            image = translator.station_to_image(station)
-            if image is not None:
-                results[uri] = [image]
-        return results
-
-    def search(self, query=None, uris=None, exact=False):
-        if query is None or not query:
-            return
-        tunein_query = translator.mopidy_to_tunein_query(query)
-        tracks = []
-        for station in self.backend.tunein.search(tunein_query):
-            track = translator.station_to_track(station)
-            tracks.append(track)
-        return SearchResult(uri="tunein:search", tracks=tracks)
-
-
-class TuneInPlayback(backend.PlaybackProvider):
-    def __init__(self, audio, backend):
-        super().__init__(audio, backend)
-        self._stream_info = None
-
-    def translate_uri(self, uri):
-        variant, identifier = translator.parse_uri(uri)
-        station = self.backend.tunein.station(identifier)
-        if not station:
-            return None
-        stream_uris = self.backend.tunein.tune(station)
-        while stream_uris:
-            uri = stream_uris.pop(0)
-            logger.debug(f"Looking up URI: {uri!r}")
-            new_uri = self.unwrap_stream(uri)
-            if new_uri:
-                return new_uri
-            else:
-                logger.debug("Mopidy translate_uri failed.")
-                new_uris = self.backend.tunein.parse_stream_url(uri)
-                if new_uris == [uri]:
-                    logger.debug(f"Last attempt, play stream anyway: {uri!r}")
-                    return uri
-                stream_uris.extend(new_uris)
-        logger.debug("TuneIn lookup failed.")
-        return None
-
-    def unwrap_stream(self, uri):
-        unwrapped_uri, self._stream_info = _unwrap_stream(
-            uri,
-            timeout=self.backend._timeout,
-            scanner=self.backend._scanner,
-            requests_session=self.backend._session,
+        self._health = health.MirrorHealth(
+            penalty=config["tunein"]["mirror_penalty"]
         )
-        return unwrapped_uri
-
-    def is_live(self, uri):
-        return (
-            self._stream_info is not None
-            and self._stream_info.uri == uri
-            and self._stream_info.playable
-            and not self._stream_info.seekable
+        self._resolver = None
+        if config["tunein"]["resolve_workers"] > 1:
+            self._resolver = futures.ThreadPoolExecutor(
+                max_workers=config["tunein"]["resolve_workers"],
+                thread_name_prefix="TuneInResolver",
+            )
+        self._fetcher = futures.ThreadPoolExecutor(
+            max_workers=config["tunein"]["lookup_workers"],
+            thread_name_prefix="TuneInLookup",
         )
-
-
-# Shamelessly taken from mopidy.stream.actor
-def _unwrap_stream(uri, timeout, scanner, requests_session):
-    """
-    Get a stream URI from a playlist URI, ``uri``.
-
-    Unwraps nested playlists until something that's not a playlist is found or
-    the ``timeout`` is reached.
-    """
-
-    original_uri = uri
-    seen_uris = set()
-    deadline = time.time() + timeout
-
-    while time.time() < deadline:
-        if uri in seen_uris:
-            logger.info(
-                f"Unwrapping stream from URI ({uri!r}) failed: "
-                "playlist referenced itself",
+        self.library = library.TuneInLibrary(self)
+        self.playback = playback.TuneInPlayback(audio=audio, backend=self)
+        self._prefetcher = None
+        if config["tunein"]["prefetch_depth"]:
+            self._prefetcher = resolver.Prefetcher(
+                self._scheduler.bind(
+                    self.playback.resolve, scheduler.BACKGROUND
+                ),
+                self._upcoming_stations,
+                depth=config["tunein"]["prefetch_depth"],
+                workers=config["tunein"]["prefetch_workers"],
+            )
+        if config["tunein"]["library_workers"]:
+            self.start_offloading(config["tunein"]["library_workers"])
+        self._crawler = None
+        if config["tunein"]["crawl_depth"]:
+            self._crawler = crawler.Crawler(
+                self._scheduler.bind(self.library.browse, scheduler.BACKGROUND),
+                config["tunein"]["crawl_depth"],
+                rate=config["tunein"]["crawl_rate"],
+                interval=config["tunein"]["crawl_interval"],
+                busy=self.tunein.busy,
+                requests=self.tunein.upstream_requests,
+            )
+        metrics.REGISTRY.collector(self._collect_metrics)
+        self._exporter = None
+        if config["tunein"]["metrics_file"]:
+            self._exporter = metrics.Exporter(
+                metrics.REGISTRY,
+                config["tunein"]["metrics_file"],
+                interval=config["tunein"]["metrics_interval"],
+            )
+        self._verifier = None
+        if config["tunein"]["mirror_verify_interval"]:
+            self._verifier = health.MirrorVerifier(
+                self._health,
+                self._scheduler.bind(
+                    self.playback.verify, scheduler.BACKGROUND
+                ),
+                interval=config["tunein"]["mirror_verify_interval"],
             )
-            return None, None
-        else:
-            seen_uris.add(uri)
-
-        logger.debug(f"Unwrapping stream from URI: {uri!r}")
 
-        try:
-            scan_timeout = deadline - time.time()
-            if scan_timeout < 0:
-                logger.info(
-                    f"Unwrapping stream from URI ({uri!r}) failed: "
-                    f"timed out in {timeout}ms",
+    def on_start(self):
+        if self._crawler is not None:
+            self._crawler.start()
+        if self._verifier is not None:
+            self._verifier.start()
+        if self._exporter is not None:
+            self._exporter.start()
+
+    def on_stop(self):
+        if self._crawler is not None:
+            self._crawler.stop()
+        if self._verifier is not None:
+            self._verifier.stop()
+        if self._exporter is not None:
+            self._exporter.stop()
+        self.stop_offloading()
+        self._fetcher.shutdown(wait=False)
+        if self._resolver is not None:
+            self._resolver.shutdown(wait=False)
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+        self.tunein.close()
+
+    def _collect_metrics(self):
+        with self.playback._lock:
+            probes = dict(self.playback.probes)
+            exhausted = dict(self.playback.budget_exhausted)
+        families = [
+            metrics.Family(
+                "tunein_stream_probes_total",
+                metrics.COUNTER,
+                "Stream URLs identified, by how.",
+                [({"path": k}, v) for k, v in probes.items()],
+            ),
+            metrics.Family(
+                "tunein_resolve_budget_exhausted_total",
+                metrics.COUNTER,
+                "Stations not resolved in time, by the step running out.",
+                [({"phase": k}, v) for k, v in exhausted.items()],
+            ),
+        ]
+        priorities = self._scheduler.stats()
+        for key, name, help_ in (
+            ("requests", "requests_total", "Requests made, by priority."),
+            ("wait_time", "wait_seconds_total", "Time spent rate limited."),
+        ):
+            families.append(
+                metrics.Family(
+                    f"tunein_scheduler_{name}",
+                    metrics.COUNTER,
+                    help_,
+                    [
+                        ({"priority": priority}, priorities[priority][key])
+                        for priority in scheduler.PRIORITY_NAMES.values()
+                    ],
                 )
-                return None, None
-            scan_result = scanner.scan(uri, timeout=scan_timeout)
-        except exceptions.ScannerError as exc:
-            logger.debug(f"GStreamer failed scanning URI ({uri!r}): {exc}")
-            scan_result = None
+            )
+        return families
 
-        if scan_result is not None:
-            if scan_result.playable or (
-                not scan_result.mime.startswith("text/")
-                and not scan_result.mime.startswith("application/")
-            ):
-                logger.debug(
-                    f"Unwrapped potential {scan_result.mime} stream: {uri!r}"
-                )
-                return uri, scan_result
+    def track_playback_started(self, tl_track):
+        if self._prefetcher is not None:
+            self._prefetcher.played(tl_track.tlid)
 
-        download_timeout = deadline - time.time()
-        if download_timeout < 0:
-            logger.info(
-                f"Unwrapping stream from URI ({uri!r}) failed: timed out in {timeout}ms"
-            )
-            return None, None
-        content = http.download(
-            requests_session, uri, timeout=download_timeout / 1000
+    def tracklist_changed(self):
+        if self._prefetcher is not None:
+            self._prefetcher.changed()
+
+    def _upcoming_stations(self, tlid, count):
+        # Runs on a prefetch worker: waiting for core on the actor thread
+        # could deadlock with core waiting for the backend.
+        actors = pykka.ActorRegistry.get_by_class(core.Core)
+        if not actors:
+            return []
+        return playback.upcoming_stations(
+            actors[0].proxy().tracklist, tlid, count
         )
 
-        if content is None:
-            logger.info(
-                f"Unwrapping stream from URI ({original_uri!r}) failed: "
-                f"error downloading URI {uri!r}",
-            )
-            return None, None
+    def stream_changed(self, uri):
+        self.playback._streams.started(uri)
 
-        uris = playlists.parse(content)
-        if not uris:
-            logger.debug(
-                f"Failed parsing URI ({uri!r}) as playlist; "
-                "found potential stream.",
-            )
-            return uri, None
+    def state_changed(self, old_state, new_state, target_state):
+        # Audio stops on a stream error without reaching the end.
+        if new_state == PlaybackState.STOPPED and target_state is None:
+            self.playback._streams.stopped()
 
-        # TODO Test streams and return first that seems to be playable
-        logger.debug(
-            f"Parsed playlist ({uri!r}) and found new URI: {uris[0]!r}"
-        )
-        uri = uris[0]
+    def reached_end_of_stream(self):
+        self.playback._streams.ended()
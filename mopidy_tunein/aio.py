@@ -0,0 +1,444 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from mopidy import httpclient
+
+from mopidy_tunein import Extension, tunein
+from mopidy_tunein.cache import AsyncSingleFlight
+from mopidy_tunein.resolver import Deadline
+
+try:
+    import aiohttp
+except ImportError:  # Only needed without a session of your own
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+if aiohttp is not None:
+    CONNECTION_ERRORS = (OSError, aiohttp.ClientConnectionError)
+else:
+    CONNECTION_ERRORS = (OSError,)
+
+
+class async_cache:  # noqa N801
+    """Cache a coroutine method like ``shared``, the ``cache`` of the
+    :class:`~mopidy_tunein.tunein.TuneIn` method of the same name, and in
+    the same stores as the client the async one wraps."""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.name = shared.name
+        self.ctl = shared.ctl
+        self.ttl = shared.ttl
+        self.conditional = shared.conditional
+
+    def __call__(self, func):
+        self.func = func
+        return self
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return _AsyncCachedMethod(self, obj)
+
+    def store(self, obj):
+        return self.shared.store(obj._client)
+
+    def backend(self, obj):
+        return self.shared.backend(obj._client)
+
+    def flight(self, obj):
+        flights = obj.__dict__.setdefault("_flights", {})
+        try:
+            return flights[self.name]
+        except KeyError:
+            return flights.setdefault(self.name, AsyncSingleFlight())
+
+
+class _AsyncCachedMethod(tunein._CachedMethod):
+    # The backend's lock isn't taken, as waiting for it would block the
+    # event loop, so other processes' requests for a key aren't waited for.
+    __slots__ = ()
+
+    async def __call__(self, *args, **kwargs):
+        try:
+            hash(args)
+        except TypeError:
+            return (await self._invoke(args, kwargs))[0]
+
+        self._obj._dependencies.used((self._cache.name, args))
+        store = self._cache.store(self._obj)
+        entry = store.lookup(args)
+        if entry is not None and not (
+            self._cache.ctl and entry.uses > self._cache.ctl
+        ):
+            return entry.value
+        if entry is None:
+            value = await self._restore(store, args)
+            if value is not None:
+                return value
+
+        flight = self._cache.flight(self._obj)
+        return await flight.do(
+            args, self._fetch, store, args, kwargs, entry is None
+        )
+
+    async def _fetch(self, store, args, kwargs, missing):
+        if missing:
+            entry = store.lookup(args, count=False)
+            if entry is not None:
+                return entry.value
+        backend = self._cache.backend(self._obj)
+        saved = None
+        if backend is not None and missing:
+            saved = await _run(backend.get, self._cache.name, args)
+            if saved is not None and self._fresh(saved[1]):
+                store.set(args, saved[0], stored=saved[1])
+                return saved[0]
+        value = await self._call(store, args, kwargs)
+        if value and backend is not None:
+            await _run(backend.put, self._cache.name, args, value, time.time())
+        return value or self._stale(store, args, saved) or value
+
+    async def _call(self, store, args, kwargs):
+        previous = store.lookup(args, count=False, stale=True)
+        value, validators = await self._invoke(args, kwargs, previous)
+        if value is tunein.NOT_MODIFIED:
+            if store.refresh(args) is None:
+                store.set(args, previous.value, validators=previous.validators)
+            return previous.value
+        if value:
+            store.set(args, value, validators=validators)
+        return value
+
+    async def _invoke(self, args, kwargs, previous=None):
+        if not self._cache.conditional:
+            return await self._cache.func(self._obj, *args, **kwargs), None
+        validators = previous.validators if previous is not None else None
+        return await self._cache.func(
+            self._obj, *args, validators=validators, **kwargs
+        )
+
+    async def _restore(self, store, args):
+        backend = self._cache.backend(self._obj)
+        if backend is None:
+            return None
+        saved = await _run(backend.get, self._cache.name, args)
+        if saved is None:
+            return None
+        value, stored = saved
+        if self._fresh(stored):
+            store.set(args, value, stored=stored)
+        else:
+            logger.debug(f"Revalidating stale {self._cache.name}{args}")
+            flight = self._cache.flight(self._obj)
+            self._obj._background(
+                flight.do(args, self._fetch, store, args, {}, True)
+            )
+        return value
+
+
+class AsyncTuneIn:
+    """
+    asyncio counterpart of :class:`~mopidy_tunein.tunein.TuneIn`, with the
+    same methods as coroutines.
+
+    Responses are kept in the caches of ``client``, a
+    :class:`~mopidy_tunein.tunein.TuneIn`, so each client answers from the
+    other's requests. Its station store, circuit breakers, statistics and
+    learned timeouts are shared too, and it shapes the results. Requests go
+    through ``session``, an :class:`aiohttp.ClientSession`, by default one
+    keeping up to ``connections`` connections alive, ``connections_per_host``
+    of them to each host. Use each instance from one event loop.
+    """
+
+    def __init__(
+        self, client, session=None, connections=100, connections_per_host=10
+    ):
+        if session is None and aiohttp is None:
+            raise ImportError("AsyncTuneIn needs aiohttp or a session")
+        self._client = client
+        self._session = session
+        self._owns_session = session is None
+        self._connections = connections
+        self._connections_per_host = connections_per_host
+        self._tasks = set()
+
+    @property
+    def _dependencies(self):
+        return self._client._dependencies
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Stop background requests and close the session if it was made
+        here. The client is left open."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def reload(self):
+        self._client.reload()
+
+    def busy(self):
+        """Whether any request to TuneIn is in progress."""
+        return self._client.busy() or any(
+            method.stats()["in_flight"]
+            for method in (self._tunein, self._get_playlist)
+        )
+
+    def upstream_requests(self):
+        """Number of cache misses that have gone to TuneIn so far, from
+        either client."""
+        return self._client.upstream_requests() + sum(
+            method.stats()["upstream_calls"]
+            for method in (self._tunein, self._get_playlist)
+        )
+
+    def invalidate(self, uri):
+        return self._client.invalidate(uri)
+
+    def cache_stats(self):
+        stats = self._client.cache_stats()
+        stats["async"] = {
+            "api": self._tunein.stats(),
+            "playlist": self._get_playlist.stats(),
+        }
+        return stats
+
+    async def categories(self, category=""):
+        args = self._client._category_args(category)
+        if args is None:
+            return []
+        return self._client._category_results(
+            category, await self._tunein("Browse.ashx", args)
+        )
+
+    async def locations(self, location):
+        args = "&id=" + location
+        return self._client._location_results(
+            await self._tunein("Browse.ashx", args)
+        )
+
+    async def _browse(self, section_name, guide_id):
+        args = "&id=" + guide_id
+        results = await self._tunein("Browse.ashx", args)
+        return self._client._filter_results(results, section_name)
+
+    async def featured(self, guide_id):
+        return await self._browse("Featured", guide_id)
+
+    async def local(self, guide_id):
+        return await self._browse("Local", guide_id)
+
+    async def stations(self, guide_id):
+        return await self._browse("Station", guide_id)
+
+    async def related(self, guide_id):
+        return await self._browse("Related", guide_id)
+
+    async def shows(self, guide_id):
+        return await self._browse("Show", guide_id)
+
+    async def episodes(self, guide_id):
+        args = f"&c=pbrowse&id={guide_id}"
+        results = await self._tunein("Tune.ashx", args)
+        return self._client._filter_results(results, "Topic")
+
+    async def _station_info(self, station_id):
+        logger.debug(f"Fetching info for station {station_id}")
+        args = f"&c=composite&detail=listing&id={station_id}"
+        return self._client._listing_result(
+            await self._tunein("Describe.ashx", args)
+        )
+
+    async def parse_stream_url(self, url, deadline=None):
+        if self._client._is_audio_url(url):
+            return [url]
+        return (await self.classify(url, deadline=deadline))[1]
+
+    async def classify(self, url, deadline=None):
+        """Work out what ``url`` is, as :meth:`TuneIn.classify` does."""
+        logger.debug(f"Extracting URIs from {url!r}")
+        if deadline is None:
+            deadline = Deadline(self._client._timeout)
+        with deadline.phase("download"):
+            playlist = await self._get_playlist(url, deadline=deadline)
+        return self._client._playlist_result(url, playlist, deadline)
+
+    async def tune(self, station, deadline=None):
+        logger.debug(f'Tuning station id {station["guide_id"]}')
+        args = f'&id={station["guide_id"]}'
+        streams = await self._tunein("Tune.ashx", args, deadline=deadline)
+        return self._client._tune_results(station, streams)
+
+    async def station(self, station_id):
+        stations = self._client._stations
+        station = stations.get(station_id)
+        if station is None and not stations.is_unknown(station_id):
+            station = self._client._station_result(
+                station_id, await self._station_info(station_id)
+            )
+        return station
+
+    async def station_batch(self, station_ids, timeout=None):
+        """
+        Get many stations at once, returning a ``{station_id: station}`` dict.
+
+        Stations not seen before are fetched concurrently. Those still
+        outstanding after ``timeout`` seconds, by default the request
+        timeout, are left out of the results.
+        """
+        results = {}
+        pending = {}
+        for station_id in OrderedDict.fromkeys(station_ids):
+            station = self._client._stations.get(station_id)
+            if station is not None:
+                results[station_id] = station
+            else:
+                task = asyncio.ensure_future(self.station(station_id))
+                pending[task] = station_id
+        if not pending:
+            return results
+
+        if timeout is None:
+            timeout = self._client._timeout
+        done, not_done = await asyncio.wait(pending, timeout=timeout)
+        return self._client._batch_results(results, pending, done, not_done)
+
+    async def search(self, query):
+        args = self._client._search_args(query)
+        if args is None:
+            return []
+        return self._client._search_results(
+            await self._tunein("Search.ashx", args)
+        )
+
+    def _background(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _get(self, uri, validators):
+        if self._session is None:
+            user_agent = f"{Extension.dist_name}/{Extension.version}"
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self._connections,
+                    limit_per_host=self._connections_per_host,
+                ),
+                headers={
+                    "User-Agent": httpclient.format_user_agent(user_agent)
+                },
+                trust_env=True,
+            )
+        return self._session.get(
+            uri, headers=tunein.conditional_headers(validators)
+        )
+
+    async def _request(self, uri, timeout, fetch):
+        # Bound the whole of ``fetch`` by the request timeout, shortened to
+        # what the host usually needs like the sync client's session does.
+        timeouts = getattr(self._client._session, "timeouts", None)
+        if timeouts is None:
+            return await asyncio.wait_for(fetch, timeout)
+        timeout = timeouts.timeout("http", uri, timeout)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fetch, timeout)
+        except asyncio.TimeoutError:
+            timeouts.failed("http", uri, time.monotonic() - start)
+            raise
+        except CONNECTION_ERRORS:
+            timeouts.failed("http", uri)
+            raise
+        except Exception:
+            # The host still answered, if not with what was wanted.
+            timeouts.observe("http", uri, time.monotonic() - start)
+            raise
+        timeouts.observe("http", uri, time.monotonic() - start)
+        return result
+
+    @async_cache(tunein.TuneIn._tunein)
+    async def _tunein(self, variant, args, deadline=None, validators=None):
+        client = self._client
+        uri = client._api_uri(variant, args)
+        timeout, breaker = client._api_attempt(variant, deadline)
+        if not timeout:
+            return tunein.FAILED, None
+
+        async def fetch():
+            async with self._get(uri, validators) as r:
+                r.raise_for_status()
+                if r.status == 304:
+                    client._transfer.not_modified(validators)
+                    return tunein.NOT_MODIFIED, validators
+                content = await r.read()
+                body = json.loads(content)["body"]
+                client._transfer.received(r, len(content))
+                return body, tunein.response_validators(r, len(content))
+
+        start = time.monotonic()
+        try:
+            body, validators = await self._request(uri, timeout, fetch())
+        except Exception as e:
+            return client._api_failed(variant, breaker, start, e)
+        return client._api_succeeded(variant, breaker, start, body, validators)
+
+    @async_cache(tunein.TuneIn._get_playlist)
+    async def _get_playlist(self, uri, deadline=None, validators=None):
+        client = self._client
+        timeout = client._request_timeout(deadline)
+        if not timeout:
+            logger.info(f"TuneIn playlist request for {uri} ran out of time")
+            return None, None
+
+        async def fetch():
+            # Defer downloading the body until know it's not a stream
+            async with self._get(uri, validators) as r:
+                r.raise_for_status()
+                if r.status == 304:
+                    client._transfer.not_modified(validators)
+                    return tunein.NOT_MODIFIED, validators
+                content_type = r.headers.get("content-type", "audio/mpeg")
+                if tunein._is_stream_response(uri, content_type, r.headers):
+                    return (None, content_type), None
+                reader = tunein.PlaylistReader(
+                    uri, client._max_playlist_size, deadline
+                )
+                async for chunk in r.content.iter_chunked(reader.CHUNK):
+                    if not reader.add(chunk):
+                        break
+                if reader.timed_out:
+                    # Half a playlist is no answer, so don't cache it.
+                    return None, None
+                data = reader.data()
+                if data is None:
+                    return (None, content_type), validators
+                client._transfer.received(r, len(data))
+                return (data, content_type), tunein.response_validators(
+                    r, len(data)
+                )
+
+        try:
+            return await self._request(uri, timeout, fetch())
+        except Exception as e:
+            # Don't cache the failure
+            logger.info(f"TuneIn playlist request for {uri} failed: {e}")
+            return None, None
+
+
+async def _run(func, *args):
+    # Cache backends may touch the disk, so keep them off the event loop.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stop calling an endpoint that keeps failing.
+
+    After ``threshold`` consecutive failures the circuit opens and
+    :meth:`allow` refuses calls straight away. Once ``backoff`` seconds
+    have passed a single probe call is allowed through: if it succeeds the
+    circuit closes, otherwise it stays open for twice as long, up to
+    ``max_backoff`` seconds. A ``threshold`` of 0 never opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, threshold=3, backoff=5.0, max_backoff=300.0):
+        self.name = name
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._delay = backoff
+        self._retry_at = 0.0
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._retry_at:
+                logger.debug(f"Probing {self.name}")
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def succeeded(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.name} is working again")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._delay = self.backoff
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._delay = min(self._delay * 2, self.max_backoff)
+            elif not self.threshold or self.failures < self.threshold:
+                return
+            self.state = self.OPEN
+            self._retry_at = time.monotonic() + self._delay
+            logger.info(
+                f"{self.name} failed {self.failures} times, "
+                f"pausing requests for {self._delay:.0f}s"
+            )
+
+    def cancelled(self):
+        """The call allowed through was never made, so the next one may
+        probe instead."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._retry_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "retry_in": (
+                    max(0.0, self._retry_at - time.monotonic())
+                    if self.state != self.CLOSED
+                    else 0.0
+                ),
+            }
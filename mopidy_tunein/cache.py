@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def approx_size(value):
+    """Rough estimate of the memory held by a decoded API response."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k) + approx_size(v)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approx_size(item)
+    return size
+
+
+class CacheEntry:
+    __slots__ = ("value", "stored", "size", "uses", "validators")
+
+    def __init__(self, value, stored, size, validators=None):
+        self.value = value
+        self.stored = stored
+        self.size = size
+        self.uses = 0
+        self.validators = validators
+
+    @property
+    def age(self):
+        return time.time() - self.stored
+
+
+class LRUCache:
+    """Thread-safe key/value store bounded by entry count and approximate
+    size in bytes.
+
+    Least recently used entries are evicted first. Entries older than ``ttl``
+    seconds are treated as misses, but kept for another ``grace`` seconds
+    in case a stale value is better than none. They are removed
+    periodically by a background sweeper thread, started on the first
+    insert.
+    """
+
+    def __init__(
+        self, max_entries=1000, max_bytes=0, ttl=3600, sweep=60, grace=0
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.grace = grace
+        self._sweep_interval = sweep
+        self._sweeper = None
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.lookup(key, count=False) is not None
+
+    def lookup(self, key, count=True, stale=False):
+        """Return the live :class:`CacheEntry` for ``key`` or :class:`None`.
+
+        With ``stale``, an expired entry still within its grace period is
+        returned too.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.age > self.ttl:
+                if entry.age > self.ttl + self.grace:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+                elif stale:
+                    self.stale_hits += 1
+                    return entry
+                else:
+                    entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                entry.uses += 1
+                self.hits += 1
+            return entry
+
+    def get(self, key, default=None):
+        entry = self.lookup(key)
+        return default if entry is None else entry.value
+
+    def set(self, key, value, stored=None, validators=None):
+        entry = CacheEntry(
+            value,
+            time.time() if stored is None else stored,
+            approx_size(value),
+            validators,
+        )
+        if self.max_bytes and entry.size > self.max_bytes:
+            logger.debug(f"Not caching {key!r}: {entry.size} bytes too large")
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        self._start_sweeper()
+
+    def refresh(self, key):
+        """Mark the entry for ``key``, even if expired, as fetched now."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.stored = time.time()
+                self._entries.move_to_end(key)
+            return entry
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+        return default if entry is None else entry.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def sweep(self):
+        """Drop every expired entry, returning how many were removed."""
+        with self._lock:
+            expired = [
+                k
+                for k, e in self._entries.items()
+                if e.age > self.ttl + self.grace
+            ]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def usage(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return 0 if entry is None else entry.uses
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_hits": self.stale_hits,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _start_sweeper(self):
+        if self._sweeper is not None or not self._sweep_interval:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(
+                    target=_sweep_loop,
+                    args=(weakref.ref(self), self._sweep_interval),
+                    name="TuneInCacheSweeper",
+                    daemon=True,
+                )
+                self._sweeper.start()
+
+
+def _sweep_loop(cache_ref, interval):
+    # Only hold a weak reference between runs so an unused cache can be freed.
+    while True:
+        time.sleep(interval)
+        cache = cache_ref()
+        if cache is None:
+            return
+        removed = cache.sweep()
+        if removed:
+            logger.debug(f"Swept {removed} expired TuneIn cache entries")
+        del cache
+
+
+class DependencyMap:
+    """Remember the cache keys each browsed URI was built from.
+
+    Keys used while :meth:`recording` a URI are kept with it, along with
+    the child URIs the caller adds, so the whole subtree below a URI can be
+    invalidated later. Only the ``max_entries`` most recently recorded URIs
+    are kept.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._uris = OrderedDict()
+        self._local = threading.local()
+
+    def __contains__(self, uri):
+        return uri in self._uris
+
+    def __len__(self):
+        return len(self._uris)
+
+    @contextmanager
+    def recording(self, uri):
+        """Record keys used by this thread, yielding a set for child URIs."""
+        keys, children = set(), set()
+        outer = getattr(self._local, "keys", None)
+        self._local.keys = keys
+        try:
+            yield children
+        finally:
+            self._local.keys = outer
+        if outer is not None:
+            outer.update(keys)
+        with self._lock:
+            self._uris.pop(uri, None)
+            self._uris[uri] = (keys, children)
+            while len(self._uris) > self.max_entries:
+                self._uris.popitem(last=False)
+
+    def used(self, key):
+        keys = getattr(self._local, "keys", None)
+        if keys is not None:
+            keys.add(key)
+
+    def pop_subtree(self, uri):
+        """Forget ``uri`` and everything below it, returning their keys.
+
+        Returns :class:`None` if ``uri`` hasn't been recorded.
+        """
+        with self._lock:
+            if uri not in self._uris:
+                return None
+            keys = set()
+            todo = [uri]
+            while todo:
+                recorded = self._uris.pop(todo.pop(), None)
+                if recorded is not None:
+                    keys.update(recorded[0])
+                    todo.extend(recorded[1])
+            return keys
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one upstream call.
+
+    The first caller for a key runs the function while later callers with
+    the same key wait for, and share, its result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = func(*args)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+            }
+
+
+class AsyncSingleFlight:
+    """:class:`SingleFlight` for coroutines, all run by one event loop.
+
+    The first caller's coroutine runs as a task, so callers that are
+    cancelled leave it running for the others waiting on it.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.ensure_future(func(*args))
+            flight.add_done_callback(lambda f: self._landed(key, f))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    def _landed(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            flight.exception()  # Retrieved, even if every caller has gone
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,83 @@
+import functools
+import json
+import logging
+import sys
+from concurrent import futures
+
+from mopidy import commands
+from mopidy.audio import scan
+
+from mopidy_tunein import actor, diagnose, playback, scheduler, tunein
+
+logger = logging.getLogger(__name__)
+
+
+class TuneInCommand(commands.Command):
+    def __init__(self):
+        super().__init__()
+        self.add_child("diagnose", DiagnoseCommand())
+
+
+class DiagnoseCommand(commands.Command):
+    help = (
+        "Show how long each step of starting TuneIn stations takes, "
+        "trying every stream mirror."
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.add_argument(
+            "station_ids",
+            nargs="+",
+            metavar="ID",
+            help="station IDs, e.g. s1234",
+        )
+        self.add_argument(
+            "--jobs",
+            type=int,
+            default=4,
+            help="number of stations to diagnose at once",
+        )
+        self.add_argument(
+            "--json", action="store_true", help="output one JSON document"
+        )
+        self.set(base_verbosity_level=-1)
+
+    def run(self, args, config):
+        run = functools.partial(_diagnose, config=config)
+        with futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            reports = list(pool.map(run, args.station_ids))
+        if args.json:
+            json.dump(reports, sys.stdout, indent=2)
+            print()
+        else:
+            print("\n\n".join(diagnose.format_report(r) for r in reports))
+        return 0 if all(r["playable"] for r in reports) else 1
+
+
+def _diagnose(station_id, config):
+    # A client of its own, so nothing is answered from another's cache.
+    trace = diagnose.Trace()
+    session = diagnose.TracingSession(
+        actor.get_requests_session(config["proxy"], scheduler.Scheduler(0)),
+        trace,
+    )
+    timeout = config["tunein"]["timeout"]
+    client = tunein.TuneIn(timeout, config["tunein"]["filter"], session)
+    scanner = diagnose.TracingScanner(
+        scan.Scanner(timeout=timeout, proxy_config=config["proxy"]), trace
+    )
+    unwrap = functools.partial(
+        playback._unwrap_stream,
+        timeout=timeout,
+        scanner=scanner,
+        requests_session=session,
+    )
+    return diagnose.diagnose(
+        station_id,
+        client,
+        unwrap,
+        trace,
+        timeout=timeout / 1000,
+        fast_path=config["tunein"]["stream_fast_path"],
+    )
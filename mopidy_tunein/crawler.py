@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from mopidy.models import Ref
+
+logger = logging.getLogger(__name__)
+
+
+class Crawler:
+    """
+    Browse the top of the TuneIn directory in the background, so responses
+    are cached before anyone asks for them.
+
+    Every ``interval`` seconds directories are browsed breadth first from
+    ``root``, down to ``depth`` levels including the root. Crawling waits
+    while ``busy()`` is true, i.e. while others are waiting on TuneIn, and
+    sleeps so that the upstream requests counted by ``requests()`` stay
+    under ``rate`` per minute.
+    """
+
+    def __init__(
+        self,
+        browse,
+        depth,
+        rate=30,
+        interval=1800,
+        busy=None,
+        requests=None,
+        root="tunein:root",
+    ):
+        self._browse = browse
+        self._depth = depth
+        self._request_interval = 60.0 / rate
+        self._interval = interval
+        self._busy = busy or (lambda: False)
+        self._requests = requests or (lambda: 0)
+        self._root = root
+        self._stop = threading.Event()
+        self._thread = None
+        self.crawls = 0
+        self.browsed = 0
+        self.failed = 0
+
+    def start(self, delay=10):
+        self._thread = threading.Thread(
+            target=self._run, args=(delay,), name="TuneInCrawler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "crawls": self.crawls,
+            "browsed": self.browsed,
+            "failed": self.failed,
+        }
+
+    def crawl(self):
+        """Browse the tree once, returning how many directories were seen."""
+        start = time.monotonic()
+        seen = {self._root}
+        todo = deque([(self._root, 1)])
+        while todo and not self._stop.is_set():
+            uri, level = todo.popleft()
+            self._wait_until_idle()
+            before = self._requests()
+            try:
+                refs = self._browse(uri)
+            except Exception as e:
+                logger.debug(f"Crawling {uri} failed: {e}")
+                self.failed += 1
+                continue
+            self.browsed += 1
+            if level < self._depth:
+                for ref in refs:
+                    if ref.type == Ref.DIRECTORY and ref.uri not in seen:
+                        seen.add(ref.uri)
+                        todo.append((ref.uri, level + 1))
+            # Cache hits are free, only requests to TuneIn count.
+            made = max(0, self._requests() - before)
+            if made:
+                self._stop.wait(made * self._request_interval)
+        self.crawls += 1
+        logger.debug(
+            f"Crawled {len(seen)} TuneIn directories "
+            f"in {time.monotonic() - start:.1f}s"
+        )
+        return len(seen)
+
+    def _wait_until_idle(self):
+        while self._busy() and not self._stop.wait(0.5):
+            pass
+
+    def _run(self, delay):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                self.crawl()
+            except Exception:
+                logger.exception("TuneIn crawler failed")
+            if self._stop.wait(self._interval):
+                return
@@ -0,0 +1,222 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from mopidy_tunein import tunein
+from mopidy_tunein.resolver import Deadline
+
+logger = logging.getLogger(__name__)
+
+# Playlists of playlists are followed this deep.
+MAX_DEPTH = 3
+
+
+class Trace:
+    """Timed record of the steps taken to start a station.
+
+    Steps are recorded with :meth:`span`, nested ones indented under the
+    step they were part of. Each trace is only used by one thread.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.events = []
+        self._depth = 0
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @contextmanager
+    def span(self, kind, target=""):
+        event = {
+            "kind": kind,
+            "target": target,
+            "start": self.elapsed(),
+            "depth": self._depth,
+        }
+        self._depth += 1
+        try:
+            yield event
+        except Exception as e:
+            event["error"] = str(e)
+            raise
+        finally:
+            self._depth -= 1
+            event["seconds"] = self.elapsed() - event["start"]
+            self.events.append(event)
+
+    def timeline(self):
+        return sorted(self.events, key=lambda e: (e["start"], e["depth"]))
+
+
+class TracedDeadline(Deadline):
+    """:class:`~mopidy_tunein.resolver.Deadline` recording each phase in a
+    :class:`Trace`."""
+
+    def __init__(self, budget, trace):
+        super().__init__(budget)
+        self.trace = trace
+
+    @contextmanager
+    def phase(self, name):
+        with self.trace.span(name), super().phase(name):
+            yield self
+
+
+class TracingSession:
+    """Wrap a requests session to record each request in a :class:`Trace`."""
+
+    def __init__(self, session, trace):
+        self._session = session
+        self._trace = trace
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        with self._trace.span("http", f"{method} {url}") as event:
+            response = self._session.request(method, url, **kwargs)
+            event["detail"] = " ".join(
+                str(part)
+                for part in (
+                    response.status_code,
+                    response.headers.get("content-type"),
+                )
+                if part
+            )
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class TracingScanner:
+    """Wrap a GStreamer scanner to record each scan in a :class:`Trace`."""
+
+    def __init__(self, scanner, trace):
+        self._scanner = scanner
+        self._trace = trace
+
+    def scan(self, uri, timeout=None):
+        with self._trace.span("gstreamer", uri) as event:
+            result = self._scanner.scan(uri, timeout=timeout)
+            event["detail"] = (
+                f"{result.mime}, "
+                f"{'playable' if result.playable else 'not playable'}"
+            )
+        return result
+
+
+def diagnose(station_id, client, unwrap, trace, timeout=5.0, fast_path=True):
+    """
+    Resolve ``station_id`` the way playback does, trying every mirror.
+
+    ``client`` is a :class:`~mopidy_tunein.tunein.TuneIn` and ``unwrap`` is
+    ``_unwrap_stream`` from :mod:`mopidy_tunein.playback` with its scanner and
+    session given, both recording into ``trace``. Each mirror gets its own
+    ``timeout`` in seconds. Returns a JSON serializable report.
+    """
+    report = {
+        "station": station_id,
+        "name": None,
+        "playable": None,
+        "first_playable": None,
+        "mirrors": [],
+    }
+    try:
+        with trace.span("station", station_id):
+            station = client.station(station_id)
+        if not station:
+            report["error"] = "Unknown station"
+            return report
+        report["name"] = station.get("text")
+        with trace.span("tune", station_id) as event:
+            uris = client.tune(station, deadline=TracedDeadline(timeout, trace))
+            event["detail"] = f"{len(uris)} mirrors"
+        for uri in uris:
+            _probe(uri, client, unwrap, trace, timeout, fast_path, report)
+        if not uris:
+            report["error"] = "No streams"
+    except Exception as e:
+        logger.debug("Diagnosing TuneIn station failed", exc_info=True)
+        report["error"] = str(e)
+    finally:
+        report["total"] = trace.elapsed()
+        report["trace"] = trace.timeline()
+    return report
+
+
+def _probe(uri, client, unwrap, trace, timeout, fast_path, report, depth=0):
+    mirror = {"uri": uri, "outcome": "failed", "via": None, "stream": None}
+    report["mirrors"].append(mirror)
+    deadline = TracedDeadline(timeout, trace)
+    with trace.span("mirror", uri) as event:
+        kind, uris = tunein.UNKNOWN, []
+        if fast_path:
+            kind, uris = client.classify(uri, deadline=deadline)
+        if kind == tunein.AUDIO:
+            mirror.update(outcome="playable", via="fast_path", stream=uri)
+        elif kind == tunein.PLAYLIST:
+            mirror.update(outcome="playlist", via="fast_path")
+        else:
+            stream, _ = unwrap(uri, deadline=deadline)
+            if stream:
+                mirror.update(outcome="playable", via="scan", stream=stream)
+            else:
+                # Playback falls back to reading it as a playlist itself.
+                uris = client.parse_stream_url(uri, deadline=deadline)
+                if uris == [uri]:
+                    mirror.update(
+                        outcome="playable", via="fallback", stream=uri
+                    )
+                elif uris:
+                    mirror.update(outcome="playlist", via="parse")
+        event["detail"] = mirror["outcome"]
+    mirror["seconds"] = event["seconds"]
+    if mirror["outcome"] == "playable":
+        if report["playable"] is None:
+            report["playable"] = mirror["stream"]
+            report["first_playable"] = trace.elapsed()
+    elif mirror["outcome"] == "playlist" and depth < MAX_DEPTH:
+        for child in uris:
+            _probe(
+                child,
+                client,
+                unwrap,
+                trace,
+                timeout,
+                fast_path,
+                report,
+                depth + 1,
+            )
+
+
+def format_report(report):
+    """Return ``report`` from :func:`diagnose` as readable text."""
+    name = f" ({report['name']})" if report["name"] else ""
+    lines = [f"Station {report['station']}{name}"]
+    for event in report.get("trace", []):
+        indent = "  " * event["depth"]
+        detail = event.get("error") or event.get("detail") or ""
+        lines.append(
+            f"  {event['start']:7.3f}s {event['seconds']:7.3f}s  "
+            f"{indent}{event['kind']} {event['target']}"
+            + (f" -> {detail}" if detail else "")
+        )
+    for mirror in report["mirrors"]:
+        via = f" via {mirror['via']}" if mirror["via"] else ""
+        lines.append(
+            f"  {mirror['outcome']}{via} in {mirror['seconds']:.3f}s: "
+            f"{mirror['uri']}"
+        )
+    if report["first_playable"] is not None:
+        lines.append(
+            f"  First playable after {report['first_playable']:.3f}s: "
+            f"{report['playable']}"
+        )
+    else:
+        lines.append(
+            f"  Not playable: {report.get('error', 'no mirror played')}"
+        )
+    lines.append(f"  Total {report['total']:.3f}s")
+    return "\n".join(lines)
@@ -0,0 +1,95 @@
+import logging
+import queue
+from concurrent import futures
+
+import pykka
+from pykka import messages
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchingInbox(queue.Queue):
+    """Actor inbox that can divert envelopes before they are queued.
+
+    While ``dispatch`` is set, it is called with every envelope put in the
+    inbox and returns :class:`True` if it has taken care of it. Anything
+    else is queued for the actor thread as usual.
+    """
+
+    dispatch = None
+
+    def put(self, item, block=True, timeout=None):
+        dispatch = self.dispatch
+        if dispatch is None or not dispatch(item):
+            super().put(item, block, timeout)
+
+
+class OffloadingActor(pykka.ThreadingActor):
+    """Threading actor that runs some proxy calls on a worker pool.
+
+    Calls to the attribute paths in ``offloaded_calls``, e.g.
+    ``("library", "browse")``, skip the actor's inbox and run concurrently
+    on a bounded pool, so they don't wait behind slow calls on the actor
+    thread. Offloaded methods must be thread-safe.
+
+    Mopidy waits on the future of each proxy call, so the calls are
+    diverted as they arrive in the inbox. This relies on the inbox and
+    message types of Pykka 3 and later. If the inbox can't be replaced,
+    every call stays on the actor thread.
+    """
+
+    offloaded_calls = frozenset()
+
+    _offload_pool = None
+
+    @staticmethod
+    def _create_actor_inbox():
+        return DispatchingInbox()
+
+    def start_offloading(self, workers):
+        if not isinstance(self.actor_inbox, DispatchingInbox):
+            logger.warning(
+                f"Not offloading calls from {self}: unsupported Pykka version"
+            )
+            return
+        self._offload_pool = futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"{self.__class__.__name__}Worker",
+        )
+        self.actor_inbox.dispatch = self._offload
+
+    def stop_offloading(self):
+        if isinstance(self.actor_inbox, DispatchingInbox):
+            self.actor_inbox.dispatch = None
+        if self._offload_pool is not None:
+            self._offload_pool.shutdown(wait=False)
+
+    def _offload(self, envelope):
+        message = envelope.message
+        if not isinstance(message, messages.ProxyCall):
+            return False
+        if tuple(message.attr_path) not in self.offloaded_calls:
+            return False
+        if self.actor_stopped.is_set():
+            return False
+        try:
+            self._offload_pool.submit(self._run_offloaded, envelope)
+        except RuntimeError:  # Pool already shut down
+            return False
+        return True
+
+    def _run_offloaded(self, envelope):
+        message = envelope.message
+        try:
+            callee = self
+            for attr in message.attr_path:
+                callee = getattr(callee, attr)
+            result = callee(*message.args, **message.kwargs)
+        except Exception:
+            if envelope.reply_to is None:
+                logger.exception(f"Unhandled exception in {self}")
+            else:
+                envelope.reply_to.set_exception()
+            return
+        if envelope.reply_to is not None:
+            envelope.reply_to.set(result)
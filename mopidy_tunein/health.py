@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class _Health:
+    __slots__ = (
+        "successes",
+        "failures",
+        "latency",
+        "last_success",
+        "last_failure",
+    )
+
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.latency = None
+        self.last_success = None
+        self.last_failure = None
+
+    def succeeded(self, seconds, now, smoothing):
+        self.successes += 1
+        self.last_success = now
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += smoothing * (seconds - self.latency)
+
+    def failed(self, now):
+        self.failures += 1
+        self.last_failure = now
+
+    def failing(self, now, penalty):
+        # Failed recently, and hasn't played since.
+        return (
+            self.last_failure is not None
+            and now - self.last_failure < penalty
+            and (
+                self.last_success is None
+                or self.last_success < self.last_failure
+            )
+        )
+
+
+class MirrorHealth:
+    """
+    Remember which stream mirrors played, and how quickly, to try the best
+    ones first.
+
+    Results are kept for each stream URI and, for URIs not tried before, its
+    host. :meth:`order` puts mirrors that played first, fastest first, then
+    those not tried yet, then those that failed within the last ``penalty``
+    seconds, least recently failed first.
+    """
+
+    def __init__(self, penalty=300, smoothing=0.3, max_entries=1000):
+        self.penalty = penalty
+        self.smoothing = smoothing
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._uris = OrderedDict()
+        self._hosts = OrderedDict()
+
+    def succeeded(self, uri, seconds):
+        """Record that ``uri`` was playable after ``seconds``."""
+        now = time.monotonic()
+        with self._lock:
+            for state in self._states(uri):
+                state.succeeded(seconds, now, self.smoothing)
+
+    def failed(self, uri):
+        now = time.monotonic()
+        with self._lock:
+            for state in self._states(uri):
+                state.failed(now)
+
+    def order(self, uris):
+        """Return ``uris`` with the healthiest mirrors first."""
+        now = time.monotonic()
+        with self._lock:
+            keys = {uri: self._rank(uri, now) for uri in uris}
+        return sorted(uris, key=keys.get)
+
+    def demoted(self):
+        """Return the URIs currently tried last because they failed."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                uri
+                for uri, state in self._uris.items()
+                if state.failing(now, self.penalty)
+            ]
+
+    def table(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "uri": uri,
+                    "successes": state.successes,
+                    "failures": state.failures,
+                    "latency": state.latency,
+                    "failing": state.failing(now, self.penalty),
+                }
+                for uri, state in self._uris.items()
+            ]
+
+    def _rank(self, uri, now):
+        # Called with the lock held.
+        state = self._uris.get(uri) or self._hosts.get(_host(uri))
+        if state is None:
+            return (1, 0.0)
+        if state.failing(now, self.penalty):
+            return (2, state.last_failure)
+        if state.latency is None:
+            return (1, 0.0)
+        return (0, state.latency)
+
+    def _states(self, uri):
+        # Called with the lock held.
+        return (
+            self._state(self._uris, uri),
+            self._state(self._hosts, _host(uri)),
+        )
+
+    def _state(self, states, key):
+        state = states.get(key)
+        if state is None:
+            state = states[key] = _Health()
+            while len(states) > self.max_entries:
+                states.popitem(last=False)
+        else:
+            states.move_to_end(key)
+        return state
+
+
+class MirrorVerifier:
+    """
+    Check demoted mirrors in the background, so those that recover are
+    tried first again without a listener waiting on them.
+
+    Every ``interval`` seconds ``check(uri)`` is called for each of
+    :meth:`MirrorHealth.demoted`, which must record the result in the
+    registry itself.
+    """
+
+    def __init__(self, health, check, interval=300):
+        self._health = health
+        self._check = check
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.checked = 0
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="TuneInMirrorVerifier", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def verify(self):
+        """Check each demoted mirror once."""
+        for uri in self._health.demoted():
+            if self._stop.is_set():
+                break
+            try:
+                self._check(uri)
+            except Exception as e:
+                logger.debug(f"Checking TuneIn mirror {uri} failed: {e}")
+            self.checked += 1
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.verify()
+            except Exception:
+                logger.exception("TuneIn mirror verifier failed")
+
+
+def _host(uri):
+    return urlparse(uri).netloc.lower() or uri
@@ -0,0 +1,146 @@
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets from 10ms to about 4 minutes, each 25% wider.
+BUCKETS = tuple(0.01 * 1.25**i for i in range(46))
+
+
+class LatencyHistogram:
+    """Histogram of latencies in seconds, weighted towards recent ones.
+
+    Every new sample scales down the weight of the older ones by ``decay``,
+    so percentiles follow a host whose speed changes.
+    """
+
+    def __init__(self, decay=0.95):
+        self.decay = decay
+        self.weights = [0.0] * len(BUCKETS)
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.weights = [w * self.decay for w in self.weights]
+        index = min(bisect.bisect_left(BUCKETS, seconds), len(BUCKETS) - 1)
+        self.weights[index] += 1.0
+        self.total = self.total * self.decay + 1.0
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile ``q``."""
+        target = q * self.total
+        seen = 0.0
+        for bound, weight in zip(BUCKETS, self.weights):
+            seen += weight
+            if seen >= target:
+                return bound
+        return BUCKETS[-1]
+
+
+class _HostLatency:
+    __slots__ = ("histogram", "responses", "failures", "timeouts")
+
+    def __init__(self, decay):
+        self.histogram = LatencyHistogram(decay)
+        self.responses = 0
+        self.failures = 0
+        self.timeouts = 0
+
+
+class AdaptiveTimeouts:
+    """
+    Learn how long each host takes, to stop waiting on slow requests sooner.
+
+    Latencies are kept separately for each ``kind`` of request, e.g. HTTP
+    requests and GStreamer scans, and host. A request's timeout is
+    ``multiplier`` times its host's recent 95th percentile latency, kept
+    between ``floor`` and the caller's own limit. Hosts with fewer than
+    ``min_samples`` responses get the caller's limit, unless they have
+    failed that many times without responding, when they get the floor.
+    Requests that time out count as taking at least that long, so hosts
+    that slow down are given longer.
+    """
+
+    def __init__(
+        self,
+        floor=1.0,
+        multiplier=3.0,
+        min_samples=5,
+        decay=0.95,
+        max_hosts=512,
+    ):
+        self.floor = floor
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.decay = decay
+        self.max_hosts = max_hosts
+        self._lock = threading.Lock()
+        self._hosts = OrderedDict()
+
+    def timeout(self, kind, url, limit):
+        """Return the timeout in seconds for a request to ``url``."""
+        with self._lock:
+            state = self._hosts.get((kind, _host(url)))
+            if state is None:
+                return limit
+            if state.responses < self.min_samples:
+                if state.failures >= self.min_samples:
+                    return min(self.floor, limit)
+                return limit
+            learned = self.multiplier * state.histogram.quantile(0.95)
+        return min(max(learned, self.floor), limit)
+
+    def observe(self, kind, url, seconds):
+        with self._lock:
+            state = self._state(kind, url)
+            state.histogram.add(seconds)
+            state.responses += 1
+            state.failures = 0
+
+    def failed(self, kind, url, timeout=None):
+        """Record a failed request, taking ``timeout`` seconds if it timed
+        out."""
+        with self._lock:
+            state = self._state(kind, url)
+            state.failures += 1
+            if timeout is not None:
+                state.timeouts += 1
+                if state.responses:
+                    state.histogram.add(timeout)
+
+    def table(self):
+        """Return what has been learned about each host, for debugging."""
+        with self._lock:
+            return [
+                {
+                    "kind": kind,
+                    "host": host,
+                    "responses": state.responses,
+                    "failures": state.failures,
+                    "timeouts": state.timeouts,
+                    "p95": (
+                        state.histogram.quantile(0.95)
+                        if state.responses
+                        else None
+                    ),
+                }
+                for (kind, host), state in self._hosts.items()
+            ]
+
+    def _state(self, kind, url):
+        # Called with the lock held.
+        key = (kind, _host(url))
+        state = self._hosts.get(key)
+        if state is None:
+            state = self._hosts[key] = _HostLatency(self.decay)
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(key)
+        return state
+
+
+def _host(url):
+    return urlparse(url).netloc.lower() or url
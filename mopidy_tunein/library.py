@@ -0,0 +1,121 @@
+import logging
+
+from mopidy import backend
+from mopidy.models import Ref, SearchResult
+
+from mopidy_tunein import translator
+
+logger = logging.getLogger(__name__)
+
+
+class TuneInLibrary(backend.LibraryProvider):
+    root_directory = Ref.directory(uri="tunein:root", name="TuneIn")
+
+    def __init__(self, backend):
+        super().__init__(backend)
+
+    def browse(self, uri):
+        # Remember what went into this directory so it can be refreshed.
+        with self.backend.tunein.recording(uri) as children:
+            result = self._browse(uri)
+            children.update(
+                ref.uri for ref in result if ref.type == Ref.DIRECTORY
+            )
+        return result
+
+    def _browse(self, uri):
+        result = []
+        variant, identifier = translator.parse_uri(uri)
+        logger.debug(f"Browsing {uri!r}")
+        if variant == "root":
+            for category in self.backend.tunein.categories():
+                result.append(translator.category_to_ref(category))
+        elif variant == "category" and identifier:
+            for section in self.backend.tunein.categories(identifier):
+                result.append(translator.section_to_ref(section, identifier))
+        elif variant == "location" and identifier:
+            for location in self.backend.tunein.locations(identifier):
+                result.append(translator.section_to_ref(location, "local"))
+            for station in self.backend.tunein.stations(identifier):
+                result.append(translator.station_to_ref(station))
+        elif variant == "section" and identifier:
+            if self.backend.tunein.related(identifier):
+                result.append(
+                    Ref.directory(
+                        uri=f"tunein:related:{identifier}", name="Related"
+                    )
+                )
+            if self.backend.tunein.shows(identifier):
+                result.append(
+                    Ref.directory(
+                        uri=f"tunein:shows:{identifier}", name="Shows"
+                    )
+                )
+            for station in self.backend.tunein.featured(identifier):
+                result.append(translator.section_to_ref(station))
+            for station in self.backend.tunein.local(identifier):
+                result.append(translator.station_to_ref(station))
+            for station in self.backend.tunein.stations(identifier):
+                result.append(translator.station_to_ref(station))
+        elif variant == "related" and identifier:
+            for section in self.backend.tunein.related(identifier):
+                result.append(translator.section_to_ref(section))
+        elif variant == "shows" and identifier:
+            for show in self.backend.tunein.shows(identifier):
+                result.append(translator.show_to_ref(show))
+        elif variant == "episodes" and identifier:
+            for episode in self.backend.tunein.episodes(identifier):
+                result.append(translator.station_to_ref(episode))
+        else:
+            logger.debug(f"Unknown URI: {uri!r}")
+
+        return result
+
+    def refresh(self, uri=None):
+        variant, _ = translator.parse_uri(uri or "")
+        if variant in (None, "root"):
+            self.backend.tunein.reload()
+            return
+        logger.debug(f"Refreshing {uri!r}")
+        if not self.backend.tunein.invalidate(uri):
+            # Not browsed since starting, so find out from the cache what
+            # it was built from.
+            self.browse(uri)
+            self.backend.tunein.invalidate(uri)
+
+    def lookup(self, uri):
+        variant, identifier = translator.parse_uri(uri)
+        if variant != "station":
+            return []
+        station = self.backend.tunein.station(identifier)
+        if not station:
+            return []
+
+        track = translator.station_to_track(station)
+        return [track]
+
+    def get_images(self, uris):
+        station_uris = {}
+        for uri in uris:
+            variant, identifier = translator.parse_uri(uri)
+            if variant == "station":
+                station_uris[uri] = identifier
+        stations = self.backend.tunein.station_batch(
+            station_uris.values(), self.backend._fetcher
+        )
+        results = {}
+        for uri, identifier in station_uris.items():
+            image = translator.station_to_image(stations.get(identifier))
+            if image is not None:
+                results[uri] = [image]
+        return results
+
+    def search(self, query=None, uris=None, exact=False):
+        if query is None or not query:
+            return
+        tunein_query = translator.mopidy_to_tunein_query(query)
+        tracks = []
+        for station in self.backend.tunein.search(tunein_query):
+            track = translator.station_to_track(station)
+            tracks.append(track)
+        return SearchResult(uri="tunein:search", tracks=tracks)
@@ -0,0 +1,241 @@
+import bisect
+import logging
+import os
+import threading
+import weakref
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cache hit to a slow stream scan.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# A metric and its samples, each a ``(labels, value)`` pair where labels is
+# a dict. Histogram samples carry their ``_bucket``, ``_sum`` or ``_count``
+# suffix in a "__suffix" label.
+Family = namedtuple("Family", "name type help samples")
+
+
+class Counter:
+    """A count that only goes up, for each combination of label values."""
+
+    def __init__(self, name, help_, labels=()):
+        self.name = name
+        self.help = help_
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount
+            )
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def collect(self):
+        with self._lock:
+            samples = [
+                (dict(zip(self.labels, values)), value)
+                for values, value in self._values.items()
+            ]
+        return [Family(self.name, COUNTER, self.help, samples)]
+
+
+class Histogram:
+    """Distribution of observed values, counted in cumulative ``buckets``."""
+
+    def __init__(self, name, help_, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *label_values):
+        with self._lock:
+            state = self._values.get(label_values)
+            return sum(state[0]) if state else 0
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            values = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        for label_values, counts, total in values:
+            labels = dict(zip(self.labels, label_values))
+            seen = 0
+            for bound, count in zip(self.buckets + (None,), counts):
+                seen += count
+                samples.append(
+                    (
+                        {
+                            **labels,
+                            "le": "+Inf" if bound is None else f"{bound:g}",
+                            "__suffix": "_bucket",
+                        },
+                        seen,
+                    )
+                )
+            samples.append(({**labels, "__suffix": "_sum"}, total))
+            samples.append(({**labels, "__suffix": "_count"}, seen))
+        return [Family(self.name, HISTOGRAM, self.help, samples)]
+
+
+class Registry:
+    """
+    Metrics of a running backend, in the Prometheus text format.
+
+    Counters and histograms are updated as things happen. Numbers that are
+    already kept elsewhere, e.g. cache statistics, are read only when the
+    metrics are rendered, from the collectors added with :meth:`collector`:
+    callables returning a list of :class:`Family`. Bound methods are held
+    weakly, so collectors go away with their objects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name, help_, labels=()):
+        return self._add(Counter, name, help_, labels)
+
+    def histogram(self, name, help_, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram, name, help_, labels, buckets)
+
+    def collector(self, func):
+        ref = (
+            weakref.WeakMethod(func)
+            if hasattr(func, "__self__")
+            else (lambda: func)
+        )
+        with self._lock:
+            self._collectors.append(ref)
+
+    def collect(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            self._collectors = [ref for ref in self._collectors if ref()]
+            collectors = [ref() for ref in self._collectors]
+        families = []
+        for metric in metrics:
+            families.extend(metric.collect())
+        for func in collectors:
+            if func is None:
+                continue
+            try:
+                families.extend(func())
+            except Exception:
+                logger.exception(
+                    f"Collecting TuneIn metrics from {func} failed"
+                )
+        return families
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for family in self.collect():
+            lines.append(f"# HELP {family.name} {_escape(family.help)}")
+            lines.append(f"# TYPE {family.name} {family.type}")
+            for labels, value in family.samples:
+                labels = dict(labels)
+                name = family.name + labels.pop("__suffix", "")
+                lines.append(
+                    f"{name}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write :meth:`render` to ``path``, replacing it atomically."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def _add(self, cls, name, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric}")
+            return metric
+
+
+class Exporter:
+    """Write ``registry`` to the file at ``path`` every ``interval`` seconds,
+    e.g. for the node_exporter textfile collector."""
+
+    def __init__(self, registry, path, interval=60):
+        self._registry = registry
+        self._path = path
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="TuneInMetrics", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def export(self):
+        try:
+            self._registry.write(self._path)
+        except OSError as e:
+            logger.warning(
+                f"Writing TuneIn metrics to {self._path} failed: {e}"
+            )
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.export()
+        self.export()
+
+
+def _escape(value, quote=False):
+    value = str(value).replace("\\", r"\\").replace("\n", r"\n")
+    return value.replace('"', r"\"") if quote else value
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value, quote=True)}"'
+        for name, value in labels.items()
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+
+# Metrics of the running backend, for other extensions to read or serve.
+REGISTRY = Registry()
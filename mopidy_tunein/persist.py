@@ -0,0 +1,373 @@
+import base64
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """Copy of cached TuneIn responses kept in an SQLite file.
+
+    Nothing is read up front: each key is looked up the first time it is
+    missing from memory, so a large snapshot doesn't slow down startup.
+    Writes are queued and stored in batches by a background thread.
+    Entries older than ``max_age`` seconds are ignored and pruned.
+
+    This is the interface the ``cache`` decorator expects of a cache
+    backend: :meth:`get`, :meth:`put`, :meth:`delete`, :meth:`clear`,
+    :meth:`lock`, :meth:`close` and :meth:`stats`.
+    """
+
+    def __init__(self, path, max_age=7 * 24 * 3600, flush_delay=1.0):
+        self.path = path
+        self.max_age = max_age
+        self._flush_delay = flush_delay
+        self._lock = threading.Lock()
+        self._conn = None
+        self._failed = False
+        self._closed = False
+        self._pruned = False
+        self._pending = {}
+        self._flushing = []
+        self._writer = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get(self, method, key):
+        """Return the saved ``(value, stored)`` for ``key`` or :class:`None`."""
+        name = _encode_key(key)
+        with self._lock:
+            if self._closed:
+                return None
+            saved = self._pending.get((method, name))
+            if saved is None:
+                saved = self._select(method, name)
+            if saved is None or time.time() - saved[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return saved
+
+    def put(self, method, key, value, stored):
+        with self._lock:
+            if self._closed or self._failed:
+                return
+            self._pending[(method, _encode_key(key))] = (value, stored)
+            self._start_writer()
+        self._wakeup.set()
+
+    def clear(self, method):
+        with self._lock:
+            for pending in [k for k in self._pending if k[0] == method]:
+                del self._pending[pending]
+            for keys in self._flushing:
+                keys.difference_update([k for k in keys if k[0] == method])
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM responses WHERE method = ?", (method,)
+                    )
+            except sqlite3.Error as e:
+                logger.info(f"Clearing TuneIn cache {self.path} failed: {e}")
+
+    def delete(self, method, key):
+        name = _encode_key(key)
+        with self._lock:
+            self._pending.pop((method, name), None)
+            # It may also be in a batch being written right now.
+            for keys in self._flushing:
+                keys.discard((method, name))
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM responses WHERE method = ? AND key = ?",
+                        (method, name),
+                    )
+            except sqlite3.Error as e:
+                logger.info(f"Deleting from TuneIn cache {self.path}: {e}")
+
+    @contextmanager
+    def lock(self, method, key):
+        """Hold while fetching ``key`` so others can wait for the result.
+
+        Only one process uses a snapshot, so there's nothing to do.
+        """
+        yield
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            # Keys deleted or cleared meanwhile are taken out of this.
+            keys = set(batch)
+            self._flushing.append(keys)
+        rows = _encode_rows(batch)
+        with self._lock:
+            self._flushing = [k for k in self._flushing if k is not keys]
+            self._write([row for row in rows if row[:2] in keys])
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self._closed = True
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "pending": len(self._pending),
+            }
+
+    def _connect(self):
+        # Called with the lock held.
+        if self._conn is None and not self._failed:
+            try:
+                conn = sqlite3.connect(
+                    str(self.path), timeout=5, check_same_thread=False
+                )
+                self._prepare(conn)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "method TEXT NOT NULL, key TEXT NOT NULL, "
+                    "value TEXT NOT NULL, stored REAL NOT NULL, "
+                    "PRIMARY KEY (method, key))"
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Not using TuneIn cache {self.path}: {e}")
+                self._failed = True
+                return None
+            self._conn = conn
+        return self._conn
+
+    def _prepare(self, conn):
+        pass
+
+    def _select(self, method, name):
+        conn = self._connect()
+        if conn is None:
+            return None
+        try:
+            row = conn.execute(
+                "SELECT value, stored FROM responses "
+                "WHERE method = ? AND key = ?",
+                (method, name),
+            ).fetchone()
+            if row is not None:
+                return _decode_value(row[0]), row[1]
+        except (sqlite3.Error, ValueError) as e:
+            logger.debug(f"Reading TuneIn cache {self.path} failed: {e}")
+        return None
+
+    def _write(self, rows):
+        # Called with the lock held.
+        conn = self._connect()
+        if conn is None or not rows:
+            return
+        try:
+            with conn:
+                if not self._pruned:
+                    conn.execute(
+                        "DELETE FROM responses WHERE stored < ?",
+                        (time.time() - self.max_age,),
+                    )
+                    self._pruned = True
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as e:
+            logger.info(f"Saving to TuneIn cache {self.path} failed: {e}")
+            return
+        self.writes += len(rows)
+        logger.debug(f"Saved {len(rows)} TuneIn responses to {self.path}")
+
+    def _start_writer(self):
+        # Called with the lock held.
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write_loop,
+                name="TuneInSnapshotWriter",
+                daemon=True,
+            )
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._wakeup.wait()
+            # Give related responses a moment to arrive and share the write.
+            self._stop.wait(self._flush_delay)
+            self._wakeup.clear()
+            self.flush()
+            if self._stop.is_set():
+                return
+
+
+class _LockSlot:
+    """Lock file held on behalf of every thread using it in this process."""
+
+    __slots__ = ("lock", "fd", "holders")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fd = None
+        self.holders = 0
+
+
+class SharedCache(Snapshot):
+    """Cache backend shared by every Mopidy process using the same file.
+
+    The database is used in WAL mode so processes can read while another
+    writes, and responses are written straight away. While one process
+    fetches a key the others wait for it on a file lock, for at most
+    ``lock_timeout`` seconds, and then read its result.
+
+    Keys share ``lock_slots`` lock files. Threads of one process share the
+    file lock too, so they only wait for other processes, not each other.
+    """
+
+    def __init__(
+        self, path, max_age=7 * 24 * 3600, lock_timeout=5.0, lock_slots=64
+    ):
+        super().__init__(path, max_age=max_age)
+        self.lock_timeout = lock_timeout
+        self._lock_slots = lock_slots
+        self._lock_dir = pathlib.Path(f"{path}.locks")
+        self._slots = {}
+        self._slots_lock = threading.Lock()
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+
+    def put(self, method, key, value, stored):
+        rows = _encode_rows({(method, _encode_key(key)): (value, stored)})
+        with self._lock:
+            if not (self._closed or self._failed):
+                self._write(rows)
+
+    @contextmanager
+    def lock(self, method, key):
+        """Hold while fetching ``key`` so other processes wait for it."""
+        if fcntl is None:
+            yield
+            return
+        # Keys share a fixed number of lock files, rather than one each.
+        index = zlib.crc32(f"{method}{_encode_key(key)}".encode())
+        index %= self._lock_slots
+        with self._slots_lock:
+            slot = self._slots.setdefault(index, _LockSlot())
+        # Only the first thread in waits for the file lock.
+        with slot.lock:
+            if not slot.holders:
+                slot.fd = self._open_lock(index)
+                if slot.fd is not None:
+                    self._acquire(slot.fd)
+            slot.holders += 1
+        try:
+            yield
+        finally:
+            with slot.lock:
+                slot.holders -= 1
+                if not slot.holders and slot.fd is not None:
+                    os.close(slot.fd)  # Also releases the lock
+                    slot.fd = None
+
+    def stats(self):
+        stats = super().stats()
+        stats["lock_waits"] = self.lock_waits
+        stats["lock_timeouts"] = self.lock_timeouts
+        return stats
+
+    def _prepare(self, conn):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _open_lock(self, index):
+        path = self._lock_dir / f"{index:02x}.lock"
+        try:
+            self._lock_dir.mkdir(exist_ok=True)
+            return os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as e:
+            logger.debug(f"Not locking TuneIn cache {path}: {e}")
+            return None
+
+    def _acquire(self, fd):
+        expires = time.monotonic() + self.lock_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= expires:
+                    # Go ahead without it rather than wait on a stuck process.
+                    self.lock_timeouts += 1
+                    break
+                waited = True
+                time.sleep(0.05)
+        if waited:
+            self.lock_waits += 1
+
+
+def _encode_key(key):
+    return json.dumps(list(key))
+
+
+def _encode_rows(batch):
+    rows = []
+    for (method, name), (value, stored) in batch.items():
+        try:
+            rows.append((method, name, _encode_value(value), stored))
+        except (TypeError, ValueError) as e:
+            logger.debug(f"Not saving TuneIn response {name}: {e}")
+    return rows
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode_bytes(obj):
+    if "__bytes__" in obj and len(obj) == 1:
+        return base64.b64decode(obj["__bytes__"])
+    return obj
+
+
+def _encode_value(value):
+    # Playlists are bytes, which JSON can't hold directly.
+    return json.dumps(value, default=_encode_bytes)
+
+
+def _decode_value(text):
+    return json.loads(text, object_hook=_decode_bytes)
@@ -0,0 +1,274 @@
+import collections
+import functools
+import logging
+import threading
+import time
+
+from mopidy import backend, exceptions
+from mopidy.internal import http, playlists
+
+from mopidy_tunein import (
+    cache,
+    metrics,
+    resolver,
+    scheduler,
+    translator,
+    tunein,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def upcoming_stations(tracklist, tlid, count):
+    """Return the IDs of stations among the ``count`` tracks following
+    ``tlid`` in the core ``tracklist``."""
+    index = tracklist.index(tlid=tlid).get()
+    if index is None:
+        return []
+    station_ids = []
+    for tl_track in tracklist.slice(index + 1, index + 1 + count).get():
+        variant, identifier = translator.parse_uri(tl_track.track.uri)
+        if variant == "station":
+            station_ids.append(identifier)
+    return station_ids
+
+
+class TuneInPlayback(backend.PlaybackProvider):
+    def __init__(self, audio, backend):
+        super().__init__(audio, backend)
+        self._stream_info = None
+        self._resolving = cache.SingleFlight()
+        self._lock = threading.Lock()
+        self.budget_exhausted = collections.Counter()
+        # How stream URIs were identified, and the time spent in each phase.
+        self.probes = collections.Counter()
+        self.phase_time = collections.Counter()
+        self._resolve_time = metrics.REGISTRY.histogram(
+            "tunein_resolve_seconds",
+            "Time taken resolving a station to a stream, by step.",
+            labels=("phase",),
+        )
+        self._streams = resolver.StreamCache(
+            max_entries=backend._stream_cache_size,
+            ttl=backend._stream_cache_ttl,
+        )
+
+    def translate_uri(self, uri):
+        variant, identifier = translator.parse_uri(uri)
+        with self.backend._scheduler.priority(scheduler.PLAYBACK):
+            new_uri, self._stream_info = self.resolve(identifier)
+        self._streams.playing(identifier, new_uri)
+        return new_uri
+
+    def resolve(self, station_id):
+        """Return the playable URI and scan result for ``station_id``."""
+        cached = self._streams.get(station_id)
+        if cached is not None:
+            logger.debug(f"Using cached stream for {station_id}: {cached[0]}")
+            return cached
+        # Wait for a resolve of the same station only at the same priority:
+        # playback must not queue behind a prefetch's background requests.
+        # Whichever finishes first fills the cache for the other.
+        priority = self.backend._scheduler.current_priority()
+        return self._resolving.do(
+            (station_id, priority), self._resolve, station_id
+        )
+
+    def _resolve(self, station_id):
+        cached = self._streams.get(station_id, count=False)
+        if cached is not None:
+            return cached
+        # Every step shares one budget rather than each getting the timeout.
+        deadline = resolver.Deadline(self.backend._timeout / 1000)
+        try:
+            return self._resolve_within(station_id, deadline)
+        finally:
+            logger.debug(
+                f"Resolving TuneIn station {station_id} took "
+                f"{deadline.summary()}"
+            )
+            self._resolve_time.observe(deadline.elapsed(), "total")
+            for phase, spent in deadline.phases.items():
+                self._resolve_time.observe(spent, phase)
+            with self._lock:
+                self.phase_time.update(deadline.phases)
+                if deadline.exhausted_by is not None:
+                    self.budget_exhausted[deadline.exhausted_by] += 1
+
+    def _resolve_within(self, station_id, deadline):
+        with deadline.phase("station"):
+            station = self.backend.tunein.station(station_id)
+        if not station:
+            return None, None
+        with deadline.phase("tune"):
+            stream_uris = self.backend.tunein.tune(station, deadline=deadline)
+        # Skip past mirrors that failed last time.
+        stream_uris = self.backend._health.order(stream_uris)
+        # Probes made on other threads keep this thread's priority.
+        probe = self.backend._scheduler.bind(
+            functools.partial(self._probe, deadline=deadline)
+        )
+        if self.backend._resolver is not None:
+            new_uri, stream_info = resolver.race(
+                stream_uris, probe, self.backend._resolver, deadline
+            )
+        else:
+            new_uri, stream_info = self._resolve_sequentially(
+                stream_uris, probe, deadline
+            )
+        if not new_uri:
+            logger.debug("TuneIn lookup failed.")
+            return None, None
+        self._streams.set(station_id, new_uri, stream_info)
+        return new_uri, stream_info
+
+    def _resolve_sequentially(self, stream_uris, probe, deadline):
+        while stream_uris and not deadline.expired():
+            new_uri, stream_info, new_uris = probe(stream_uris.pop(0))
+            if new_uri:
+                return new_uri, stream_info
+            stream_uris.extend(new_uris)
+        return None, None
+
+    def verify(self, uri):
+        """Probe the stream mirror ``uri`` again, recording its health."""
+        self._probe(uri, resolver.Deadline(self.backend._timeout / 1000))
+
+    def _probe(self, uri, deadline):
+        # May run on a resolver worker, so must not touch self._stream_info.
+        logger.debug(f"Looking up URI: {uri!r}")
+        start = time.monotonic()
+        if self.backend._stream_fast_path:
+            # Headers or the first bytes are usually enough, saving a scan.
+            kind, new_uris = self.backend.tunein.classify(
+                uri, deadline=deadline
+            )
+            if kind != tunein.UNKNOWN:
+                with self._lock:
+                    self.probes[kind] += 1
+            if kind == tunein.AUDIO:
+                self.backend._health.succeeded(uri, time.monotonic() - start)
+                return uri, resolver.LiveStream(uri), []
+            if kind == tunein.PLAYLIST:
+                return None, None, new_uris
+        with self._lock:
+            self.probes["scan"] += 1
+        unwrapped_uri, stream_info = _unwrap_stream(
+            uri,
+            timeout=self.backend._timeout,
+            scanner=self.backend._scanner,
+            requests_session=self.backend._session,
+            deadline=deadline,
+            timeouts=self.backend._timeouts,
+        )
+        if unwrapped_uri:
+            self.backend._health.succeeded(uri, time.monotonic() - start)
+            return unwrapped_uri, stream_info, []
+        logger.debug("Mopidy translate_uri failed.")
+        new_uris = self.backend.tunein.parse_stream_url(uri, deadline=deadline)
+        if not new_uris or new_uris == [uri]:
+            # Not even a playlist of other mirrors to try.
+            self.backend._health.failed(uri)
+        if new_uris == [uri]:
+            logger.debug(f"Last attempt, play stream anyway: {uri!r}")
+            return uri, None, []
+        return None, None, new_uris
+
+    def is_live(self, uri):
+        return resolver.is_live(self._stream_info, uri)
+
+
+# Shamelessly taken from mopidy.stream.actor
+def _unwrap_stream(
+    uri, timeout, scanner, requests_session, deadline=None, timeouts=None
+):
+    """
+    Get a stream URI from a playlist URI, ``uri``.
+
+    Unwraps nested playlists until something that's not a playlist is found or
+    the ``timeout`` is reached. A shared ``deadline`` replaces the timeout.
+    Scans are cut short to what the host usually needs if ``timeouts``, an
+    :class:`~mopidy_tunein.latency.AdaptiveTimeouts`, is given.
+    """
+
+    original_uri = uri
+    seen_uris = set()
+    if deadline is None:
+        deadline = resolver.Deadline(timeout / 1000)
+
+    while not deadline.expired():
+        if uri in seen_uris:
+            logger.info(
+                f"Unwrapping stream from URI ({uri!r}) failed: "
+                "playlist referenced itself",
+            )
+            return None, None
+        else:
+            seen_uris.add(uri)
+
+        logger.debug(f"Unwrapping stream from URI: {uri!r}")
+
+        scan_timeout = deadline.remaining()
+        if timeouts is not None:
+            scan_timeout = timeouts.timeout("scan", uri, scan_timeout)
+        start = time.monotonic()
+        try:
+            with deadline.phase("scan"):
+                scan_result = scanner.scan(uri, timeout=scan_timeout * 1000)
+        except exceptions.ScannerError as exc:
+            logger.debug(f"GStreamer failed scanning URI ({uri!r}): {exc}")
+            scan_result = None
+            if timeouts is not None:
+                elapsed = time.monotonic() - start
+                # Only a timeout says anything about how slow the host is.
+                timeouts.failed(
+                    "scan", uri, elapsed if elapsed >= scan_timeout else None
+                )
+        else:
+            if timeouts is not None:
+                timeouts.observe("scan", uri, time.monotonic() - start)
+
+        if scan_result is not None:
+            if scan_result.playable or (
+                not scan_result.mime.startswith("text/")
+                and not scan_result.mime.startswith("application/")
+            ):
+                logger.debug(
+                    f"Unwrapped potential {scan_result.mime} stream: {uri!r}"
+                )
+                return uri, scan_result
+
+        if deadline.expired():
+            break
+        with deadline.phase("download"):
+            content = http.download(
+                requests_session, uri, timeout=deadline.remaining()
+            )
+
+        if content is None:
+            logger.info(
+                f"Unwrapping stream from URI ({original_uri!r}) failed: "
+                f"error downloading URI {uri!r}",
+            )
+            return None, None
+
+        with deadline.phase("parse"):
+            uris = playlists.parse(content)
+        if not uris:
+            logger.debug(
+                f"Failed parsing URI ({uri!r}) as playlist; "
+                "found potential stream.",
+            )
+            return uri, None
+
+        # TODO Test streams and return first that seems to be playable
+        logger.debug(
+            f"Parsed playlist ({uri!r}) and found new URI: {uris[0]!r}"
+        )
+        uri = uris[0]
+
+    logger.info(
+        f"Unwrapping stream from URI ({uri!r}) failed: "
+        f"timed out in {deadline.budget * 1000:.0f}ms"
+    )
+    return None, None
@@ -0,0 +1,279 @@
+import collections
+import itertools
+import logging
+import threading
+import time
+from concurrent import futures
+from contextlib import contextmanager
+
+from mopidy_tunein import cache
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline:
+    """
+    Time budget, in seconds, shared by every step of resolving a station.
+
+    Steps take at most :meth:`timeout` for themselves and record the time
+    they spend with :meth:`phase`. The phase running when the budget ran
+    out is kept in ``exhausted_by``.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires = self.started + budget
+        self.phases = {}
+        self.exhausted_by = None
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def timeout(self, limit=None):
+        """Return the remaining budget, capped at ``limit`` seconds."""
+        remaining = self.remaining()
+        return remaining if limit is None else min(limit, remaining)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + (
+                    time.monotonic() - start
+                )
+                if self.exhausted_by is None and self.expired():
+                    self.exhausted_by = name
+
+    def summary(self):
+        with self._lock:
+            phases = ", ".join(
+                f"{name} {spent:.3f}s" for name, spent in self.phases.items()
+            )
+        return f"{self.elapsed():.3f}s of {self.budget:.3f}s ({phases})"
+
+
+def race(candidates, probe, executor, deadline=None):
+    """
+    Probe stream ``candidates`` concurrently and return the first playable.
+
+    ``probe(uri)`` must return a ``(stream_uri, stream_info, more_uris)``
+    tuple. A truthy ``stream_uri`` wins the race; otherwise any ``more_uris``
+    found (e.g. playlist entries) are probed too. When several probes finish
+    together the one earliest in mirror order wins. Probes still queued when
+    the race is decided, or the ``deadline`` passes, are cancelled and those
+    already running are ignored.
+    """
+
+    order = itertools.count()
+    pending = {}
+    seen = set()
+
+    def submit(uri):
+        if uri not in seen:
+            seen.add(uri)
+            pending[executor.submit(probe, uri)] = next(order)
+
+    for uri in candidates:
+        submit(uri)
+
+    try:
+        while pending:
+            done, _ = futures.wait(
+                pending,
+                timeout=deadline and deadline.remaining(),
+                return_when=futures.FIRST_COMPLETED,
+            )
+            if not done:
+                logger.debug("Timed out probing TuneIn streams")
+                break
+            for future in sorted(done, key=pending.get):
+                del pending[future]
+                try:
+                    stream_uri, stream_info, more_uris = future.result()
+                except Exception as e:
+                    logger.debug(f"TuneIn stream probe failed: {e}")
+                    continue
+                if stream_uri:
+                    return stream_uri, stream_info
+                for uri in more_uris:
+                    submit(uri)
+    finally:
+        for future in pending:
+            future.cancel()
+    return None, None
+
+
+# Stands in for the scan result of a radio stream recognised from its
+# headers or first bytes, which Mopidy would otherwise not know is live.
+LiveStream = collections.namedtuple(
+    "LiveStream", "uri playable seekable", defaults=(True, False)
+)
+
+
+def is_live(stream_info, uri):
+    """Whether the scan result ``stream_info`` is of a live stream ``uri``."""
+    return (
+        stream_info is not None
+        and stream_info.uri == uri
+        and stream_info.playable
+        and not stream_info.seekable
+    )
+
+
+class StreamCache:
+    """
+    Streams recently resolved for stations, so playing one again skips
+    tuning and probing.
+
+    Up to ``max_entries`` streams are kept for ``ttl`` seconds. The stream
+    being played is forgotten if playback stops before it started, or it
+    reaches its end, which radio streams only do when something went wrong.
+    The station is then resolved afresh the next time it is played.
+    """
+
+    def __init__(self, max_entries=20, ttl=600):
+        self._streams = cache.LRUCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._playing = None
+        self._started = False
+
+    def __len__(self):
+        return len(self._streams)
+
+    def get(self, station_id, count=True):
+        """Return the ``(uri, stream_info)`` cached for ``station_id``."""
+        entry = self._streams.lookup(station_id, count=count)
+        return None if entry is None else entry.value
+
+    def set(self, station_id, uri, stream_info):
+        self._streams.set(station_id, (uri, stream_info))
+
+    def discard(self, station_id):
+        if self._streams.pop(station_id) is not None:
+            logger.debug(f"Discarded cached stream for {station_id}")
+
+    def playing(self, station_id, uri):
+        """Note that ``uri`` is about to be played for ``station_id``."""
+        with self._lock:
+            self._playing = (station_id, uri) if uri else None
+            self._started = False
+
+    def started(self, uri):
+        with self._lock:
+            if self._playing is not None and self._playing[1] == uri:
+                self._started = True
+
+    def stopped(self):
+        with self._lock:
+            playing, started = self._playing, self._started
+            self._playing = None
+        if playing is not None and not started:
+            self.discard(playing[0])
+
+    def ended(self):
+        with self._lock:
+            playing, self._playing = self._playing, None
+        if playing is not None:
+            self.discard(playing[0])
+
+
+class Prefetcher:
+    """
+    Resolve upcoming stations in the background.
+
+    When a track starts playing, or the tracklist changes, ``upcoming(tlid,
+    depth)`` is asked on a worker thread for the IDs of up to ``depth``
+    stations following the track ``tlid`` in the tracklist. They are passed
+    to ``resolve`` on a pool of at most ``workers`` threads.
+    """
+
+    def __init__(self, resolve, upcoming, depth=2, workers=2):
+        self._resolve = resolve
+        self._upcoming = upcoming
+        self._depth = depth
+        self._lock = threading.Lock()
+        self._current = None
+        self._pending = set()
+        self._looking_up = 0
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="TuneInPrefetch"
+        )
+        self.prefetched = 0
+        self.failed = 0
+
+    def played(self, tlid):
+        with self._lock:
+            self._current = tlid
+        self._look_ahead(tlid)
+
+    def changed(self):
+        with self._lock:
+            tlid = self._current
+        if tlid is not None:
+            self._look_ahead(tlid)
+
+    def stop(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefetched": self.prefetched,
+                "failed": self.failed,
+                "pending": len(self._pending) + self._looking_up,
+            }
+
+    def _look_ahead(self, tlid):
+        with self._lock:
+            self._looking_up += 1
+        if not self._submit(self._schedule, tlid):
+            with self._lock:
+                self._looking_up -= 1
+
+    def _submit(self, func, *args):
+        try:
+            self._executor.submit(func, *args)
+        except RuntimeError:  # Shut down
+            return False
+        return True
+
+    def _schedule(self, tlid):
+        try:
+            upcoming = self._upcoming(tlid, self._depth)
+        except Exception as e:
+            logger.debug(f"Finding upcoming TuneIn stations failed: {e}")
+            upcoming = []
+        with self._lock:
+            self._looking_up -= 1
+            if tlid != self._current:
+                return  # Something else started playing meanwhile
+            station_ids = [i for i in upcoming if i not in self._pending]
+            self._pending.update(station_ids)
+        for station_id in station_ids:
+            logger.debug(f"Prefetching TuneIn station {station_id}")
+            if not self._submit(self._run, station_id):
+                return
+
+    def _run(self, station_id):
+        try:
+            stream_uri, _ = self._resolve(station_id)
+        except Exception as e:
+            logger.debug(f"Prefetching TuneIn station {station_id} failed: {e}")
+            stream_uri = None
+        with self._lock:
+            self._pending.discard(station_id)
+            if stream_uri:
+                self.prefetched += 1
+            else:
+                self.failed += 1
@@ -0,0 +1,223 @@
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers go first.
+PLAYBACK = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PLAYBACK: "playback",
+    INTERACTIVE: "interactive",
+    BACKGROUND: "background",
+}
+
+
+class QueueTimeout(requests.Timeout):
+    """Gave up waiting for a turn to request a host, so the request was
+    never sent."""
+
+
+class _Host:
+    """Token bucket and queue of requests waiting for one host."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = []
+
+    def refill(self, now):
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+
+class Scheduler:
+    """
+    Rate limit outbound requests per host, serving the most urgent first.
+
+    Each host gets a token bucket refilled at ``rate`` requests per second,
+    holding at most ``burst`` tokens. Requests wait in priority order for a
+    token, so playback goes before interactive browsing, and both before
+    background work. The priority of requests made by a thread is set with
+    :meth:`priority`, and carried over to other threads with :meth:`bind`.
+    A ``rate`` of 0 disables rate limiting.
+    """
+
+    def __init__(self, rate=10, burst=None, max_hosts=256):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.max_hosts = max_hosts
+        self._cond = threading.Condition()
+        self._hosts = OrderedDict()
+        self._order = itertools.count()
+        self._local = threading.local()
+        self._stats = {
+            name: {
+                "requests": 0,
+                "waited": 0,
+                "wait_time": 0.0,
+                "max_wait": 0.0,
+            }
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def current_priority(self):
+        return getattr(self._local, "priority", INTERACTIVE)
+
+    @contextmanager
+    def priority(self, priority):
+        outer = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = outer
+
+    def bind(self, func, priority=None):
+        """Wrap ``func`` to run at ``priority``, by default the current one,
+        whichever thread calls it."""
+        if priority is None:
+            priority = self.current_priority()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.priority(priority):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def acquire(self, url, timeout=None):
+        """Wait for permission to request ``url``, returning the seconds
+        waited. Raises :exc:`QueueTimeout` after ``timeout`` seconds."""
+        priority = self.current_priority()
+        if not self.rate:
+            self._record(priority, 0.0)
+            return 0.0
+        host_name = urlparse(url).netloc.lower()
+        start = time.monotonic()
+        expires = None if timeout is None else start + timeout
+        with self._cond:
+            host = self._host(host_name)
+            ticket = (priority, next(self._order))
+            heapq.heappush(host.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    host.refill(now)
+                    if host.waiting[0] == ticket and host.tokens >= 1:
+                        heapq.heappop(host.waiting)
+                        host.tokens -= 1
+                        break
+                    if expires is not None and now >= expires:
+                        host.waiting.remove(ticket)
+                        heapq.heapify(host.waiting)
+                        raise QueueTimeout(
+                            f"Waited {now - start:.3f}s to request {host_name}"
+                        )
+                    wait = max(0.001, (1 - host.tokens) / self.rate)
+                    if expires is not None:
+                        wait = min(wait, expires - now)
+                    self._cond.wait(wait)
+            finally:
+                # Let the next in line check whether it's their turn.
+                self._cond.notify_all()
+        waited = time.monotonic() - start
+        self._record(priority, waited)
+        if waited > 0.01:
+            logger.debug(f"Waited {waited:.3f}s to request {host_name}")
+        return waited
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                "hosts": len(self._hosts),
+                "queued": sum(len(h.waiting) for h in self._hosts.values()),
+            }
+            for name, counts in self._stats.items():
+                stats[name] = dict(counts)
+        return stats
+
+    def _host(self, name):
+        # Called with the lock held.
+        host = self._hosts.get(name)
+        if host is None:
+            host = self._hosts[name] = _Host(self.rate, self.burst)
+            if len(self._hosts) > self.max_hosts:
+                # Forget a host nobody is waiting for.
+                for old, state in self._hosts.items():
+                    if not state.waiting:
+                        del self._hosts[old]
+                        break
+        else:
+            self._hosts.move_to_end(name)
+        return host
+
+    def _record(self, priority, waited):
+        with self._cond:
+            counts = self._stats[PRIORITY_NAMES[priority]]
+            counts["requests"] += 1
+            if waited > 0.001:
+                counts["waited"] += 1
+            counts["wait_time"] += waited
+            counts["max_wait"] = max(counts["max_wait"], waited)
+
+
+class ScheduledSession(requests.Session):
+    """Session whose requests all go through a :class:`Scheduler`.
+
+    Time spent waiting for the scheduler comes out of the request's timeout.
+    With ``timeouts``, a :class:`~mopidy_tunein.latency.AdaptiveTimeouts`,
+    the timeout is also shortened to what the host usually needs. Each host
+    keeps up to ``pool_size`` connections alive for reuse.
+    """
+
+    def __init__(self, scheduler, pool_size=10, pool_hosts=20, timeouts=None):
+        super().__init__()
+        self.scheduler = scheduler
+        self.timeouts = timeouts
+        adapter = HTTPAdapter(
+            pool_connections=pool_hosts, pool_maxsize=pool_size
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, (int, float)):
+            waited = self.scheduler.acquire(url, timeout=timeout)
+            timeout = max(0.001, timeout - waited)
+            if self.timeouts is not None:
+                timeout = self.timeouts.timeout("http", url, timeout)
+            kwargs["timeout"] = timeout
+        else:
+            self.scheduler.acquire(url)
+        if self.timeouts is None:
+            return super().request(method, url, *args, **kwargs)
+
+        start = time.monotonic()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.Timeout:
+            self.timeouts.failed("http", url, time.monotonic() - start)
+            raise
+        except requests.ConnectionError:
+            self.timeouts.failed("http", url)
+            raise
+        self.timeouts.observe("http", url, time.monotonic() - start)
+        return response
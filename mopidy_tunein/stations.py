@@ -0,0 +1,86 @@
+import logging
+
+from mopidy_tunein.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class Station:
+    """Compact record of the station fields used by the translator.
+
+    Supports the read-only parts of the dict interface so it can be used in
+    place of the raw TuneIn JSON item. Missing fields are stored as ``None``
+    and behave as absent keys.
+    """
+
+    __slots__ = ("guide_id", "text", "subtext", "image", "URL", "type")
+
+    def __init__(self, item):
+        for field in self.__slots__:
+            setattr(self, field, item.get(field))
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def __repr__(self):
+        return f"Station(guide_id={self.guide_id!r}, text={self.text!r})"
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class StationStore:
+    """Bounded registry of stations seen while browsing and searching.
+
+    The least recently used stations are dropped once ``max_entries`` is
+    reached. Station IDs TuneIn doesn't know are remembered for
+    ``negative_ttl`` seconds so they aren't described over and over.
+    """
+
+    def __init__(self, max_entries=5000, negative_ttl=60):
+        self._stations = LRUCache(
+            max_entries=max_entries, ttl=float("inf"), sweep=0
+        )
+        self._unknown = LRUCache(
+            max_entries=max_entries, ttl=negative_ttl, sweep=0
+        )
+
+    def __contains__(self, station_id):
+        return station_id in self._stations
+
+    def __len__(self):
+        return len(self._stations)
+
+    def add(self, item):
+        station = item if isinstance(item, Station) else Station(item)
+        self._stations.set(station.guide_id, station)
+        self._unknown.pop(station.guide_id)
+        return station
+
+    def get(self, station_id):
+        return self._stations.get(station_id)
+
+    def mark_unknown(self, station_id):
+        logger.debug(f"Remembering unknown station {station_id}")
+        self._unknown.set(station_id, True)
+
+    def is_unknown(self, station_id):
+        return station_id in self._unknown
+
+    def clear(self):
+        self._stations.clear()
+        self._unknown.clear()
+
+    def stats(self):
+        stats = self._stations.stats()
+        stats["unknown"] = len(self._unknown)
+        return stats
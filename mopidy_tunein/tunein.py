@@ -1,15 +1,24 @@
-import configparser
 import io
 import logging
 import re
+import threading
 import time
+import types
 import xml.etree.ElementTree as elementtree  # noqa: N813
 from collections import OrderedDict
+from concurrent import futures
 from contextlib import closing
 from urllib.parse import urlparse
 
 import requests
 
+from mopidy_tunein.breaker import CircuitBreaker
+from mopidy_tunein.cache import DependencyMap, LRUCache, SingleFlight
+from mopidy_tunein.metrics import COUNTER, GAUGE, Family
+from mopidy_tunein.resolver import Deadline
+from mopidy_tunein.scheduler import QueueTimeout
+from mopidy_tunein.stations import StationStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,117 +26,309 @@ class PlaylistError(Exception):
     pass
 
 
+# Returned by conditional requests when the cached value is still current.
+NOT_MODIFIED = object()
+
+# Returned by API requests that failed, as opposed to an empty answer.
+FAILED = types.MappingProxyType({})
+
+
 class cache:  # noqa N801
     # TODO: merge this to util library (copied from mopidy-spotify)
 
-    def __init__(self, ctl=0, ttl=3600):
-        self.cache = {}
+    def __init__(
+        self, ctl=0, ttl=3600, persist=False, grace=0, conditional=False
+    ):
         self.ctl = ctl
         self.ttl = ttl
-        self._call_count = 0
+        self.persist = persist
+        self.grace = grace
+        # Conditional functions are passed the ``validators`` they returned
+        # last time, with their value, and may return NOT_MODIFIED.
+        self.conditional = conditional
 
     def __call__(self, func):
-        def _memoized(*args):
-            now = time.time()
-            try:
-                value, last_update = self.cache[args]
-                age = now - last_update
-                if self._call_count > self.ctl or age > self.ttl:
-                    self._call_count = 0
-                    raise AttributeError
-                if self.ctl:
-                    self._call_count += 1
-                return value
+        self.func = func
+        self.name = func.__name__
+        return self
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return _CachedMethod(self, obj)
+
+    def store(self, obj):
+        # Each instance gets its own bounded store, sized by the instance's
+        # optional ``_cache_options``.
+        stores = obj.__dict__.setdefault("_caches", {})
+        try:
+            return stores[self.name]
+        except KeyError:
+            options = getattr(obj, "_cache_options", {})
+            return stores.setdefault(
+                self.name, LRUCache(ttl=self.ttl, grace=self.grace, **options)
+            )
+
+    def flight(self, obj):
+        flights = obj.__dict__.setdefault("_flights", {})
+        try:
+            return flights[self.name]
+        except KeyError:
+            return flights.setdefault(self.name, SingleFlight())
 
-            except (KeyError, AttributeError):
-                value = func(*args)
-                if value:
-                    self.cache[args] = (value, now)
-                return value
+    def backend(self, obj):
+        if self.persist:
+            return getattr(obj, "_cache_backend", None)
+
+    def revalidator(self, obj):
+        try:
+            return obj.__dict__["_revalidator"]
+        except KeyError:
+            return obj.__dict__.setdefault(
+                "_revalidator",
+                futures.ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="TuneInRevalidate"
+                ),
+            )
 
-            except TypeError:
-                return func(*args)
 
-        def clear():
-            self.cache.clear()
+class _CachedMethod:
+    __slots__ = ("_cache", "_obj")
 
-        _memoized.clear = clear
-        return _memoized
+    def __init__(self, cache, obj):
+        self._cache = cache
+        self._obj = obj
 
+    def __call__(self, *args, **kwargs):
+        # Keyword arguments, e.g. a deadline, are not part of the cache key.
+        try:
+            hash(args)
+        except TypeError:
+            return self._invoke(args, kwargs)[0]
+
+        dependencies = getattr(self._obj, "_dependencies", None)
+        if dependencies is not None:
+            dependencies.used((self._cache.name, args))
+        store = self._cache.store(self._obj)
+        entry = store.lookup(args)
+        if entry is not None and not (
+            self._cache.ctl and entry.uses > self._cache.ctl
+        ):
+            return entry.value
+        if entry is None:
+            value = self._restore(store, args)
+            if value is not None:
+                return value
 
-def parse_m3u(data):
-    # Copied from mopidy.audio.playlists
-    # Mopidy version expects a header but it's not always present
+        # Concurrent misses for the same key share one upstream request.
+        flight = self._cache.flight(self._obj)
+        return flight.do(args, self._fetch, store, args, kwargs, entry is None)
+
+    def _fetch(self, store, args, kwargs, missing):
+        if missing:
+            # Another caller may have filled the entry while we waited.
+            entry = store.lookup(args, count=False)
+            if entry is not None:
+                return entry.value
+        backend = self._cache.backend(self._obj)
+        if backend is None:
+            value = self._call(store, args, kwargs)
+            return value or self._stale(store, args) or value
+        # Processes sharing the backend wait for each other's requests.
+        with backend.lock(self._cache.name, args):
+            saved = None
+            if missing:
+                saved = backend.get(self._cache.name, args)
+                if saved is not None and self._fresh(saved[1]):
+                    store.set(args, saved[0], stored=saved[1])
+                    return saved[0]
+            value = self._call(store, args, kwargs)
+            if value:
+                backend.put(self._cache.name, args, value, time.time())
+                return value
+        return self._stale(store, args, saved) or value
+
+    def _call(self, store, args, kwargs):
+        previous = store.lookup(args, count=False, stale=True)
+        value, validators = self._invoke(args, kwargs, previous)
+        if value is NOT_MODIFIED:
+            if store.refresh(args) is None:
+                store.set(args, previous.value, validators=previous.validators)
+            return previous.value
+        if value:
+            store.set(args, value, validators=validators)
+        return value
+
+    def _invoke(self, args, kwargs, previous=None):
+        if not self._cache.conditional:
+            return self._cache.func(self._obj, *args, **kwargs), None
+        validators = previous.validators if previous is not None else None
+        return self._cache.func(
+            self._obj, *args, validators=validators, **kwargs
+        )
+
+    def _stale(self, store, args, saved=None):
+        # The call failed, so make do with the last good value, however old.
+        entry = store.lookup(args, count=False, stale=True)
+        if entry is not None:
+            logger.debug(f"Using stale {self._cache.name}{args}")
+            return entry.value
+        if saved is not None:
+            logger.debug(f"Using stale {self._cache.name}{args}")
+            return saved[0]
+        return None
+
+    def _fresh(self, stored):
+        return time.time() - stored <= self._cache.ttl
+
+    def _restore(self, store, args):
+        # Fall back to the backend, which may have been filled by a previous
+        # run or another process. Entries older than the TTL are still used
+        # but refreshed in the background.
+        backend = self._cache.backend(self._obj)
+        if backend is None:
+            return None
+        saved = backend.get(self._cache.name, args)
+        if saved is None:
+            return None
+        value, stored = saved
+        if self._fresh(stored):
+            store.set(args, value, stored=stored)
+        else:
+            logger.debug(f"Revalidating stale {self._cache.name}{args}")
+            flight = self._cache.flight(self._obj)
+            try:
+                self._cache.revalidator(self._obj).submit(
+                    flight.do, args, self._fetch, store, args, {}, True
+                )
+            except RuntimeError:  # Shut down
+                pass
+        return value
+
+    def invalidate(self, *args):
+        self._cache.store(self._obj).pop(args)
+        backend = self._cache.backend(self._obj)
+        if backend is not None:
+            backend.delete(self._cache.name, args)
+
+    def clear(self):
+        self._cache.store(self._obj).clear()
+        backend = self._cache.backend(self._obj)
+        if backend is not None:
+            backend.clear(self._cache.name)
+
+    def stats(self):
+        stats = self._cache.store(self._obj).stats()
+        flight = self._cache.flight(self._obj).stats()
+        stats["upstream_calls"] = flight["calls"]
+        stats["coalesced"] = flight["coalesced"]
+        stats["in_flight"] = flight["in_flight"]
+        return stats
+
+
+# Playlist formats, as found by :func:`detect_playlist`. HLS playlists are
+# streams themselves, to be played by GStreamer rather than unwrapped.
+PLS = "pls"
+ASX = "asx"
+M3U = "m3u"
+XSPF = "xspf"
+HLS = "hls"
+
+BOM = b"\xef\xbb\xbf"
+
+
+def _lines(data):
+    # Non-empty lines of text, skipping any that aren't UTF-8.
+    if data.startswith(BOM):
+        data = data[len(BOM) :]
     for line in data.splitlines():
-        if not line.strip() or line.startswith(b"#"):
+        line = line.strip()
+        if not line:
             continue
-
         try:
-            line = line.decode()
+            yield line.decode()
         except UnicodeDecodeError:
             continue
 
-        yield line.strip()
 
+def _ini_options(data, section):
+    """Yield the ``(key, value)`` pairs, keys lower case, from ``section``
+    of INI style ``data``, in one pass and without configparser."""
+    in_section = False
+    for line in _lines(data):
+        if line.startswith("["):
+            in_section = line[1:].rstrip("]").strip().lower() == section
+            continue
+        if not in_section or line.startswith(("#", ";")):
+            continue
+        # Like configparser, split at the first "=" or ":".
+        split = min(
+            (i for i in (line.find("="), line.find(":")) if i > 0), default=-1
+        )
+        if split > 0:
+            yield line[:split].strip().lower(), line[split + 1 :].strip()
+
+
+def parse_m3u(data):
+    # Mopidy's version expects a header but it's not always present
+    for line in _lines(data):
+        if not line.startswith("#"):
+            yield line
 
-def parse_pls(data):
-    # Copied from mopidy.audio.playlists
-    try:
-        cp = configparser.RawConfigParser(strict=False)
-        cp.read_string(data.decode())
-    except configparser.Error:
-        return
 
-    for section in cp.sections():
-        if section.lower() != "playlist":
-            continue
-        for i in range(cp.getint(section, "numberofentries")):
-            try:
-                # TODO: Remove this horrible hack to avoid adverts
-                if cp.has_option(section, f"length{i + 1}"):
-                    if cp.get(section, f"length{i + 1}") == "-1":
-                        yield cp.get(section, f"file{i + 1}").strip("\"'")
-                else:
-                    yield cp.get(section, f"file{i + 1}").strip("\"'")
-            except configparser.NoOptionError:
-                return
+def parse_pls(data):
+    files, lengths, count = {}, {}, None
+    for key, value in _ini_options(data, "playlist"):
+        for prefix, entries in (("file", files), ("length", lengths)):
+            if key.startswith(prefix) and key[len(prefix) :].isdigit():
+                entries[int(key[len(prefix) :])] = value
+        if key == "numberofentries" and value.isdigit():
+            count = int(value)
+
+    indexes = range(1, count + 1) if count is not None else sorted(files)
+    for i in indexes:
+        if i not in files:
+            return
+        # TODO: Remove this horrible hack to avoid adverts
+        if lengths.get(i, "-1") == "-1":
+            yield files[i].strip("\"'")
 
 
 def fix_asf_uri(uri):
+    if "mswmext=.asf" not in uri.lower():
+        return uri
     return re.sub(r"http://(.+\?mswmext=\.asf)", r"mms://\1", uri, flags=re.I)
 
 
 def parse_old_asx(data):
-    try:
-        cp = configparser.RawConfigParser()
-        cp.read_string(data.decode())
-    except configparser.Error:
-        return
+    for key, value in _ini_options(data, "reference"):
+        if key.startswith("ref"):
+            yield fix_asf_uri(value.lower())
 
-    for section in cp.sections():
-        if section.lower() != "reference":
-            continue
-        for option in cp.options(section):
-            if option.lower().startswith("ref"):
-                uri = cp.get(section, option).lower()
-                yield fix_asf_uri(uri.strip())
+
+def _href(element):
+    # Attribute names are case insensitive in ASX too.
+    for name, value in element.attrib.items():
+        if name.lower() == "href":
+            return value.strip()
+    return None
 
 
 def parse_new_asx(data):
-    # Copied from mopidy.audio.playlists
+    # Entries are yielded as their elements end, anything before a syntax
+    # error is kept.
     try:
-        # Last element will be root.
         for _event, element in elementtree.iterparse(io.BytesIO(data)):
-            element.tag = element.tag.lower()  # normalize
+            tag = element.tag.lower()
+            if tag == "ref" or tag == "entry":
+                href = _href(element)
+                if href:
+                    yield fix_asf_uri(href)
+                if tag == "entry":
+                    element.clear()
     except elementtree.ParseError:
         return
 
-    for ref in element.findall("entry/ref[@href]"):
-        yield fix_asf_uri(ref.get("href", "").strip())
-
-    for entry in element.findall("entry[@href]"):
-        yield fix_asf_uri(entry.get("href", "").strip())
-
 
 def parse_asx(data):
     if b"asx" in data[0:50].lower():
@@ -136,6 +337,76 @@ def parse_asx(data):
         return parse_old_asx(data)
 
 
+def parse_xspf(data):
+    try:
+        for _event, element in elementtree.iterparse(io.BytesIO(data)):
+            # Ignore the XML namespace
+            tag = element.tag
+            if tag.endswith("location") and element.text:
+                if tag == "location" or tag.endswith("}location"):
+                    yield element.text.strip()
+    except elementtree.ParseError:
+        return
+
+
+PLAYLIST_PARSERS = {
+    PLS: parse_pls,
+    ASX: parse_asx,
+    M3U: parse_m3u,
+    XSPF: parse_xspf,
+}
+
+PLAYLIST_EXTENSIONS = {
+    ".asx": ASX,
+    ".wax": ASX,
+    ".m3u": M3U,
+    "m3u8": HLS,
+    ".pls": PLS,
+    "xspf": XSPF,
+}
+
+PLAYLIST_TYPES = {
+    "video/x-ms-asf": ASX,
+    "audio/x-ms-wax": ASX,
+    "application/x-mpegurl": M3U,
+    "audio/x-mpegurl": M3U,
+    "audio/mpegurl": M3U,
+    "application/vnd.apple.mpegurl": HLS,
+    "audio/x-scpls": PLS,
+    "application/xspf+xml": XSPF,
+}
+
+
+def sniff_playlist(data):
+    """Find the format of playlist ``data`` from its first bytes."""
+    head = data[:512].lstrip(BOM + b" \t\r\n").lower()
+    if head.startswith(b"[playlist]"):
+        return PLS
+    if head.startswith((b"[reference]", b"<asx")):
+        return ASX
+    if head.startswith((b"<playlist", b"<?xml")):
+        if b"<asx" in head:
+            return ASX
+        if b"<playlist" in head:
+            return XSPF
+        return None
+    if head.startswith(b"#extm3u") and b"#ext-x-" in head:
+        return HLS
+    if head.startswith((b"#extm3u", b"http://", b"https://", b"mms://")):
+        return M3U
+    return None
+
+
+def detect_playlist(data, extension="", content_type=None):
+    """Find the format of playlist ``data``, from its first bytes or else
+    the last four characters of its URL path or its content type."""
+    found = sniff_playlist(data) or PLAYLIST_EXTENSIONS.get(extension.lower())
+    if not found and content_type:
+        mime = content_type.split(";")[0].strip().lower()
+        found = PLAYLIST_TYPES.get(mime)
+    return found
+
+
 # This is all broken: mopidy/mopidy#225
 # from gi.repository import TotemPlParser
 # def totem_plparser(uri):
@@ -153,25 +424,200 @@ def parse_asx(data):
 
 
 def find_playlist_parser(extension, content_type):
-    extension_map = {
-        ".asx": parse_asx,
-        ".wax": parse_asx,
-        ".m3u": parse_m3u,
-        ".pls": parse_pls,
-    }
-    content_type_map = {
-        "video/x-ms-asf": parse_asx,
-        "application/x-mpegurl": parse_m3u,
-        "audio/x-scpls": parse_pls,
-    }
-
-    parser = extension_map.get(extension, None)
-    if not parser and content_type:
-        # Annoying case where the url gave us no hints so try and work it out
-        # from the header's content-type instead.
-        # This might turn out to be server-specific...
-        parser = content_type_map.get(content_type.lower(), None)
-    return parser
+    # Annoying case where the url gave us no hints so try and work it out
+    # from the header's content-type instead.
+    return PLAYLIST_PARSERS.get(detect_playlist(b"", extension, content_type))
+
+
+AUDIO_SIGNATURES = (
+    b"ID3",  # MP3 with ID3v2 tag
+    b"OggS",
+    b"fLaC",
+    b"RIFF",
+    b"ADIF",  # AAC
+    b"\x30\x26\xb2\x75\x8e\x66\xcf\x11",  # ASF/WMA
+)
+
+# What :meth:`TuneIn.classify` found a stream URL to be.
+AUDIO = "audio"
+PLAYLIST = "playlist"
+UNKNOWN = "unknown"
+
+PLAYLIST_CONTENT_TYPES = (
+    "audio/x-scpls",
+    "audio/x-mpegurl",
+    "audio/mpegurl",
+    "audio/x-ms-wax",
+)
+
+
+def is_audio_data(data):
+    """Check whether ``data`` starts like an audio stream rather than a
+    playlist."""
+    if data.startswith(AUDIO_SIGNATURES) or data[4:8] == b"ftyp":
+        return True
+    # MPEG audio (MP3 or ADTS AAC) frame sync
+    if len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0:
+        return True
+    # Playlists are text, so NUL bytes mean some other binary format
+    return b"\x00" in data[:512]
+
+
+def sniff_playlist_parser(data):
+    """Find a parser for playlist ``data`` from its first bytes."""
+    return PLAYLIST_PARSERS.get(sniff_playlist(data))
+
+
+def _is_stream_response(uri, content_type, headers):
+    # Whether a response is the stream itself, before reading its body.
+    logger.debug(f"{uri} has content-type: {content_type}")
+    mime = content_type.split(";")[0].strip().lower()
+    if mime.startswith("audio/") and mime not in PLAYLIST_CONTENT_TYPES:
+        return True
+    if any(h.lower().startswith("icy-") for h in headers):
+        logger.debug(f"{uri} is a Shoutcast/Icecast stream")
+        return True
+    return False
+
+
+class PlaylistReader:
+    """Collect a playlist's body chunk by chunk, giving up if it starts
+    like audio or the ``deadline`` passes, and stopping at ``max_size``
+    bytes."""
+
+    CHUNK = 8192
+
+    def __init__(self, uri, max_size, deadline=None):
+        self.uri = uri
+        self.max_size = max_size
+        self.deadline = deadline
+        self.audio = False
+        self.timed_out = False
+        self._content = []
+        self._size = 0
+
+    def add(self, chunk):
+        """Add ``chunk``, returning whether to carry on reading."""
+        if self.deadline is not None and self.deadline.expired():
+            logger.debug(f"Reading {self.uri} ran out of time")
+            self.timed_out = True
+            return False
+        if not self._content and is_audio_data(chunk):
+            logger.debug(f"{self.uri} looks like an audio stream")
+            self.audio = True
+            return False
+        self._content.append(chunk)
+        self._size += len(chunk)
+        if self._size >= self.max_size:
+            logger.debug(f"{self.uri} exceeds {self._size} bytes, truncating")
+            return False
+        return True
+
+    def data(self):
+        """The playlist read, or :class:`None` if it was audio."""
+        return None if self.audio else b"".join(self._content)
+
+
+def _is_client_error(error):
+    # The request reached TuneIn and was refused, e.g. for an unknown ID.
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        # aiohttp's ClientResponseError has no response, just its status.
+        status = getattr(error, "status", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def conditional_headers(validators):
+    """Request headers asking to skip the body if ``validators`` match."""
+    headers = {}
+    if validators:
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def response_validators(response, size):
+    """Keep a response's ``ETag`` and ``Last-Modified`` for revalidating it
+    later, with the ``size`` of the body they save downloading."""
+    validators = {}
+    etag = response.headers.get("ETag")
+    if etag:
+        validators["etag"] = etag
+    last_modified = response.headers.get("Last-Modified")
+    if last_modified:
+        validators["last_modified"] = last_modified
+    if not validators:
+        return None
+    validators["size"] = size
+    return validators
+
+
+class TransferStats:
+    """Count bytes downloaded from TuneIn and the bytes saved by compressed
+    and conditional requests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(
+            (
+                "responses",
+                "not_modified",
+                "body_bytes",
+                "wire_bytes",
+                "saved_by_compression",
+                "saved_by_revalidation",
+            ),
+            0,
+        )
+
+    def received(self, response, size):
+        try:
+            # Bytes read from the connection, before any decompression
+            wire = int(response.raw.tell())
+        except Exception:
+            wire = size
+        with self._lock:
+            self._counts["responses"] += 1
+            self._counts["body_bytes"] += size
+            self._counts["wire_bytes"] += wire
+            self._counts["saved_by_compression"] += max(0, size - wire)
+
+    def not_modified(self, validators):
+        with self._lock:
+            self._counts["not_modified"] += 1
+            self._counts["saved_by_revalidation"] += (validators or {}).get(
+                "size", 0
+            )
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+# Cache statistics exported as metrics, with a ``cache`` label.
+CACHE_METRICS = {
+    "entries": (GAUGE, "Entries held in the cache."),
+    "bytes": (GAUGE, "Approximate size of the cache."),
+    "hits": (COUNTER, "Cache hits."),
+    "misses": (COUNTER, "Cache misses."),
+    "stale_hits": (COUNTER, "Stale entries served."),
+    "evictions": (COUNTER, "Entries evicted."),
+    "expirations": (COUNTER, "Entries expired."),
+    "upstream_calls": (COUNTER, "Requests made for cache misses."),
+    "coalesced": (COUNTER, "Misses that waited on the same request."),
+}
+
+TRANSFER_METRICS = {
+    "responses": "Responses downloaded from TuneIn.",
+    "not_modified": "Responses TuneIn said had not changed.",
+    "body_bytes": "Bytes of responses from TuneIn, decompressed.",
+    "wire_bytes": "Bytes of responses from TuneIn, as transferred.",
+    "saved_by_compression": "Bytes saved by compressed responses.",
+    "saved_by_revalidation": "Bytes saved by conditional requests.",
+}
 
 
 class TuneIn:
@@ -188,7 +634,18 @@ class TuneIn:
     ID_STREAM = "stream"
     ID_UNKNOWN = "unknown"
 
-    def __init__(self, timeout, filter_=None, session=None):
+    def __init__(
+        self,
+        timeout,
+        filter_=None,
+        session=None,
+        cache_options=None,
+        max_stations=5000,
+        max_playlist_size=512 * 1024,
+        cache_backend=None,
+        breaker_options=None,
+        registry=None,
+    ):
         self._base_uri = "https://opml.radiotime.com/%s"
         self._session = session or requests.Session()
         self._timeout = timeout / 1000.0
@@ -196,13 +653,151 @@ class TuneIn:
             self._filter = f"&filter={filter_[0]}"
         else:
             self._filter = ""
-        self._stations = {}
+        self._stations = StationStore(max_entries=max_stations)
+        self._cache_options = cache_options or {}
+        self._max_playlist_size = max_playlist_size
+        self._cache_backend = cache_backend
+        self._breakers = {}
+        self._breaker_options = breaker_options or {}
+        self._transfer = TransferStats()
+        self._dependencies = DependencyMap()
+        self._api_latency = None
+        if registry is not None:
+            self._api_latency = registry.histogram(
+                "tunein_api_request_seconds",
+                "Time taken by TuneIn API requests.",
+                labels=("variant", "outcome"),
+            )
+            registry.collector(self._collect_metrics)
 
     def reload(self):
         self._stations.clear()
         self._tunein.clear()
         self._get_playlist.clear()
 
+    def busy(self):
+        """Whether any request to TuneIn is in progress."""
+        return any(
+            method.stats()["in_flight"]
+            for method in (self._tunein, self._get_playlist)
+        )
+
+    def upstream_requests(self):
+        """Number of cache misses that have gone to TuneIn so far."""
+        return sum(
+            method.stats()["upstream_calls"]
+            for method in (self._tunein, self._get_playlist)
+        )
+
+    def recording(self, uri):
+        """Remember the API responses used while browsing ``uri``."""
+        return self._dependencies.recording(uri)
+
+    def invalidate(self, uri):
+        """Forget the API responses ``uri`` and the URIs browsed below it
+        were built from. Returns :class:`False` if ``uri`` isn't known."""
+        keys = self._dependencies.pop_subtree(uri)
+        if keys is None:
+            return False
+        logger.debug(f"Invalidating {len(keys)} TuneIn responses for {uri}")
+        for name, args in keys:
+            getattr(self, name).invalidate(*args)
+        return True
+
+    def close(self):
+        revalidator = self.__dict__.get("_revalidator")
+        if revalidator is not None:
+            revalidator.shutdown(wait=False)
+        if self._cache_backend is not None:
+            self._cache_backend.close()
+
+    def cache_stats(self):
+        stats = {
+            "api": self._tunein.stats(),
+            "playlist": self._get_playlist.stats(),
+            "stations": self._stations.stats(),
+        }
+        if self._cache_backend is not None:
+            stats["backend"] = self._cache_backend.stats()
+        stats["transfer"] = self._transfer.stats()
+        request_scheduler = getattr(self._session, "scheduler", None)
+        if request_scheduler is not None:
+            stats["scheduler"] = request_scheduler.stats()
+        timeouts = getattr(self._session, "timeouts", None)
+        if timeouts is not None:
+            stats["timeouts"] = timeouts.table()
+        stats["circuits"] = {
+            variant: breaker.stats()
+            for variant, breaker in list(self._breakers.items())
+        }
+        return stats
+
+    def _collect_metrics(self):
+        caches = {
+            "api": self._tunein.stats(),
+            "playlist": self._get_playlist.stats(),
+            "stations": self._stations.stats(),
+        }
+        families = [
+            Family(
+                f"tunein_cache_{key}" + ("_total" if type_ == COUNTER else ""),
+                type_,
+                help_,
+                [
+                    ({"cache": cache}, stats[key])
+                    for cache, stats in caches.items()
+                    if key in stats
+                ],
+            )
+            for key, (type_, help_) in CACHE_METRICS.items()
+        ]
+        transfer = self._transfer.stats()
+        families.extend(
+            Family(
+                f"tunein_transfer_{key}_total",
+                COUNTER,
+                help_,
+                [({}, transfer[key])],
+            )
+            for key, help_ in TRANSFER_METRICS.items()
+        )
+        circuits = {
+            variant: breaker.stats()
+            for variant, breaker in list(self._breakers.items())
+        }
+        families.append(
+            Family(
+                "tunein_circuit_open",
+                GAUGE,
+                "Whether requests to a TuneIn API endpoint are held back.",
+                [
+                    (
+                        {"variant": variant},
+                        int(stats["state"] != CircuitBreaker.CLOSED),
+                    )
+                    for variant, stats in circuits.items()
+                ],
+            )
+        )
+        families.append(
+            Family(
+                "tunein_circuit_rejected_total",
+                COUNTER,
+                "Requests not made while an endpoint was failing.",
+                [
+                    ({"variant": variant}, stats["rejected"])
+                    for variant, stats in circuits.items()
+                ],
+            )
+        )
+        return families
+
+    def _observe_api(self, variant, outcome, start):
+        if self._api_latency is not None:
+            self._api_latency.observe(
+                time.monotonic() - start, variant, outcome
+            )
+
     def _flatten(self, data):
         results = []
         for item in data:
@@ -225,7 +820,7 @@ class TuneIn:
                 return
             else:
                 station = item
-            self._stations[station["guide_id"]] = station
+            self._stations.add(station)
             results.append(station)
 
         for item in data:
@@ -239,16 +834,24 @@ class TuneIn:
         return results
 
     def categories(self, category=""):
+        args = self._category_args(category)
+        if args is None:
+            return []
+        return self._category_results(
+            category, self._tunein("Browse.ashx", args)
+        )
+
+    def _category_args(self, category):
         if category == "location":
-            args = "&id=r0"  # Annoying special case
+            return "&id=r0"  # Annoying special case
         elif category == "language":
-            args = "&c=lang"
-            return []  # TuneIn's API is a mess here, cba
+            return None  # TuneIn's API is a mess here, cba
         else:
-            args = "&c=" + category
+            return "&c=" + category
 
+    def _category_results(self, category, results):
         # Take a copy so we don't modify the cached data
-        results = list(self._tunein("Browse.ashx", args))
+        results = list(results)
         if category in ("podcast", "local"):
             # Flatten the results!
             results = self._filter_results(self._flatten(results))
@@ -268,7 +871,9 @@ class TuneIn:
 
     def locations(self, location):
         args = "&id=" + location
-        results = self._tunein("Browse.ashx", args)
+        return self._location_results(self._tunein("Browse.ashx", args))
+
+    def _location_results(self, results):
         # TODO: Support filters here
         return [x for x in results if x.get("type", "") == "link"]
 
@@ -312,25 +917,58 @@ class TuneIn:
     def _station_info(self, station_id):
         logger.debug(f"Fetching info for station {station_id}")
         args = f"&c=composite&detail=listing&id={station_id}"
-        results = self._tunein("Describe.ashx", args)
+        return self._listing_result(self._tunein("Describe.ashx", args))
+
+    def _listing_result(self, results):
+        if results is FAILED:
+            return FAILED
         listings = self._filter_results(results, "Listing", self._map_listing)
         if listings:
             return listings[0]
 
-    def parse_stream_url(self, url):
+    def parse_stream_url(self, url, deadline=None):
+        if self._is_audio_url(url):
+            return [url]
+        return self.classify(url, deadline=deadline)[1]
+
+    def classify(self, url, deadline=None):
+        """
+        Work out what ``url`` is without scanning it with GStreamer.
+
+        Returns ``(AUDIO, [url])`` when the response headers or first bytes
+        show an audio stream, ``(PLAYLIST, uris)`` with the playlist's
+        entries, or ``(UNKNOWN, [])`` when only a scan can tell. The URL is
+        always requested, as an extension says nothing about whether it
+        answers or is really a redirector playlist.
+        """
         logger.debug(f"Extracting URIs from {url!r}")
+        if deadline is None:
+            deadline = Deadline(self._timeout)
+        with deadline.phase("download"):
+            playlist = self._get_playlist(url, deadline=deadline)
+        return self._playlist_result(url, playlist, deadline)
+
+    def _is_audio_url(self, url):
+        # Catch these easy ones, once scanning them failed
+        return urlparse(url).path[-4:] in [".mp3", ".wma"]
+
+    def _playlist_result(self, url, playlist, deadline):
         extension = urlparse(url).path[-4:]
-        if extension in [".mp3", ".wma"]:
-            return [url]  # Catch these easy ones
+        playlist_data, content_type = playlist or (None, None)
         results = []
-        playlist_data, content_type = self._get_playlist(url)
         if playlist_data:
-            parser = find_playlist_parser(extension, content_type)
+            found = detect_playlist(playlist_data, extension, content_type)
+            if found == HLS:
+                # GStreamer plays HLS itself, segment by segment.
+                logger.debug(f"{url} is an HLS stream")
+                return AUDIO, [url]
+            parser = PLAYLIST_PARSERS.get(found)
             if parser:
                 try:
-                    results = [
-                        u for u in parser(playlist_data) if u and u != url
-                    ]
+                    with deadline.phase("parse"):
+                        results = [
+                            u for u in parser(playlist_data) if u and u != url
+                        ]
                 except Exception as e:
                     logger.error(f"TuneIn playlist parsing failed {e}")
                 if not results:
@@ -339,15 +977,22 @@ class TuneIn:
                         f"Parsing failure, malformed playlist: {playlist_str}"
                     )
         elif content_type:
-            results = [url]
+            logger.debug(f"{url} is an audio stream")
+            return AUDIO, [url]
         logger.debug(f"Got {results}")
-        return list(OrderedDict.fromkeys(results))
+        if not results:
+            return UNKNOWN, []
+        return PLAYLIST, list(OrderedDict.fromkeys(results))
 
-    def tune(self, station):
+    def tune(self, station, deadline=None):
         logger.debug(f'Tuning station id {station["guide_id"]}')
         args = f'&id={station["guide_id"]}'
+        streams = self._tunein("Tune.ashx", args, deadline=deadline)
+        return self._tune_results(station, streams)
+
+    def _tune_results(self, station, streams):
         stream_uris = []
-        for stream in self._tunein("Tune.ashx", args):
+        for stream in streams:
             if "url" in stream:
                 stream_uris.append(stream["url"])
         if not stream_uris:
@@ -355,55 +1000,208 @@ class TuneIn:
         return list(OrderedDict.fromkeys(stream_uris))
 
     def station(self, station_id):
-        if station_id in self._stations:
-            station = self._stations[station_id]
-        else:
-            station = self._station_info(station_id)
-            self._stations["station_id"] = station
+        station = self._stations.get(station_id)
+        if station is None and not self._stations.is_unknown(station_id):
+            station = self._station_result(
+                station_id, self._station_info(station_id)
+            )
         return station
 
+    def _station_result(self, station_id, listing):
+        if listing:
+            return self._stations.add(listing)
+        if listing is not FAILED:
+            # Only TuneIn saying it has no such station is remembered, not
+            # failing to ask it.
+            self._stations.mark_unknown(station_id)
+        return None
+
+    def station_batch(self, station_ids, executor, timeout=None):
+        """
+        Get many stations at once, returning a ``{station_id: station}`` dict.
+
+        Stations not seen before are fetched concurrently on ``executor``.
+        Those still outstanding after ``timeout`` seconds, by default the
+        request timeout, are left out of the results.
+        """
+        results = {}
+        pending = {}
+        for station_id in OrderedDict.fromkeys(station_ids):
+            station = self._stations.get(station_id)
+            if station is not None:
+                results[station_id] = station
+            else:
+                future = executor.submit(self.station, station_id)
+                pending[future] = station_id
+        if not pending:
+            return results
+
+        if timeout is None:
+            timeout = self._timeout
+        done, not_done = futures.wait(pending, timeout=timeout)
+        return self._batch_results(results, pending, done, not_done)
+
+    def _batch_results(self, results, pending, done, not_done):
+        for future in done:
+            try:
+                station = future.result()
+            except Exception as e:
+                logger.info(f"TuneIn station lookup failed: {e}")
+                continue
+            if station:
+                results[pending[future]] = station
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.debug(f"Timed out getting {len(not_done)} TuneIn stations")
+        return results
+
     def search(self, query):
+        args = self._search_args(query)
+        if args is None:
+            return []
+        return self._search_results(self._tunein("Search.ashx", args))
+
+    def _search_args(self, query):
         # "Search.ashx?query=" + query + filterVal
         if not query:
             logger.debug("Empty search query")
-            return []
+            return None
         logger.debug(f"Searching TuneIn for '{query}'")
-        args = f"&query={query}{self._filter}"
-        search_results = self._tunein("Search.ashx", args)
+        return f"&query={query}{self._filter}"
+
+    def _search_results(self, search_results):
         results = []
         for item in self._flatten(search_results):
             if item.get("type", "") == "audio":
                 # Only return stations
-                self._stations[item["guide_id"]] = item
+                self._stations.add(item)
                 results.append(item)
 
         return results
 
-    @cache()
-    def _tunein(self, variant, args):
-        uri = (self._base_uri % variant) + f"?render=json{args}"
-        logger.debug(f"TuneIn request: {uri!r}")
+    def _request_timeout(self, deadline):
+        if deadline is None:
+            return self._timeout
+        return deadline.timeout(self._timeout)
+
+    def _breaker(self, variant):
         try:
-            with closing(self._session.get(uri, timeout=self._timeout)) as r:
+            return self._breakers[variant]
+        except KeyError:
+            return self._breakers.setdefault(
+                variant,
+                CircuitBreaker(f"TuneIn {variant}", **self._breaker_options),
+            )
+
+    # Failed requests return nothing, so the cache serves the last good
+    # response for up to a day while TuneIn is having problems.
+    @cache(persist=True, grace=24 * 3600, conditional=True)
+    def _tunein(self, variant, args, deadline=None, validators=None):
+        uri = self._api_uri(variant, args)
+        timeout, breaker = self._api_attempt(variant, deadline)
+        if not timeout:
+            return FAILED, None
+        start = time.monotonic()
+        try:
+            with closing(
+                self._session.get(
+                    uri,
+                    timeout=timeout,
+                    headers=conditional_headers(validators),
+                )
+            ) as r:
                 r.raise_for_status()
-                return r.json()["body"]
+                if r.status_code == 304:
+                    body = NOT_MODIFIED
+                    self._transfer.not_modified(validators)
+                else:
+                    body = r.json()["body"]
+                    size = len(r.content)
+                    self._transfer.received(r, size)
+                    validators = response_validators(r, size)
         except Exception as e:
-            logger.info(f"TuneIn API request for {variant} failed: {e}")
-        return {}
+            return self._api_failed(variant, breaker, start, e)
+        return self._api_succeeded(variant, breaker, start, body, validators)
 
-    @cache()
-    def _get_playlist(self, uri):
+    def _api_uri(self, variant, args):
+        uri = (self._base_uri % variant) + f"?render=json{args}"
+        logger.debug(f"TuneIn request: {uri!r}")
+        return uri
+
+    def _api_attempt(self, variant, deadline):
+        """Return the timeout and circuit breaker for an API request, or a
+        timeout of :class:`None` if the request shouldn't be made."""
+        timeout = self._request_timeout(deadline)
+        if not timeout:
+            logger.info(f"TuneIn API request for {variant} ran out of time")
+            return None, None
+        breaker = self._breaker(variant)
+        if not breaker.allow():
+            logger.debug(f"Not requesting {variant} while it is failing")
+            return None, None
+        return timeout, breaker
+
+    def _api_failed(self, variant, breaker, start, error):
+        logger.info(f"TuneIn API request for {variant} failed: {error}")
+        self._observe_api(variant, "error", start)
+        if isinstance(error, QueueTimeout):
+            # Our own rate limit, which says nothing about TuneIn.
+            breaker.cancelled()
+        elif _is_client_error(error):
+            breaker.succeeded()
+        else:
+            breaker.failed()
+        return FAILED, None
+
+    def _api_succeeded(self, variant, breaker, start, body, validators):
+        breaker.succeeded()
+        self._observe_api(
+            variant, "not_modified" if body is NOT_MODIFIED else "ok", start
+        )
+        return body, validators
+
+    @cache(persist=True, grace=3600, conditional=True)
+    def _get_playlist(self, uri, deadline=None, validators=None):
         data, content_type = None, None
+        timeout = self._request_timeout(deadline)
+        if not timeout:
+            logger.info(f"TuneIn playlist request for {uri} ran out of time")
+            return None, None
         try:
             # Defer downloading the body until know it's not a stream
             with closing(
-                self._session.get(uri, timeout=self._timeout, stream=True)
+                self._session.get(
+                    uri,
+                    timeout=timeout,
+                    stream=True,
+                    headers=conditional_headers(validators),
+                )
             ) as r:
                 r.raise_for_status()
+                if r.status_code == 304:
+                    self._transfer.not_modified(validators)
+                    return NOT_MODIFIED, validators
                 content_type = r.headers.get("content-type", "audio/mpeg")
-                logger.debug(f"{uri} has content-type: {content_type}")
-                if content_type != "audio/mpeg":
-                    data = r.content
+                if _is_stream_response(uri, content_type, r.headers):
+                    return (data, content_type), None
+                reader = self._read_playlist(uri, r, deadline)
+                if reader.timed_out:
+                    # Half a playlist is no answer, so don't cache it.
+                    return None, None
+                data = reader.data()
+                if data is not None:
+                    self._transfer.received(r, len(data))
+                    validators = response_validators(r, len(data))
         except Exception as e:
+            # Don't cache the failure
             logger.info(f"TuneIn playlist request for {uri} failed: {e}")
-        return (data, content_type)
+            return None, None
+        return (data, content_type), validators
+
+    def _read_playlist(self, uri, response, deadline=None):
+        reader = PlaylistReader(uri, self._max_playlist_size, deadline)
+        for chunk in response.iter_content(chunk_size=PlaylistReader.CHUNK):
+            if not reader.add(chunk):
+                break
+        return reader
@@ -0,0 +1,297 @@
+import asyncio
+import json
+
+import pytest
+
+from mopidy_tunein import aio, latency, tunein
+from mopidy_tunein.breaker import CircuitBreaker
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FakeResponse:
+    def __init__(
+        self, body=b"", content_type="application/json", status=200, delay=0
+    ):
+        self.status = status
+        self.headers = {"content-type": content_type}
+        self.body = body
+        self.delay = delay
+        self.read_chunks = 0
+
+    @classmethod
+    def api(cls, body, **kwargs):
+        return cls(json.dumps({"body": body}).encode(), **kwargs)
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise HTTPError(self.status)
+
+    async def read(self):
+        return self.body
+
+    @property
+    def content(self):
+        return self
+
+    async def iter_chunked(self, size):
+        while True:
+            self.read_chunks += 1
+            yield self.body
+
+
+class FakeSession:
+    """Answer each request with the response for the first matching part
+    of its URL."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+
+    def get(self, uri, headers=None):
+        self.requests.append(uri)
+        for part, response in self.routes.items():
+            if part in uri:
+                return response
+        return FakeResponse(status=404)
+
+
+class FailingSession:
+    def get(self, uri, **kwargs):
+        raise AssertionError(f"Unexpected request for {uri}")
+
+
+STATIONS = [
+    {"guide_id": "s1", "type": "audio", "text": "One"},
+    {"guide_id": "s2", "type": "audio", "text": "Two"},
+]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make(routes, **kwargs):
+    client = tunein.TuneIn(5000, session=FailingSession(), **kwargs)
+    session = FakeSession(routes)
+    return client, aio.AsyncTuneIn(client, session=session), session
+
+
+class TestAsyncTuneIn:
+    def test_shares_cache_with_sync_client(self):
+        sections = [{"key": "stations", "children": STATIONS}]
+        client, async_client, session = make(
+            {"Browse.ashx": FakeResponse.api(sections)}
+        )
+
+        results = run(async_client.stations("g1"))
+
+        assert [r["guide_id"] for r in results] == ["s1", "s2"]
+        assert client.stations("g1") == results
+        assert client.station("s2")["text"] == "Two"
+        assert len(session.requests) == 1
+
+    def test_coalesces_concurrent_requests(self):
+        client, async_client, session = make(
+            {"Search.ashx": FakeResponse.api(STATIONS, delay=0.01)}
+        )
+
+        async def search():
+            return await asyncio.gather(
+                *(async_client.search("jazz") for _ in range(10))
+            )
+
+        results = run(search())
+
+        assert all(r == results[0] for r in results)
+        assert len(results[0]) == 2
+        assert len(session.requests) == 1
+        assert async_client.cache_stats()["async"]["api"]["coalesced"] == 9
+
+    def test_same_results_as_sync_client(self):
+        listing = [
+            {
+                "key": "listing",
+                "children": [
+                    {"guide_id": "s3", "name": "Three", "logo": "x.png"}
+                ],
+            }
+        ]
+        categories = [
+            {"key": "music", "text": "Music", "type": "link"},
+            {"key": "language", "text": "Language", "type": "link"},
+        ]
+        routes = {
+            "Describe.ashx": FakeResponse.api(listing),
+            "Browse.ashx": FakeResponse.api(categories),
+            "Tune.ashx": FakeResponse.api(
+                [{"url": "http://a/"}, {"url": "http://a/"}, {}]
+            ),
+        }
+        client, async_client, session = make(routes)
+
+        async def browse():
+            station = await async_client.station("s3")
+            return (
+                station,
+                await async_client.tune(station),
+                await async_client.categories(),
+                await async_client.categories("language"),
+            )
+
+        station, streams, categories, languages = run(browse())
+
+        # The sync client answers the same from the cached responses.
+        assert station == client.station("s3")
+        assert station["text"] == "Three"
+        assert streams == client.tune(station) == ["http://a/"]
+        assert categories == client.categories()
+        assert [c["key"] for c in categories] == ["music", "trending"]
+        assert languages == []
+        assert len(session.requests) == 3
+
+    def test_station_batch_leaves_out_slow_stations(self):
+        listing = [{"key": "listing", "children": [{"guide_id": "fast"}]}]
+        client, async_client, _ = make(
+            {
+                "id=slow": FakeResponse.api([], delay=5),
+                "id=fast": FakeResponse.api(listing),
+            }
+        )
+        client._stations.add({"guide_id": "known"})
+
+        results = run(
+            async_client.station_batch(
+                ["known", "fast", "slow", "fast"], timeout=0.1
+            )
+        )
+
+        assert sorted(results) == ["fast", "known"]
+
+    def test_failures_trip_the_shared_breaker(self):
+        client, async_client, session = make(
+            {"Browse.ashx": FakeResponse(status=503)},
+            breaker_options={"threshold": 2},
+        )
+
+        async def browse():
+            for n in range(3):
+                await async_client.locations(f"r{n}")
+
+        run(browse())
+
+        circuit = client.cache_stats()["circuits"]["Browse.ashx"]
+        assert circuit["state"] != CircuitBreaker.CLOSED
+        assert len(session.requests) == 2
+
+    def test_client_errors_leave_breaker_closed(self):
+        client, async_client, session = make(
+            {"Describe.ashx": FakeResponse(status=404)},
+            breaker_options={"threshold": 2},
+        )
+
+        async def lookup():
+            for n in range(3):
+                await async_client.station(f"s{n}")
+
+        run(lookup())
+
+        circuit = client.cache_stats()["circuits"]["Describe.ashx"]
+        assert circuit["state"] == CircuitBreaker.CLOSED
+        assert len(session.requests) == 3
+
+    def test_failed_lookup_is_not_remembered(self):
+        client, async_client, session = make(
+            {"Describe.ashx": FakeResponse(status=503)}
+        )
+
+        async def lookup():
+            return [await async_client.station("s1") for _ in range(2)]
+
+        assert run(lookup()) == [None, None]
+        assert not client._stations.is_unknown("s1")
+        assert len(session.requests) == 2
+
+    def test_timeout_is_learned_per_host(self):
+        client, async_client, _ = make(
+            {"Browse.ashx": FakeResponse.api([], delay=5)}
+        )
+        client._session.timeouts = latency.AdaptiveTimeouts()
+        client._timeout = 0.05
+
+        assert run(async_client.locations("r0")) == []
+        [host] = client.cache_stats()["timeouts"]
+        assert host["timeouts"] == 1
+
+
+class TestClassify:
+    def classify(self, response, url="http://a/"):
+        _, async_client, _ = make({url: response})
+        return run(async_client.classify(url))
+
+    def test_audio_content_type(self):
+        response = FakeResponse(b"\xff\xfb", "audio/mpeg")
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+        assert response.read_chunks == 0
+
+    def test_playlist(self):
+        response = FakeResponse(b"http://b/\nhttp://c/\n", "audio/x-mpegurl")
+
+        assert self.classify(response) == (
+            tunein.PLAYLIST,
+            ["http://b/", "http://c/"],
+        )
+
+    def test_sniffed_audio(self):
+        response = FakeResponse(b"OggS\x00", "application/octet-stream")
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+        assert response.read_chunks == 1
+
+    def test_unknown(self):
+        response = FakeResponse(b"<html></html>", "text/html")
+
+        assert self.classify(response) == (tunein.UNKNOWN, [])
+
+    def test_extension_is_not_enough(self):
+        url = "http://a/b.wma"
+        _, async_client, session = make({url: FakeResponse(status=503)})
+
+        assert run(async_client.classify(url)) == (tunein.UNKNOWN, [])
+        assert run(async_client.parse_stream_url(url)) == [url]
+        assert session.requests == [url]
+
+
+def test_against_fake_tunein():
+    pytest.importorskip("aiohttp")
+    from benchmarks.fake_tunein import FakeTuneIn
+
+    async def browse(client):
+        async with aio.AsyncTuneIn(client) as async_client:
+            sections = await async_client.categories("category0")
+            stations = await asyncio.gather(
+                *(async_client.stations(s["guide_id"]) for s in sections)
+            )
+            station = stations[0][0]
+            streams = await async_client.tune(station)
+            return stations, await async_client.parse_stream_url(streams[0])
+
+    with FakeTuneIn(sections=3, stations=2) as fake:
+        client = tunein.TuneIn(5000)
+        client._base_uri = fake.base_uri
+        stations, uris = run(browse(client))
+
+    assert [len(s) for s in stations] == [2, 2, 2]
+    assert uris == [f"http://{fake.host}/stream/s00000000"]
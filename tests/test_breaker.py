@@ -0,0 +1,66 @@
+import time
+
+from mopidy_tunein.breaker import CircuitBreaker
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        assert breaker.allow()
+        breaker.failed()
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker("test", threshold=3)
+        fail(breaker, 2)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        fail(breaker, 1)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.stats()["rejected"] == 1
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker("test", threshold=2)
+        fail(breaker, 1)
+        breaker.succeeded()
+        fail(breaker, 1)
+
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_probe_closes_circuit(self):
+        breaker = CircuitBreaker("test", threshold=1, backoff=0.05)
+        fail(breaker, 1)
+        time.sleep(0.06)
+
+        assert breaker.allow()
+        assert not breaker.allow()  # Only one probe at a time
+        breaker.succeeded()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_cancelled_probe_lets_next_call_probe(self):
+        breaker = CircuitBreaker("test", threshold=1, backoff=10)
+        fail(breaker, 1)
+        breaker._retry_at = 0
+
+        assert breaker.allow()
+        breaker.cancelled()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow()
+
+    def test_failed_probe_backs_off(self):
+        breaker = CircuitBreaker(
+            "test", threshold=1, backoff=10, max_backoff=15
+        )
+        fail(breaker, 1)
+        breaker._retry_at = 0
+        fail(breaker, 1)
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert 14 < breaker.stats()["retry_in"] <= 15
+
+    def test_zero_threshold_never_opens(self):
+        breaker = CircuitBreaker("test", threshold=0)
+        fail(breaker, 10)
+
+        assert breaker.allow()
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mopidy_tunein import cache, tunein
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        store = cache.LRUCache(max_entries=2, sweep=0)
+        store.set("a", 1)
+        store.set("b", 2)
+        store.get("a")
+        store.set("c", 3)
+
+        assert "a" in store
+        assert "b" not in store
+        assert store.stats()["evictions"] == 1
+
+    def test_evicts_by_size(self):
+        store = cache.LRUCache(max_bytes=cache.approx_size("x" * 100) * 2)
+        for key in "abc":
+            store.set(key, "x" * 100)
+
+        assert len(store) == 2
+        assert store.stats()["bytes"] <= store.max_bytes
+
+    def test_expired_entries_are_misses(self):
+        store = cache.LRUCache(ttl=10, sweep=0)
+        store.set("a", 1, stored=time.time() - 11)
+
+        assert store.get("a") is None
+        assert store.stats()["misses"] == 1
+        assert store.stats()["expirations"] == 1
+
+    def test_keeps_stale_entries_for_grace_period(self):
+        store = cache.LRUCache(ttl=10, grace=10, sweep=0)
+        store.set("a", 1, stored=time.time() - 11)
+        store.set("b", 2, stored=time.time() - 21)
+
+        assert store.get("a") is None
+        assert store.lookup("a", stale=True).value == 1
+        assert store.lookup("b", stale=True) is None
+        assert store.sweep() == 0
+
+    def test_sweep_removes_expired(self):
+        store = cache.LRUCache(ttl=10, sweep=0)
+        store.set("old", 1, stored=time.time() - 11)
+        store.set("new", 2)
+
+        assert store.sweep() == 1
+        assert len(store) == 1
+
+    def test_usage_is_per_key(self):
+        store = cache.LRUCache(sweep=0)
+        store.set("a", 1)
+        store.set("b", 2)
+        store.get("a")
+        store.get("a")
+
+        assert store.usage("a") == 2
+        assert store.usage("b") == 0
+        assert store.stats()["hits"] == 2
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    @tunein.cache(ctl=2)
+    def fetch(self, key):
+        self.calls += 1
+        return [key]
+
+
+class TestCacheDecorator:
+    def test_caches_per_instance(self):
+        first, second = Counter(), Counter()
+        first.fetch("a")
+        first.fetch("a")
+        second.fetch("a")
+
+        assert first.calls == 1
+        assert second.calls == 1
+
+    def test_refreshes_after_call_limit(self):
+        counter = Counter()
+        for _ in range(4):
+            counter.fetch("a")
+
+        assert counter.calls == 2
+
+    def test_clear(self):
+        counter = Counter()
+        counter.fetch("a")
+        counter.fetch.clear()
+        counter.fetch("a")
+
+        assert counter.calls == 2
+        assert counter.fetch.stats()["misses"] == 2
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_result(self):
+        flight = cache.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flight.do("k", fetch))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while flight.stats()["coalesced"] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == ["result"] * 5
+        assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+    def test_exception_clears_flight(self):
+        flight = cache.SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("k", fail)
+        assert flight.stats()["in_flight"] == 0
+
+
+class TestDependencyMap:
+    def test_records_keys_used_while_recording(self):
+        dependencies = cache.DependencyMap()
+        dependencies.used("ignored")
+        with dependencies.recording("a"):
+            dependencies.used("k1")
+            dependencies.used("k2")
+
+        assert dependencies.pop_subtree("a") == {"k1", "k2"}
+        assert "a" not in dependencies
+
+    def test_pops_whole_subtree(self):
+        dependencies = cache.DependencyMap()
+        with dependencies.recording("parent") as children:
+            dependencies.used("k1")
+            children.add("child")
+        with dependencies.recording("child") as children:
+            dependencies.used("k2")
+            children.add("parent")  # Cycles are fine
+        with dependencies.recording("other"):
+            dependencies.used("k3")
+
+        assert dependencies.pop_subtree("parent") == {"k1", "k2"}
+        assert dependencies.pop_subtree("missing") is None
+        assert "other" in dependencies
+
+    def test_bounded(self):
+        dependencies = cache.DependencyMap(max_entries=2)
+        for uri in "abc":
+            with dependencies.recording(uri):
+                pass
+
+        assert len(dependencies) == 2
+        assert "a" not in dependencies
+
+
+class TestAsyncSingleFlight:
+    def test_concurrent_calls_share_result(self):
+        flight = cache.AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.do("k", fetch) for _ in range(5))
+            )
+
+        assert asyncio.run(run()) == ["result"] * 5
+        assert len(calls) == 1
+        assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+    def test_cancelled_caller_leaves_flight_running(self):
+        flight = cache.AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("k", fetch))
+            follower = asyncio.ensure_future(flight.do("k", fetch))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(run()) == "result"
+
+    def test_failure_is_shared_and_forgotten(self):
+        flight = cache.AsyncSingleFlight()
+
+        async def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(flight.do("k", fail))
+        assert flight.stats()["in_flight"] == 0
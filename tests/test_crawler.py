@@ -0,0 +1,78 @@
+import threading
+import time
+
+from mopidy.models import Ref
+
+from mopidy_tunein.crawler import Crawler
+
+TREE = {
+    "tunein:root": [
+        Ref.directory(uri="tunein:category:music", name="Music"),
+        Ref.directory(uri="tunein:category:talk", name="Talk"),
+    ],
+    "tunein:category:music": [
+        Ref.directory(uri="tunein:section:g1", name="Pop"),
+        Ref.directory(uri="tunein:category:talk", name="Talk"),
+        Ref.track(uri="tunein:station:s1", name="Station"),
+    ],
+    "tunein:category:talk": [],
+    "tunein:section:g1": [
+        Ref.directory(uri="tunein:section:g2", name="Deeper"),
+    ],
+}
+
+
+class Browser:
+    def __init__(self):
+        self.browsed = []
+
+    def __call__(self, uri):
+        self.browsed.append(uri)
+        return TREE.get(uri, [])
+
+
+class TestCrawler:
+    def test_browses_breadth_first_to_depth(self):
+        browse = Browser()
+        Crawler(browse, depth=3).crawl()
+
+        assert browse.browsed == [
+            "tunein:root",
+            "tunein:category:music",
+            "tunein:category:talk",
+            "tunein:section:g1",
+        ]
+
+    def test_limits_request_rate(self):
+        requests = iter(range(0, 100, 2))
+        crawler = Crawler(
+            Browser(), depth=1, rate=600, requests=lambda: next(requests)
+        )
+        start = time.monotonic()
+        crawler.crawl()
+
+        # Two requests at ten per second
+        assert time.monotonic() - start >= 0.2
+
+    def test_waits_while_busy(self):
+        busy = threading.Event()
+        busy.set()
+        browse = Browser()
+        crawler = Crawler(browse, depth=1, busy=busy.is_set)
+        thread = threading.Thread(target=crawler.crawl)
+        thread.start()
+        time.sleep(0.1)
+        assert browse.browsed == []
+
+        busy.clear()
+        thread.join(timeout=5)
+        assert browse.browsed == ["tunein:root"]
+
+    def test_counts_failures(self):
+        def browse(uri):
+            raise ValueError(uri)
+
+        crawler = Crawler(browse, depth=2)
+        crawler.crawl()
+
+        assert crawler.stats() == {"crawls": 1, "browsed": 0, "failed": 1}
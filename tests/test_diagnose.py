@@ -0,0 +1,97 @@
+from unittest import mock
+
+from mopidy_tunein import diagnose, tunein
+
+
+class FakeClient:
+    def __init__(self, mirrors):
+        self.mirrors = mirrors
+
+    def station(self, station_id):
+        return {"guide_id": station_id, "text": "Radio"}
+
+    def tune(self, station, deadline=None):
+        with deadline.phase("download"):
+            return list(self.mirrors)
+
+    def classify(self, uri, deadline=None):
+        return self.mirrors.get(uri, (tunein.UNKNOWN, []))
+
+    def parse_stream_url(self, uri, deadline=None):
+        return self.classify(uri, deadline=deadline)[1]
+
+
+class TestDiagnose:
+    def test_reports_every_mirror(self):
+        client = FakeClient(
+            {
+                "http://dead/": (tunein.UNKNOWN, []),
+                "http://pls/": (tunein.PLAYLIST, ["http://scanned/"]),
+                "http://audio/": (tunein.AUDIO, ["http://audio/"]),
+            }
+        )
+        unwrap = mock.Mock(
+            side_effect=lambda uri, deadline: (
+                (uri, None) if uri == "http://scanned/" else (None, None)
+            )
+        )
+        report = diagnose.diagnose("s1", client, unwrap, diagnose.Trace())
+
+        assert report["name"] == "Radio"
+        assert report["playable"] == "http://scanned/"
+        assert [
+            (m["uri"], m["outcome"], m["via"]) for m in report["mirrors"]
+        ] == [
+            ("http://dead/", "failed", None),
+            ("http://pls/", "playlist", "fast_path"),
+            ("http://scanned/", "playable", "scan"),
+            ("http://audio/", "playable", "fast_path"),
+        ]
+        assert report["first_playable"] <= report["total"]
+        kinds = [(e["kind"], e["depth"]) for e in report["trace"]]
+        assert kinds[:3] == [("station", 0), ("tune", 0), ("download", 1)]
+        assert "First playable" in diagnose.format_report(report)
+
+    def test_falls_back_like_playback(self):
+        client = FakeClient(
+            {
+                "http://pls/": (tunein.PLAYLIST, ["http://dead/"]),
+                "http://audio/": (tunein.AUDIO, ["http://audio/"]),
+            }
+        )
+        unwrap = mock.Mock(return_value=(None, None))
+        report = diagnose.diagnose(
+            "s1", client, unwrap, diagnose.Trace(), fast_path=False
+        )
+
+        assert report["playable"] == "http://audio/"
+        assert [
+            (m["uri"], m["outcome"], m["via"]) for m in report["mirrors"]
+        ] == [
+            ("http://pls/", "playlist", "parse"),
+            ("http://dead/", "failed", None),
+            ("http://audio/", "playable", "fallback"),
+        ]
+
+    def test_unknown_station(self):
+        client = FakeClient({})
+        client.station = lambda station_id: None
+        report = diagnose.diagnose("s1", client, None, diagnose.Trace())
+
+        assert report["playable"] is None
+        assert report["error"] == "Unknown station"
+        assert "Not playable: Unknown station" in diagnose.format_report(report)
+
+
+class TestTracingSession:
+    def test_records_requests(self):
+        trace = diagnose.Trace()
+        session = mock.Mock()
+        session.request.return_value.status_code = 200
+        session.request.return_value.headers = {"content-type": "audio/mpeg"}
+        traced = diagnose.TracingSession(session, trace)
+        traced.get("http://a/", timeout=1)
+
+        session.request.assert_called_once_with("GET", "http://a/", timeout=1)
+        assert trace.events[0]["target"] == "GET http://a/"
+        assert trace.events[0]["detail"] == "200 audio/mpeg"
@@ -0,0 +1,89 @@
+import queue
+import threading
+
+import pytest
+
+from mopidy_tunein import dispatch
+
+
+class Library:
+    pykka_traversable = True
+
+    def fast(self):
+        return threading.current_thread().name
+
+    def fail(self):
+        raise ValueError("boom")
+
+
+class Actor(dispatch.OffloadingActor):
+    offloaded_calls = frozenset([("library", "fast"), ("library", "fail")])
+
+    def __init__(self, workers, release=None):
+        super().__init__()
+        self.release = release
+        self.library = Library()
+        if workers:
+            self.start_offloading(workers)
+
+    def on_stop(self):
+        self.stop_offloading()
+
+    def slow(self):
+        self.release.wait(5)
+        return threading.current_thread().name
+
+
+@pytest.fixture
+def release():
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+@pytest.fixture
+def proxy(release):
+    ref = Actor.start(workers=2, release=release)
+    yield ref.proxy()
+    release.set()
+    ref.stop()
+
+
+def test_offloaded_call_does_not_wait_for_actor(proxy, release):
+    slow = proxy.slow()
+    fast = proxy.library.fast()
+
+    assert fast.get(timeout=1).startswith("ActorWorker")
+    release.set()
+    assert not slow.get(timeout=5).startswith("ActorWorker")
+
+
+def test_offloaded_exception_is_returned(proxy):
+    with pytest.raises(ValueError):
+        proxy.library.fail().get(timeout=1)
+
+
+def test_runs_on_actor_thread_without_workers():
+    ref = Actor.start(workers=0)
+    try:
+        name = ref.proxy().library.fast().get(timeout=1)
+    finally:
+        ref.stop()
+
+    assert not name.startswith("ActorWorker")
+
+
+class PlainInboxActor(Actor):
+    @staticmethod
+    def _create_actor_inbox():
+        return queue.Queue()
+
+
+def test_runs_on_actor_thread_without_inbox_hook():
+    ref = PlainInboxActor.start(workers=2)
+    try:
+        name = ref.proxy().library.fast().get(timeout=1)
+    finally:
+        ref.stop()
+
+    assert not name.startswith("PlainInboxActorWorker")
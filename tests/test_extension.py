@@ -19,3 +19,33 @@ class ExtensionTest(unittest.TestCase):
 
         self.assertIn("timeout", schema)
         self.assertIn("filter", schema)
+        self.assertIn("cache_max_entries", schema)
+        self.assertIn("cache_max_bytes", schema)
+        self.assertIn("resolve_workers", schema)
+        self.assertIn("stream_cache_size", schema)
+        self.assertIn("stream_cache_ttl", schema)
+        self.assertIn("prefetch_depth", schema)
+        self.assertIn("prefetch_workers", schema)
+        self.assertIn("lookup_workers", schema)
+        self.assertIn("station_cache_size", schema)
+        self.assertIn("playlist_max_size", schema)
+        self.assertIn("library_workers", schema)
+        self.assertIn("persistent_cache", schema)
+        self.assertIn("persistent_cache_max_age", schema)
+        self.assertIn("cache_backend", schema)
+        self.assertIn("cache_shared_path", schema)
+        self.assertIn("circuit_breaker_threshold", schema)
+        self.assertIn("circuit_breaker_max_backoff", schema)
+        self.assertIn("crawl_depth", schema)
+        self.assertIn("crawl_rate", schema)
+        self.assertIn("crawl_interval", schema)
+        self.assertIn("request_rate", schema)
+        self.assertIn("request_burst", schema)
+        self.assertIn("connection_pool_size", schema)
+        self.assertIn("adaptive_timeouts", schema)
+        self.assertIn("timeout_floor", schema)
+        self.assertIn("mirror_penalty", schema)
+        self.assertIn("mirror_verify_interval", schema)
+        self.assertIn("stream_fast_path", schema)
+        self.assertIn("metrics_file", schema)
+        self.assertIn("metrics_interval", schema)
@@ -0,0 +1,51 @@
+import pytest
+
+from benchmarks.fake_tunein import FakeTuneIn
+from mopidy_tunein import tunein
+
+
+@pytest.fixture
+def fake():
+    with FakeTuneIn(categories=2, sections=2, stations=3, dead_mirrors=1) as f:
+        yield f
+
+
+@pytest.fixture
+def client(fake):
+    client = tunein.TuneIn(5000)
+    client._base_uri = fake.base_uri
+    return client
+
+
+class TestFakeTuneIn:
+    def test_browse(self, client):
+        categories = client.categories()
+        sections = client.categories(categories[0]["key"])
+        stations = client.stations(sections[0]["guide_id"])
+
+        assert len(categories) == 3  # and Trending
+        assert len(sections) == 2
+        assert [s["guide_id"] for s in stations] == [
+            "s00000000",
+            "s00000001",
+            "s00000002",
+        ]
+
+    def test_tune(self, fake, client):
+        station = client.station("s00010002")
+        uris = client.tune(station)
+
+        assert station["text"] == "Station s00010002"
+        assert uris[0].startswith(f"http://{fake.dead_host}/")
+        assert client.classify(uris[0]) == (tunein.UNKNOWN, [])
+        kind, streams = client.classify(uris[1])
+        assert kind == tunein.PLAYLIST
+        assert client.classify(streams[0]) == (tunein.AUDIO, streams)
+
+    def test_failures(self, client):
+        with FakeTuneIn(failure_rate=1) as failing:
+            client._base_uri = failing.base_uri
+            categories = client.categories()
+
+        assert [c["key"] for c in categories] == ["trending"]
+        assert failing.requests == 1
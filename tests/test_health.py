@@ -0,0 +1,70 @@
+from unittest import mock
+
+from mopidy_tunein.health import MirrorHealth, MirrorVerifier
+
+
+class TestMirrorHealth:
+    def test_unknown_mirrors_keep_order(self):
+        health = MirrorHealth()
+        uris = ["http://a/1", "http://b/1", "http://c/1"]
+
+        assert health.order(uris) == uris
+
+    def test_failed_mirrors_go_last(self):
+        health = MirrorHealth()
+        health.failed("http://a/1")
+
+        assert health.order(["http://a/1", "http://b/1"]) == [
+            "http://b/1",
+            "http://a/1",
+        ]
+        assert health.demoted() == ["http://a/1"]
+
+    def test_fastest_mirror_goes_first(self):
+        health = MirrorHealth()
+        health.succeeded("http://a/1", 2.0)
+        health.succeeded("http://b/1", 0.5)
+
+        assert health.order(["http://c/1", "http://a/1", "http://b/1"]) == [
+            "http://b/1",
+            "http://a/1",
+            "http://c/1",
+        ]
+
+    def test_untried_uri_ranked_by_host(self):
+        health = MirrorHealth()
+        health.failed("http://a/1")
+
+        assert health.order(["http://a/2", "http://b/1"]) == [
+            "http://b/1",
+            "http://a/2",
+        ]
+
+    def test_recovers(self):
+        health = MirrorHealth()
+        health.failed("http://a/1")
+        health.succeeded("http://a/1", 1.0)
+
+        assert health.demoted() == []
+
+    def test_failures_forgotten_after_penalty(self):
+        health = MirrorHealth(penalty=0)
+        health.failed("http://a/1")
+
+        assert health.order(["http://a/1", "http://b/1"]) == [
+            "http://a/1",
+            "http://b/1",
+        ]
+
+
+class TestMirrorVerifier:
+    def test_checks_demoted_mirrors(self):
+        health = MirrorHealth()
+        health.failed("http://a/1")
+        health.succeeded("http://b/1", 1.0)
+        check = mock.Mock(side_effect=lambda uri: health.succeeded(uri, 1.0))
+        verifier = MirrorVerifier(health, check)
+        verifier.verify()
+
+        check.assert_called_once_with("http://a/1")
+        assert health.demoted() == []
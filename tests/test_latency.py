@@ -0,0 +1,72 @@
+from mopidy_tunein.latency import AdaptiveTimeouts, LatencyHistogram
+
+
+class TestLatencyHistogram:
+    def test_quantile(self):
+        histogram = LatencyHistogram()
+        for _ in range(19):
+            histogram.add(0.1)
+        histogram.add(5.0)
+
+        assert 0.1 <= histogram.quantile(0.5) < 0.13
+        assert 5.0 <= histogram.quantile(0.99) < 6.3
+
+    def test_follows_recent_samples(self):
+        histogram = LatencyHistogram(decay=0.5)
+        for _ in range(10):
+            histogram.add(5.0)
+        for _ in range(10):
+            histogram.add(0.1)
+
+        assert histogram.quantile(0.95) < 0.13
+
+
+class TestAdaptiveTimeouts:
+    def test_unknown_host_gets_limit(self):
+        timeouts = AdaptiveTimeouts()
+
+        assert timeouts.timeout("http", "http://a/x", 5.0) == 5.0
+
+    def test_learns_from_fast_host(self):
+        timeouts = AdaptiveTimeouts(floor=0.1, min_samples=3)
+        for _ in range(3):
+            timeouts.observe("http", "http://a/x", 0.2)
+
+        assert 0.6 <= timeouts.timeout("http", "http://A/y", 5.0) < 0.8
+        assert timeouts.timeout("http", "http://b/", 5.0) == 5.0
+        assert timeouts.timeout("scan", "http://a/", 5.0) == 5.0
+
+    def test_kept_between_floor_and_limit(self):
+        timeouts = AdaptiveTimeouts(floor=1.0, min_samples=1)
+        timeouts.observe("http", "http://fast/", 0.01)
+        timeouts.observe("http", "http://slow/", 10.0)
+
+        assert timeouts.timeout("http", "http://fast/", 5.0) == 1.0
+        assert timeouts.timeout("http", "http://slow/", 5.0) == 5.0
+
+    def test_dead_host_gets_floor(self):
+        timeouts = AdaptiveTimeouts(floor=1.0, min_samples=2)
+        timeouts.failed("http", "http://dead/", 5.0)
+        assert timeouts.timeout("http", "http://dead/", 5.0) == 5.0
+
+        timeouts.failed("http", "http://dead/")
+        assert timeouts.timeout("http", "http://dead/", 5.0) == 1.0
+
+    def test_timeouts_lengthen_timeout(self):
+        timeouts = AdaptiveTimeouts(floor=0.1, min_samples=1)
+        timeouts.observe("http", "http://a/", 0.1)
+        short = timeouts.timeout("http", "http://a/", 60.0)
+        for _ in range(5):
+            timeouts.failed("http", "http://a/", short)
+
+        assert timeouts.timeout("http", "http://a/", 60.0) > short
+        assert timeouts.table() == [
+            {
+                "kind": "http",
+                "host": "a",
+                "responses": 1,
+                "failures": 5,
+                "timeouts": 5,
+                "p95": timeouts.table()[0]["p95"],
+            }
+        ]
@@ -0,0 +1,132 @@
+import contextlib
+import types
+
+from mopidy.models import Image, Ref
+
+from mopidy_tunein import library
+
+
+class FakeTuneIn:
+    def __init__(self, stations=None, recorded=()):
+        self.stations = stations or {}
+        self.recorded = set(recorded)
+        self.calls = []
+
+    def station(self, station_id):
+        return self.stations.get(station_id)
+
+    def station_batch(self, station_ids, executor, timeout=None):
+        station_ids = list(station_ids)
+        self.calls.append(("station_batch", station_ids))
+        return {i: self.stations[i] for i in station_ids if i in self.stations}
+
+    def categories(self, category=""):
+        return []
+
+    @contextlib.contextmanager
+    def recording(self, uri):
+        self.calls.append(("browse", uri))
+        yield set()
+
+    def reload(self):
+        self.calls.append(("reload",))
+
+    def invalidate(self, uri):
+        self.calls.append(("invalidate", uri))
+        return uri in self.recorded
+
+
+def make_library(tunein_):
+    backend = types.SimpleNamespace(tunein=tunein_, _fetcher=None)
+    return library.TuneInLibrary(backend)
+
+
+class TestGetImages:
+    def test_looks_up_stations_in_one_batch(self):
+        tunein_ = FakeTuneIn(
+            {
+                "s1": {"guide_id": "s1", "image": "http://img/1.png"},
+                "s2": {"guide_id": "s2"},
+            }
+        )
+        provider = make_library(tunein_)
+
+        result = provider.get_images(
+            [
+                "tunein:station:s1",
+                "tunein:station:s2",
+                "tunein:station:s3",
+                "tunein:category:music",
+            ]
+        )
+
+        assert result == {"tunein:station:s1": [Image(uri="http://img/1.png")]}
+        assert tunein_.calls == [("station_batch", ["s1", "s2", "s3"])]
+
+    def test_no_stations(self):
+        provider = make_library(FakeTuneIn())
+
+        assert provider.get_images(["tunein:category:music"]) == {}
+
+
+class TestRefresh:
+    def test_everything(self):
+        tunein_ = FakeTuneIn()
+
+        make_library(tunein_).refresh()
+
+        assert tunein_.calls == [("reload",)]
+
+    def test_root(self):
+        tunein_ = FakeTuneIn()
+
+        make_library(tunein_).refresh("tunein:root")
+
+        assert tunein_.calls == [("reload",)]
+
+    def test_browsed_directory(self):
+        tunein_ = FakeTuneIn(recorded=["tunein:category:music"])
+
+        make_library(tunein_).refresh("tunein:category:music")
+
+        assert tunein_.calls == [("invalidate", "tunein:category:music")]
+
+    def test_directory_not_browsed_since_starting(self):
+        tunein_ = FakeTuneIn()
+
+        make_library(tunein_).refresh("tunein:category:music")
+
+        assert tunein_.calls == [
+            ("invalidate", "tunein:category:music"),
+            ("browse", "tunein:category:music"),
+            ("invalidate", "tunein:category:music"),
+        ]
+
+
+class TestLookup:
+    def test_station(self):
+        station = {
+            "guide_id": "s1",
+            "type": "audio",
+            "text": "Radio One",
+            "URL": "http://opml.radiotime.com/Tune.ashx?id=s1",
+        }
+        tunein_ = FakeTuneIn({"s1": station})
+
+        tracks = make_library(tunein_).lookup("tunein:station:s1")
+
+        assert [track.uri for track in tracks] == ["tunein:station:s1"]
+
+    def test_unknown_station(self):
+        assert make_library(FakeTuneIn()).lookup("tunein:station:s1") == []
+
+    def test_not_a_station(self):
+        provider = make_library(FakeTuneIn())
+
+        assert provider.lookup("tunein:category:music") == []
+
+
+def test_root_directory():
+    assert library.TuneInLibrary.root_directory == Ref.directory(
+        uri="tunein:root", name="TuneIn"
+    )
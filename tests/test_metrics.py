@@ -0,0 +1,67 @@
+import gc
+
+from mopidy_tunein.metrics import COUNTER, Exporter, Family, Registry
+
+
+class TestRegistry:
+    def test_renders_counter(self):
+        registry = Registry()
+        counter = registry.counter("requests_total", "Requests.", ["kind"])
+        counter.inc("a")
+        counter.inc("a", amount=2)
+
+        assert registry.render() == (
+            "# HELP requests_total Requests.\n"
+            "# TYPE requests_total counter\n"
+            'requests_total{kind="a"} 3\n'
+        )
+
+    def test_renders_histogram(self):
+        registry = Registry()
+        histogram = registry.histogram("seconds", "Time.", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(2.5)
+
+        assert registry.render().splitlines()[2:] == [
+            'seconds_bucket{le="0.1"} 1',
+            'seconds_bucket{le="1"} 2',
+            'seconds_bucket{le="+Inf"} 3',
+            "seconds_sum 3.05",
+            "seconds_count 3",
+        ]
+
+    def test_same_name_same_metric(self):
+        registry = Registry()
+
+        assert registry.counter("a", "A.") is registry.counter("a", "A.")
+
+    def test_escapes_labels(self):
+        registry = Registry()
+        registry.counter("a", "A.", ["uri"]).inc('say "hi"\n')
+
+        assert registry.render().splitlines()[-1] == r'a{uri="say \"hi\"\n"} 1'
+
+    def test_collector_goes_away_with_object(self):
+        class Source:
+            def collect(self):
+                return [Family("items", COUNTER, "Items.", [({}, 1)])]
+
+        registry = Registry()
+        source = Source()
+        registry.collector(source.collect)
+        assert "items 1" in registry.render()
+
+        del source
+        gc.collect()
+        assert registry.render() == "\n"
+
+
+class TestExporter:
+    def test_writes_file(self, tmp_path):
+        registry = Registry()
+        registry.counter("a", "A.").inc()
+        path = tmp_path / "tunein.prom"
+        Exporter(registry, path).export()
+
+        assert path.read_text().endswith("a 1\n")
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import pytest
+
+from mopidy_tunein import persist, tunein
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = persist.Snapshot(tmp_path / "cache.sqlite3", flush_delay=0)
+    yield snapshot
+    snapshot.close()
+
+
+class TestSnapshot:
+    def test_survives_reopening(self, tmp_path, snapshot):
+        stored = time.time()
+        snapshot.put("_tunein", ("Browse.ashx", "&c=music"), [{"a": 1}], stored)
+        snapshot.close()
+
+        reopened = persist.Snapshot(tmp_path / "cache.sqlite3")
+        saved = reopened.get("_tunein", ("Browse.ashx", "&c=music"))
+        reopened.close()
+
+        assert saved == ([{"a": 1}], stored)
+
+    def test_pending_writes_are_readable(self, snapshot):
+        snapshot.put("_tunein", ("a",), [1], time.time())
+
+        assert snapshot.get("_tunein", ("a",))[0] == [1]
+
+    def test_ignores_old_entries(self, snapshot):
+        snapshot.max_age = 10
+        snapshot.put("_tunein", ("a",), [1], time.time() - 11)
+        snapshot.flush()
+
+        assert snapshot.get("_tunein", ("a",)) is None
+        assert snapshot.stats()["misses"] == 1
+
+    def test_clear(self, snapshot):
+        snapshot.put("_tunein", ("a",), [1], time.time())
+        snapshot.put("other", ("a",), [2], time.time())
+        snapshot.flush()
+        snapshot.clear("_tunein")
+
+        assert snapshot.get("_tunein", ("a",)) is None
+        assert snapshot.get("other", ("a",)) is not None
+
+    @pytest.fixture
+    def encoding(self, tmp_path, monkeypatch):
+        """A snapshot that runs ``during`` while it encodes a batch."""
+        snapshot = persist.Snapshot(tmp_path / "cache.sqlite3", flush_delay=60)
+        encode_rows = persist._encode_rows
+
+        def encode_and_run(batch):
+            rows = encode_rows(batch)
+            snapshot.during()
+            return rows
+
+        monkeypatch.setattr(persist, "_encode_rows", encode_and_run)
+        yield snapshot
+        snapshot.during = lambda: None
+        snapshot.close()
+
+    def test_delete_while_writing(self, encoding):
+        encoding.put("_tunein", ("a",), [1], time.time())
+        encoding.put("_tunein", ("b",), [2], time.time())
+        encoding.during = lambda: encoding.delete("_tunein", ("a",))
+        encoding.flush()
+
+        assert encoding.get("_tunein", ("a",)) is None
+        assert encoding.get("_tunein", ("b",))[0] == [2]
+        assert encoding.stats()["writes"] == 1
+
+    def test_clear_while_writing(self, encoding):
+        encoding.put("_tunein", ("a",), [1], time.time())
+        encoding.put("other", ("a",), [2], time.time())
+        encoding.during = lambda: encoding.clear("_tunein")
+        encoding.flush()
+
+        assert encoding.get("_tunein", ("a",)) is None
+        assert encoding.get("other", ("a",))[0] == [2]
+
+    def test_unusable_path(self, tmp_path):
+        snapshot = persist.Snapshot(tmp_path / "missing" / "cache.sqlite3")
+
+        assert snapshot.get("_tunein", ("a",)) is None
+        snapshot.put("_tunein", ("a",), [1], time.time())
+        snapshot.close()
+
+
+class Counter:
+    def __init__(self, backend):
+        self._cache_backend = backend
+        self.calls = 0
+
+    @tunein.cache(ttl=10, persist=True)
+    def fetch(self, key):
+        self.calls += 1
+        return [key, self.calls]
+
+
+class TestPersistentCache:
+    def test_saves_responses(self, snapshot):
+        Counter(snapshot).fetch("a")
+        counter = Counter(snapshot)
+
+        assert counter.fetch("a") == ["a", 1]
+        assert counter.calls == 0
+
+    def test_refreshes_stale_responses(self, snapshot):
+        snapshot.put("fetch", ("a",), ["a", 0], time.time() - 11)
+        counter = Counter(snapshot)
+
+        assert counter.fetch("a") == ["a", 0]
+        counter._revalidator.shutdown(wait=True)
+        assert counter.calls == 1
+        assert counter.fetch("a") == ["a", 1]
+        assert snapshot.get("fetch", ("a",))[0] == ["a", 1]
+
+    def test_clear_removes_saved_responses(self, snapshot):
+        counter = Counter(snapshot)
+        counter.fetch("a")
+        counter.fetch.clear()
+        counter.fetch("a")
+
+        assert counter.calls == 2
+
+
+class TestSharedCache:
+    def test_shared_between_instances(self, tmp_path):
+        first = persist.SharedCache(tmp_path / "shared.sqlite3")
+        second = persist.SharedCache(tmp_path / "shared.sqlite3")
+        first.put("_get_playlist", ("a",), (b"[playlist]", "x"), time.time())
+
+        assert second.get("_get_playlist", ("a",))[0] == [b"[playlist]", "x"]
+        first.close()
+        second.close()
+
+    def test_one_instance_fetches(self, tmp_path):
+        calls = []
+
+        class Fetcher:
+            def __init__(self):
+                self._cache_backend = persist.SharedCache(
+                    tmp_path / "shared.sqlite3"
+                )
+
+            @tunein.cache(persist=True)
+            def fetch(self, key):
+                calls.append(key)
+                time.sleep(0.2)
+                return [key]
+
+        fetchers = [Fetcher() for _ in range(3)]
+        results = []
+        threads = [
+            threading.Thread(target=lambda f=f: results.append(f.fetch("a")))
+            for f in fetchers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ["a"]
+        assert results == [["a"]] * 3
+        for fetcher in fetchers:
+            fetcher._cache_backend.close()
+
+    def test_threads_share_lock_files(self, tmp_path):
+        path = tmp_path / "shared.sqlite3"
+        shared = persist.SharedCache(path, lock_slots=1)
+        other = persist.SharedCache(path, lock_slots=1, lock_timeout=0.1)
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with shared.lock("_tunein", ("a",)):
+                held.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            held.wait(5)
+            # Another key in this process doesn't wait for the same file...
+            with shared.lock("_tunein", ("b",)):
+                pass
+            # ...but another process does.
+            with other.lock("_tunein", ("b",)):
+                pass
+        finally:
+            release.set()
+            thread.join()
+
+        assert shared.stats()["lock_waits"] == 0
+        assert other.stats()["lock_timeouts"] == 1
+        shared.close()
+        other.close()
@@ -0,0 +1,318 @@
+import collections
+import threading
+import types
+from concurrent import futures
+
+import pytest
+import requests
+from mopidy import exceptions
+
+from mopidy_tunein import health, playback, scheduler, tunein
+
+ScanResult = collections.namedtuple("ScanResult", "uri mime playable seekable")
+
+
+class FakeTuneIn:
+    def __init__(self, streams, kinds=None, playlists=None):
+        self.streams = streams
+        self.kinds = kinds or {}
+        self.playlists = playlists or {}
+        self.tuned = collections.Counter()
+
+    def station(self, station_id):
+        if station_id in self.streams:
+            return {"guide_id": station_id, "text": station_id}
+
+    def tune(self, station, deadline=None):
+        self.tuned[station["guide_id"]] += 1
+        return list(self.streams[station["guide_id"]])
+
+    def classify(self, url, deadline=None):
+        return self.kinds.get(url, (tunein.UNKNOWN, []))
+
+    def parse_stream_url(self, url, deadline=None):
+        return self.playlists.get(url, [])
+
+
+class FakeScanner:
+    def __init__(self, playable=()):
+        self.playable = set(playable)
+        self.scanned = []
+
+    def scan(self, uri, timeout=None):
+        self.scanned.append(uri)
+        if uri not in self.playable:
+            raise exceptions.ScannerError(f"Cannot scan {uri}")
+        return ScanResult(uri, "audio/mpeg", True, False)
+
+
+class FakeSession:
+    def get(self, uri, **kwargs):
+        raise requests.ConnectionError(f"Cannot download {uri}")
+
+
+def make_playback(tunein_, scanner=None, fast_path=True):
+    backend = types.SimpleNamespace(
+        tunein=tunein_,
+        _scanner=scanner or FakeScanner(),
+        _session=FakeSession(),
+        _scheduler=scheduler.Scheduler(rate=0),
+        _health=health.MirrorHealth(),
+        _resolver=None,
+        _timeout=5000,
+        _timeouts=None,
+        _stream_cache_size=10,
+        _stream_cache_ttl=600,
+        _stream_fast_path=fast_path,
+    )
+    return playback.TuneInPlayback(audio=None, backend=backend)
+
+
+def failing(provider, uri):
+    return uri in provider.backend._health.demoted()
+
+
+class TestTranslateUri:
+    def test_audio_found_by_fast_path_is_live(self):
+        provider = make_playback(
+            FakeTuneIn(
+                {"s1": ["http://a/live"]},
+                kinds={"http://a/live": (tunein.AUDIO, [])},
+            )
+        )
+
+        assert provider.translate_uri("tunein:station:s1") == "http://a/live"
+        assert provider.is_live("http://a/live")
+        assert provider.probes == {tunein.AUDIO: 1}
+        assert provider.backend._scanner.scanned == []
+
+    def test_expands_playlist_found_by_fast_path(self):
+        provider = make_playback(
+            FakeTuneIn(
+                {"s1": ["http://a/list.pls"]},
+                kinds={
+                    "http://a/list.pls": (tunein.PLAYLIST, ["http://b/live"]),
+                },
+            ),
+            scanner=FakeScanner(["http://b/live"]),
+        )
+
+        assert provider.translate_uri("tunein:station:s1") == "http://b/live"
+        assert provider.backend._scanner.scanned == ["http://b/live"]
+        assert provider.is_live("http://b/live")
+
+    def test_scans_when_fast_path_is_disabled(self):
+        provider = make_playback(
+            FakeTuneIn(
+                {"s1": ["http://a/live"]},
+                kinds={"http://a/live": (tunein.AUDIO, [])},
+            ),
+            scanner=FakeScanner(["http://a/live"]),
+            fast_path=False,
+        )
+
+        assert provider.translate_uri("tunein:station:s1") == "http://a/live"
+        assert provider.probes == {"scan": 1}
+
+    def test_tries_next_mirror_after_dead_one(self):
+        provider = make_playback(
+            FakeTuneIn({"s1": ["http://dead/live", "http://b/live"]}),
+            scanner=FakeScanner(["http://b/live"]),
+        )
+
+        assert provider.translate_uri("tunein:station:s1") == "http://b/live"
+        assert failing(provider, "http://dead/live")
+        assert not failing(provider, "http://b/live")
+
+    def test_plays_last_mirror_anyway(self):
+        provider = make_playback(
+            FakeTuneIn(
+                {"s1": ["http://dead/live.mp3"]},
+                playlists={"http://dead/live.mp3": ["http://dead/live.mp3"]},
+            )
+        )
+
+        uri = provider.translate_uri("tunein:station:s1")
+
+        assert uri == "http://dead/live.mp3"
+        assert not provider.is_live(uri)
+        assert failing(provider, "http://dead/live.mp3")
+
+    def test_unknown_station(self):
+        provider = make_playback(FakeTuneIn({}))
+
+        assert provider.translate_uri("tunein:station:s1") is None
+
+
+class TestStreamCache:
+    @pytest.fixture
+    def provider(self):
+        return make_playback(
+            FakeTuneIn(
+                {"s1": ["http://a/live"]},
+                kinds={"http://a/live": (tunein.AUDIO, [])},
+            )
+        )
+
+    def test_reuses_resolved_stream(self, provider):
+        provider.translate_uri("tunein:station:s1")
+        provider.translate_uri("tunein:station:s1")
+
+        assert provider.backend.tunein.tuned["s1"] == 1
+        assert provider.is_live("http://a/live")
+
+    def test_forgets_stream_stopped_before_starting(self, provider):
+        provider.translate_uri("tunein:station:s1")
+        provider._streams.stopped()
+        provider.translate_uri("tunein:station:s1")
+
+        assert provider.backend.tunein.tuned["s1"] == 2
+
+    def test_keeps_stream_stopped_after_starting(self, provider):
+        provider.translate_uri("tunein:station:s1")
+        provider._streams.started("http://a/live")
+        provider._streams.stopped()
+        provider.translate_uri("tunein:station:s1")
+
+        assert provider.backend.tunein.tuned["s1"] == 1
+
+    def test_forgets_stream_that_ended(self, provider):
+        provider.translate_uri("tunein:station:s1")
+        provider._streams.started("http://a/live")
+        provider._streams.ended()
+        provider.translate_uri("tunein:station:s1")
+
+        assert provider.backend.tunein.tuned["s1"] == 2
+
+    def test_prefetched_stream_is_used(self, provider):
+        assert provider.resolve("s1")[0] == "http://a/live"
+
+        assert provider.translate_uri("tunein:station:s1") == "http://a/live"
+        assert provider.backend.tunein.tuned["s1"] == 1
+
+
+class StallingTuneIn(FakeTuneIn):
+    """Stalls tuning at background priority until released."""
+
+    def __init__(self, streams, scheduler, **kwargs):
+        super().__init__(streams, **kwargs)
+        self.scheduler = scheduler
+        self.stalled = threading.Event()
+        self.release = threading.Event()
+        self.priorities = []
+
+    def tune(self, station, deadline=None):
+        priority = self.scheduler.current_priority()
+        self.priorities.append(priority)
+        if priority == scheduler.BACKGROUND:
+            self.stalled.set()
+            self.release.wait(5)
+        return super().tune(station, deadline=deadline)
+
+
+class TestPrefetchPriority:
+    @pytest.fixture
+    def provider(self):
+        provider = make_playback(FakeTuneIn({}))
+        provider.backend.tunein = StallingTuneIn(
+            {"s1": ["http://a/live"]},
+            provider.backend._scheduler,
+            kinds={"http://a/live": (tunein.AUDIO, [])},
+        )
+        yield provider
+        provider.backend.tunein.release.set()
+
+    def prefetch(self, provider):
+        prefetch = provider.backend._scheduler.bind(
+            provider.resolve, scheduler.BACKGROUND
+        )
+        thread = threading.Thread(target=prefetch, args=("s1",))
+        thread.start()
+        assert provider.backend.tunein.stalled.wait(5)
+        return thread
+
+    def test_playback_does_not_wait_for_prefetch(self, provider):
+        thread = self.prefetch(provider)
+
+        uri = provider.translate_uri("tunein:station:s1")
+
+        assert uri == "http://a/live"
+        assert provider.backend.tunein.priorities == [
+            scheduler.BACKGROUND,
+            scheduler.PLAYBACK,
+        ]
+        provider.backend.tunein.release.set()
+        thread.join(5)
+
+    def test_prefetch_fills_cache_for_playback(self, provider):
+        thread = self.prefetch(provider)
+        provider.backend.tunein.release.set()
+        thread.join(5)
+
+        assert provider.translate_uri("tunein:station:s1") == "http://a/live"
+        assert provider.backend.tunein.tuned["s1"] == 1
+
+
+class ImmediateExecutor(futures.Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = futures.Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class TestRaceResolver:
+    def test_resolves_with_executor(self):
+        provider = make_playback(
+            FakeTuneIn({"s1": ["http://dead/live", "http://b/live"]}),
+            scanner=FakeScanner(["http://b/live"]),
+        )
+        provider.backend._resolver = ImmediateExecutor()
+
+        assert provider.translate_uri("tunein:station:s1") == "http://b/live"
+
+
+class FakeFuture:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class FakeTracklist:
+    def __init__(self, uris):
+        self.tl_tracks = [
+            types.SimpleNamespace(
+                tlid=tlid, track=types.SimpleNamespace(uri=uri)
+            )
+            for tlid, uri in enumerate(uris, 1)
+        ]
+
+    def index(self, tlid=None):
+        for index, tl_track in enumerate(self.tl_tracks):
+            if tl_track.tlid == tlid:
+                return FakeFuture(index)
+        return FakeFuture(None)
+
+    def slice(self, start, end):
+        return FakeFuture(self.tl_tracks[start:end])
+
+
+class TestUpcomingStations:
+    tracklist = FakeTracklist(
+        [
+            "tunein:station:s1",
+            "file:///song.mp3",
+            "tunein:station:s2",
+            "tunein:station:s3",
+        ]
+    )
+
+    def test_skips_other_tracks(self):
+        assert playback.upcoming_stations(self.tracklist, 1, 2) == ["s2"]
+
+    def test_stops_at_end_of_tracklist(self):
+        assert playback.upcoming_stations(self.tracklist, 3, 5) == ["s3"]
+
+    def test_track_no_longer_in_tracklist(self):
+        assert playback.upcoming_stations(self.tracklist, 9, 2) == []
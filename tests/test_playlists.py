@@ -70,3 +70,136 @@ class TestPlaylist:
             "http://tmp.com/baz",
         ]
         assert uris == expected
+
+
+XSPF = b"""<?xml version="1.0" encoding="UTF-8"?>
+<playlist version="1" xmlns="http://xspf.org/ns/0/">
+  <trackList>
+    <track><location>file:///tmp/foo</location></track>
+    <track><location>file:///tmp/bar</location></track>
+    <track><location>file:///tmp/baz</location></track>
+  </trackList>
+</playlist>
+"""
+
+PLS = b"""[playlist]
+NumberOfEntries=3
+File1=file:///tmp/foo
+File2=file:///tmp/bar
+File3=file:///tmp/baz
+"""
+
+M3U = b"""#EXTM3U
+#EXTINF:-1,Example
+file:///tmp/foo
+"""
+
+
+class XspfPlaylistTest(BasePlaylistAsx):
+    valid = XSPF
+    parse = staticmethod(tunein.parse_xspf)
+
+
+class TestSniff:
+    def test_sniff_playlist_parser(self):
+        assert tunein.sniff_playlist_parser(PLS) is tunein.parse_pls
+        assert tunein.sniff_playlist_parser(M3U) is tunein.parse_m3u
+        assert tunein.sniff_playlist_parser(ASX) is tunein.parse_asx
+        assert tunein.sniff_playlist_parser(OLD_ASX) is tunein.parse_asx
+        assert tunein.sniff_playlist_parser(XSPF) is tunein.parse_xspf
+        assert tunein.sniff_playlist_parser(b"http://tmp.com/foo\n") is (
+            tunein.parse_m3u
+        )
+        assert tunein.sniff_playlist_parser(b"<html>") is None
+
+    def test_is_audio_data(self):
+        assert tunein.is_audio_data(b"ID3\x04\x00")
+        assert tunein.is_audio_data(b"\xff\xfb\x90\x64")  # MP3 frame
+        assert tunein.is_audio_data(b"\xff\xf1\x50\x80")  # ADTS AAC
+        assert tunein.is_audio_data(b"OggS\x00\x02")
+        assert not tunein.is_audio_data(PLS)
+        assert not tunein.is_audio_data(XSPF)
+
+    def test_detect_playlist(self):
+        hls = b"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n"
+        assert tunein.detect_playlist(hls) == tunein.HLS
+        assert tunein.detect_playlist(M3U) == tunein.M3U
+        assert tunein.detect_playlist(b"\xef\xbb\xbf" + PLS) == tunein.PLS
+        assert tunein.detect_playlist(b"", ".PLS") == tunein.PLS
+        assert tunein.detect_playlist(b"", "m3u8") == tunein.HLS
+        assert (
+            tunein.detect_playlist(b"", "", "audio/mpegurl; charset=utf-8")
+            == tunein.M3U
+        )
+        assert tunein.detect_playlist(b"<html>", ".htm", "text/html") is None
+
+
+class TestParsers:
+    def test_pls_without_configparser_quirks(self):
+        data = (
+            b"\xef\xbb\xbf[Playlist]\r\n"
+            b"; comment\r\n"
+            b"File1=http://tmp.com/foo?a=b\r\n"
+            b"Length1=-1\r\n"
+            b"File2 = 'http://tmp.com/advert'\r\n"
+            b"Length2=30\r\n"
+            b"File3=http://tmp.com/bar\r\n"
+            b"File3=http://tmp.com/duplicate\r\n"
+            b"NumberOfEntries=3\r\n"
+        )
+        assert list(tunein.parse_pls(data)) == [
+            "http://tmp.com/foo?a=b",
+            "http://tmp.com/duplicate",
+        ]
+
+    def test_pls_without_number_of_entries(self):
+        data = b"[playlist]\nFile2=http://tmp.com/bar\nFile1=http://tmp.com/foo"
+        assert list(tunein.parse_pls(data)) == [
+            "http://tmp.com/foo",
+            "http://tmp.com/bar",
+        ]
+
+    def test_pls_stops_at_missing_entry(self):
+        data = b"[playlist]\nNumberOfEntries=3\nFile1=http://tmp.com/foo\n"
+        assert list(tunein.parse_pls(data)) == ["http://tmp.com/foo"]
+
+    def test_pls_ignores_other_sections(self):
+        data = b"[other]\nFile1=http://tmp.com/foo\n[playlist]\n"
+        assert list(tunein.parse_pls(data)) == []
+
+    def test_m3u_skips_undecodable_lines(self):
+        data = b"\xef\xbb\xbf#EXTM3U\n\xff\xfe\nhttp://tmp.com/foo\n\n"
+        assert list(tunein.parse_m3u(data)) == ["http://tmp.com/foo"]
+
+    def test_asx_in_document_order_with_mixed_case(self):
+        data = (
+            b'<Asx version="3.0"><Entry HREF="http://tmp.com/foo" />'
+            b'<entry><Ref Href=" http://tmp.com/bar " /></entry></Asx>'
+        )
+        assert list(tunein.parse_asx(data)) == [
+            "http://tmp.com/foo",
+            "http://tmp.com/bar",
+        ]
+
+    def test_truncated_xml_keeps_earlier_entries(self):
+        assert list(tunein.parse_asx(ASX[:-60])) == [
+            "file:///tmp/foo",
+            "file:///tmp/bar",
+        ]
+        assert list(tunein.parse_xspf(XSPF[:-70])) == [
+            "file:///tmp/foo",
+            "file:///tmp/bar",
+        ]
+
+    def test_large_playlists(self):
+        entries = b"".join(
+            f"File{n}=http://tmp.com/{n}\n".encode() for n in range(1, 10001)
+        )
+        data = b"[playlist]\nNumberOfEntries=10000\n" + entries
+        uris = tunein.parse_pls(data)
+        assert next(uris) == "http://tmp.com/1"
+        assert len(list(uris)) == 9999
+
+        track = b"<track><location>http://tmp.com/x</location></track>"
+        data = b"<playlist><trackList>" + track * 10000
+        assert len(list(tunein.parse_xspf(data))) == 10000
@@ -0,0 +1,235 @@
+import collections
+import threading
+import time
+from concurrent import futures
+
+import pytest
+
+from mopidy_tunein import resolver
+
+
+@pytest.fixture
+def executor():
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+def test_race_returns_fastest_playable(executor):
+    release = threading.Event()
+
+    def probe(uri):
+        if uri == "dead":
+            release.wait(5)
+            return None, None, []
+        return uri, f"info-{uri}", []
+
+    try:
+        result = resolver.race(["dead", "alive"], probe, executor)
+    finally:
+        release.set()
+
+    assert result == ("alive", "info-alive")
+
+
+class ImmediateExecutor(futures.Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = futures.Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def test_race_prefers_mirror_order_on_tie():
+    def probe(uri):
+        return uri, None, []
+
+    result = resolver.race(["first", "second"], probe, ImmediateExecutor())
+
+    assert result == ("first", None)
+
+
+def test_race_follows_playlist_entries(executor):
+    def probe(uri):
+        if uri == "playlist":
+            return None, None, ["stream"]
+        if uri == "stream":
+            return "stream", None, []
+        return None, None, []
+
+    assert resolver.race(["playlist"], probe, executor) == ("stream", None)
+
+
+def test_race_fails_when_nothing_playable(executor):
+    def probe(uri):
+        if uri == "boom":
+            raise RuntimeError("probe crashed")
+        return None, None, [uri]  # Self-reference is not probed again
+
+    assert resolver.race(["a", "boom"], probe, executor) == (None, None)
+
+
+ScanResult = collections.namedtuple("ScanResult", "uri playable seekable")
+
+
+class TestStreamCache:
+    @pytest.fixture
+    def streams(self):
+        streams = resolver.StreamCache(max_entries=2, ttl=600)
+        streams.set("s1", "http://a/", ScanResult("http://a/", True, False))
+        return streams
+
+    def test_expires_after_ttl(self, streams):
+        for entry in streams._streams._entries.values():
+            entry.stored -= 601
+
+        assert streams.get("s1") is None
+
+    def test_keeps_most_recent_stations(self, streams):
+        streams.set("s2", "http://b/", None)
+        streams.set("s3", "http://c/", None)
+
+        assert len(streams) == 2
+        assert streams.get("s1") is None
+
+    def test_forgets_stream_that_failed_to_start(self, streams):
+        streams.playing("s1", "http://a/")
+        streams.stopped()
+
+        assert streams.get("s1") is None
+
+    def test_keeps_stream_stopped_after_starting(self, streams):
+        streams.playing("s1", "http://a/")
+        streams.started("http://a/")
+        streams.stopped()
+
+        assert streams.get("s1") is not None
+
+    def test_forgets_stream_that_ended(self, streams):
+        streams.playing("s1", "http://a/")
+        streams.started("http://a/")
+        streams.ended()
+
+        assert streams.get("s1") is None
+
+    def test_cached_stream_is_live(self, streams):
+        uri, stream_info = streams.get("s1")
+
+        assert resolver.is_live(stream_info, uri)
+        assert not resolver.is_live(stream_info, "http://b/")
+        assert not resolver.is_live(None, uri)
+
+    def test_stream_recognised_without_scan_is_live(self, streams):
+        streams.set("s2", "http://b/", resolver.LiveStream("http://b/"))
+        uri, stream_info = streams.get("s2")
+
+        assert resolver.is_live(stream_info, uri)
+
+
+class TestPrefetcher:
+    @pytest.fixture
+    def resolved(self):
+        return []
+
+    @pytest.fixture
+    def tracklist(self):
+        return [(tlid, f"s{tlid}") for tlid in range(1, 6)]
+
+    @pytest.fixture
+    def prefetcher(self, resolved, tracklist):
+        def resolve(station_id):
+            resolved.append(station_id)
+            return f"http://{station_id}/", None
+
+        def upcoming(tlid, count):
+            tlids = [t for t, _ in tracklist]
+            if tlid not in tlids:
+                return []
+            index = tlids.index(tlid) + 1
+            return [i for _, i in tracklist[index : index + count]]
+
+        prefetcher = resolver.Prefetcher(resolve, upcoming, depth=2, workers=1)
+        yield prefetcher
+        prefetcher.stop()
+
+    def wait(self, prefetcher):
+        deadline = time.time() + 5
+        while prefetcher.stats()["pending"] and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_prefetches_stations_after_current(self, prefetcher, resolved):
+        prefetcher.played(3)
+        self.wait(prefetcher)
+
+        assert sorted(resolved) == ["s4", "s5"]
+        assert prefetcher.stats()["failed"] == 0
+
+    def test_ignores_track_not_in_tracklist(self, prefetcher, resolved):
+        prefetcher.played(99)
+        self.wait(prefetcher)
+
+        assert resolved == []
+
+    def test_follows_tracklist_changes(self, prefetcher, resolved, tracklist):
+        prefetcher.played(5)
+        self.wait(prefetcher)
+        tracklist.append((6, "s6"))
+
+        prefetcher.changed()
+        self.wait(prefetcher)
+
+        assert resolved == ["s6"]
+
+    def test_survives_tracklist_errors(self):
+        def upcoming(tlid, count):
+            raise RuntimeError("core went away")
+
+        prefetcher = resolver.Prefetcher(lambda i: (None, None), upcoming)
+        try:
+            prefetcher.played(1)
+            self.wait(prefetcher)
+
+            assert prefetcher.stats() == {
+                "prefetched": 0,
+                "failed": 0,
+                "pending": 0,
+            }
+        finally:
+            prefetcher.stop()
+
+
+class TestDeadline:
+    def test_timeout_is_capped_by_remaining_budget(self):
+        deadline = resolver.Deadline(1)
+
+        assert deadline.timeout(5) <= 1
+        assert deadline.timeout(0.5) == 0.5
+        assert not deadline.expired()
+
+    def test_records_phase_that_exhausted_budget(self):
+        deadline = resolver.Deadline(0.05)
+        with deadline.phase("tune"):
+            pass
+        with deadline.phase("scan"):
+            time.sleep(0.1)
+        with deadline.phase("download"):
+            pass
+
+        assert deadline.expired()
+        assert deadline.remaining() == 0
+        assert deadline.exhausted_by == "scan"
+        assert sorted(deadline.phases) == ["download", "scan", "tune"]
+
+    def test_race_gives_up_at_deadline(self, executor):
+        release = threading.Event()
+
+        def probe(uri):
+            release.wait(5)
+            return uri, None, []
+
+        try:
+            result = resolver.race(
+                ["slow"], probe, executor, resolver.Deadline(0.1)
+            )
+        finally:
+            release.set()
+
+        assert result == (None, None)
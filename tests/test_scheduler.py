@@ -0,0 +1,139 @@
+import configparser
+import threading
+import time
+from concurrent import futures
+from unittest import mock
+
+import pytest
+import requests
+
+from mopidy_tunein import Extension, scheduler, tunein
+
+
+class TestScheduler:
+    def test_allows_burst_then_limits_rate(self):
+        limiter = scheduler.Scheduler(rate=20, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.acquire("http://a/")
+
+        # Two from the burst, then two more at 20 per second
+        assert time.monotonic() - start >= 0.09
+
+    def test_hosts_are_limited_separately(self):
+        limiter = scheduler.Scheduler(rate=1)
+        limiter.acquire("http://a/")
+
+        assert limiter.acquire("http://b/") < 0.01
+
+    def test_higher_priority_goes_first(self):
+        limiter = scheduler.Scheduler(rate=10, burst=1)
+        limiter.acquire("http://a/")
+        order = []
+
+        def request(priority):
+            with limiter.priority(priority):
+                limiter.acquire("http://a/x")
+            order.append(priority)
+
+        threads = [
+            threading.Thread(target=request, args=(p,))
+            for p in (scheduler.BACKGROUND, scheduler.PLAYBACK)
+        ]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        assert order == [scheduler.PLAYBACK, scheduler.BACKGROUND]
+        assert limiter.stats()["background"]["waited"] == 1
+
+    def test_times_out(self):
+        limiter = scheduler.Scheduler(rate=1)
+        limiter.acquire("http://a/")
+
+        with pytest.raises(scheduler.QueueTimeout):
+            limiter.acquire("http://a/", timeout=0.05)
+        assert limiter.stats()["queued"] == 0
+
+    def test_bind_keeps_priority(self):
+        limiter = scheduler.Scheduler()
+        with limiter.priority(scheduler.PLAYBACK):
+            bound = limiter.bind(limiter.current_priority)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(bound()))
+        thread.start()
+        thread.join()
+
+        assert result == [scheduler.PLAYBACK]
+        assert limiter.current_priority() == scheduler.INTERACTIVE
+
+
+class TestScheduledSession:
+    def test_waiting_comes_out_of_timeout(self):
+        limiter = mock.Mock()
+        limiter.acquire.return_value = 1.5
+        session = scheduler.ScheduledSession(limiter)
+        with mock.patch.object(requests.Session, "request") as request:
+            session.get("http://a/", timeout=5)
+
+        limiter.acquire.assert_called_once_with("http://a/", timeout=5)
+        assert request.call_args[1]["timeout"] == 3.5
+
+    def test_adaptive_timeout(self):
+        timeouts = mock.Mock()
+        timeouts.timeout.return_value = 1.0
+        session = scheduler.ScheduledSession(
+            scheduler.Scheduler(rate=0), timeouts=timeouts
+        )
+        with mock.patch.object(requests.Session, "request") as request:
+            session.get("http://a/", timeout=5)
+            request.side_effect = requests.Timeout()
+            with pytest.raises(requests.Timeout):
+                session.get("http://a/", timeout=5)
+
+        assert request.call_args[1]["timeout"] == 1.0
+        timeouts.observe.assert_called_once_with("http", "http://a/", mock.ANY)
+        timeouts.failed.assert_called_once_with("http", "http://a/", mock.ANY)
+
+
+def default_config():
+    ext = Extension()
+    parser = configparser.RawConfigParser()
+    parser.read_string(ext.get_default_config())
+    schema = ext.get_config_schema()
+    return {k: schema[k].deserialize(v) for k, v in parser.items("tunein")}
+
+
+class TestDefaults:
+    def test_station_batch_finishes_within_timeout(self):
+        config = default_config()
+        limiter = scheduler.Scheduler(
+            rate=config["request_rate"], burst=config["request_burst"]
+        )
+        client = tunein.TuneIn(
+            config["timeout"], session=scheduler.ScheduledSession(limiter)
+        )
+
+        def describe(method, url, **kwargs):
+            time.sleep(0.01)
+            station_id = url.rsplit("id=", 1)[1]
+            response = mock.Mock(status_code=200, headers={}, content=b"{}")
+            response.json.return_value = {
+                "body": [
+                    {"key": "listing", "children": [{"guide_id": station_id}]}
+                ]
+            }
+            return response
+
+        # As many stations as the benchmark looks up images for.
+        station_ids = [f"s{n}" for n in range(500)]
+        with futures.ThreadPoolExecutor(
+            max_workers=config["lookup_workers"]
+        ) as executor, mock.patch.object(
+            requests.Session, "request", side_effect=describe
+        ):
+            results = client.station_batch(station_ids, executor)
+
+        assert len(results) == len(station_ids)
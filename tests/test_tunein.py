@@ -0,0 +1,390 @@
+import threading
+import time
+from concurrent import futures
+from unittest import mock
+
+import pytest
+import requests
+
+from mopidy_tunein import metrics, scheduler, stations, tunein
+from mopidy_tunein.resolver import Deadline
+
+
+@pytest.fixture
+def executor():
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        yield executor
+
+
+class TestStationBatch:
+    def test_returns_known_and_fetched_stations(self, executor):
+        client = tunein.TuneIn(5000)
+        client._stations.add({"guide_id": "s1"})
+        fetched = []
+
+        def station(station_id):
+            fetched.append(station_id)
+            return {"guide_id": station_id}
+
+        client.station = station
+        results = client.station_batch(["s1", "s2", "s3", "s2"], executor)
+
+        assert sorted(results) == ["s1", "s2", "s3"]
+        assert sorted(fetched) == ["s2", "s3"]
+
+    def test_leaves_out_slow_stations(self, executor):
+        client = tunein.TuneIn(5000)
+        release = threading.Event()
+
+        def station(station_id):
+            if station_id == "slow":
+                release.wait(5)
+            return {"guide_id": station_id}
+
+        client.station = station
+        try:
+            results = client.station_batch(["fast", "slow"], executor, 0.2)
+        finally:
+            release.set()
+
+        assert list(results) == ["fast"]
+
+
+class TestStation:
+    def test_behaves_like_station_dict(self):
+        station = stations.Station(
+            {"guide_id": "s1", "text": "Radio", "type": "audio", "extra": 1}
+        )
+
+        assert station["text"] == "Radio"
+        assert station.get("subtext", "??") == "??"
+        assert "image" not in station
+        assert "extra" not in station
+        with pytest.raises(KeyError):
+            station["URL"]
+
+
+class TestStationStore:
+    def test_evicts_least_recently_used(self):
+        store = stations.StationStore(max_entries=2)
+        for station_id in ["s1", "s2", "s3"]:
+            store.add({"guide_id": station_id})
+
+        assert "s1" not in store
+        assert store.get("s3").guide_id == "s3"
+
+    def test_remembers_unknown_stations(self):
+        store = stations.StationStore(negative_ttl=60)
+        store.mark_unknown("s1")
+
+        assert store.is_unknown("s1")
+        store.add({"guide_id": "s1"})
+        assert not store.is_unknown("s1")
+
+
+class TestTuneInStation:
+    def test_caches_described_station(self):
+        client = tunein.TuneIn(5000)
+        described = []
+
+        def station_info(station_id):
+            described.append(station_id)
+            return {"guide_id": station_id, "text": "Radio"}
+
+        client._station_info = station_info
+
+        assert client.station("s1")["text"] == "Radio"
+        assert client.station("s1")["text"] == "Radio"
+        assert described == ["s1"]
+
+    def test_caches_unknown_station(self):
+        client = tunein.TuneIn(5000)
+        described = []
+
+        def station_info(station_id):
+            described.append(station_id)
+
+        client._station_info = station_info
+
+        assert client.station("s1") is None
+        assert client.station("s1") is None
+        assert described == ["s1"]
+
+    def test_remembers_station_tunein_does_not_know(self):
+        session = FlakySession([])
+        client = tunein.TuneIn(5000, session=session)
+
+        assert client.station("s1") is None
+        assert client.station("s1") is None
+        assert session.calls == 1
+
+    def test_retries_station_after_failed_request(self):
+        session = FlakySession(None)
+        client = tunein.TuneIn(5000, session=session)
+
+        assert client.station("s1") is None
+        assert not client._stations.is_unknown("s1")
+        session.body = [{"key": "listing", "children": [{"guide_id": "s1"}]}]
+        assert client.station("s1")["guide_id"] == "s1"
+        assert session.calls == 2
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, content_type, chunks):
+        self.headers = {"content-type": content_type}
+        self.chunks = chunks
+        self.read = 0
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, uri, **kwargs):
+        return self.response
+
+
+def endless(chunk):
+    while True:
+        yield chunk
+
+
+class TestGetPlaylist:
+    def test_skips_audio_content_type(self):
+        response = FakeResponse("audio/aac", endless(b"\xff\xf1"))
+        client = tunein.TuneIn(5000, session=FakeSession(response))
+
+        assert client._get_playlist("http://a/") == (None, "audio/aac")
+        assert response.read == 0
+
+    def test_stops_at_sniffed_audio(self):
+        response = FakeResponse("application/octet-stream", endless(b"OggS"))
+        client = tunein.TuneIn(5000, session=FakeSession(response))
+
+        data, _ = client._get_playlist("http://a/")
+
+        assert data is None
+        assert response.read == 1
+
+    def test_reads_at_most_max_playlist_size(self):
+        response = FakeResponse("text/plain", endless(b"http://a/\n" * 100))
+        client = tunein.TuneIn(
+            5000, session=FakeSession(response), max_playlist_size=4000
+        )
+
+        data, _ = client._get_playlist("http://a/")
+
+        assert len(data) == 4000
+        assert response.read == 4
+
+    def test_does_not_cache_playlist_cut_short(self):
+        pls = b"[playlist]\nNumberOfEntries=1\nFile1=http://b/\n"
+
+        def slow():
+            time.sleep(0.1)
+            yield pls
+
+        session = mock.Mock()
+        session.get.side_effect = lambda uri, **kwargs: FakeResponse(
+            "audio/x-scpls", slow()
+        )
+        client = tunein.TuneIn(5000, session=session)
+        url = "http://a/listen.pls"
+
+        assert client.classify(url, deadline=Deadline(0.05)) == (
+            tunein.UNKNOWN,
+            [],
+        )
+        assert client.classify(url) == (tunein.PLAYLIST, ["http://b/"])
+        assert session.get.call_count == 2
+
+    def test_parses_sniffed_playlist(self):
+        pls = b"[playlist]\nNumberOfEntries=1\nFile1=http://b/\n"
+        response = FakeResponse("text/plain", [pls])
+        client = tunein.TuneIn(5000, session=FakeSession(response))
+
+        assert client.parse_stream_url("http://a/") == ["http://b/"]
+
+
+class TestClassify:
+    def classify(self, response, url="http://a/"):
+        client = tunein.TuneIn(5000, session=FakeSession(response))
+        return client.classify(url)
+
+    def test_audio_content_type(self):
+        response = FakeResponse("audio/mpeg", endless(b"\xff\xfb"))
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+        assert response.read == 0
+
+    def test_icy_headers(self):
+        response = FakeResponse("text/html", endless(b"<html>"))
+        response.headers["icy-name"] = "Radio"
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+        assert response.read == 0
+
+    def test_sniffed_audio(self):
+        response = FakeResponse("application/octet-stream", [b"OggS\x00"])
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+
+    def test_playlist(self):
+        response = FakeResponse("audio/x-mpegurl", [b"http://b/\nhttp://c/\n"])
+
+        assert self.classify(response) == (
+            tunein.PLAYLIST,
+            ["http://b/", "http://c/"],
+        )
+
+    def test_hls(self):
+        response = FakeResponse(
+            "application/vnd.apple.mpegurl",
+            [b"#EXTM3U\n#EXT-X-TARGETDURATION:10\nsegment1.aac\n"],
+        )
+
+        assert self.classify(response) == (tunein.AUDIO, ["http://a/"])
+
+    def test_unknown(self):
+        response = FakeResponse("text/html", [b"<html></html>"])
+
+        assert self.classify(response) == (tunein.UNKNOWN, [])
+
+    def test_requests_audio_extension(self):
+        session = FlakySession(None)
+        client = tunein.TuneIn(5000, session=session)
+        url = "http://127.0.0.1:1/station.wma"
+
+        assert client.classify(url) == (tunein.UNKNOWN, [])
+        assert session.calls == 1
+        # Only once scanning failed is the extension taken at its word.
+        assert client.parse_stream_url(url) == [url]
+        assert session.calls == 1
+
+
+class FlakySession:
+    def __init__(self, body):
+        self.body = body
+        self.calls = 0
+
+    def get(self, uri, **kwargs):
+        self.calls += 1
+        if self.body is None:
+            raise requests.ConnectionError("down")
+        response = mock.Mock(status_code=200, headers={}, content=b"{}")
+        response.json.return_value = {"body": self.body}
+        return response
+
+
+class TestTuneInApi:
+    def test_records_metrics(self):
+        registry = metrics.Registry()
+        client = tunein.TuneIn(
+            5000, session=FlakySession([{"text": "Music"}]), registry=registry
+        )
+        client._tunein("Browse.ashx", "")
+        client._tunein("Browse.ashx", "")
+        rendered = registry.render()
+
+        assert 'tunein_cache_hits_total{cache="api"} 1' in rendered
+        assert (
+            'tunein_api_request_seconds_count{variant="Browse.ashx",'
+            'outcome="ok"} 1'
+        ) in rendered
+
+    def test_serves_stale_response_while_failing(self):
+        session = FlakySession([{"text": "Music", "key": "music"}])
+        client = tunein.TuneIn(5000, session=session)
+        client._tunein("Browse.ashx", "")
+        for entry in client._caches["_tunein"]._entries.values():
+            entry.stored -= 7200
+        session.body = None
+
+        for _ in range(5):
+            assert client._tunein("Browse.ashx", "") == [
+                {"text": "Music", "key": "music"}
+            ]
+        # The circuit opened after three failures.
+        assert session.calls == 4
+        assert client.cache_stats()["circuits"]["Browse.ashx"]["state"] == (
+            "open"
+        )
+
+    def test_client_errors_keep_circuit_closed(self):
+        client = tunein.TuneIn(5000, session=mock.Mock())
+        error = requests.HTTPError(response=mock.Mock(status_code=404))
+        client._session.get.side_effect = error
+        for _ in range(5):
+            assert client._tunein("Describe.ashx", "&id=s1") == {}
+
+        assert client._session.get.call_count == 5
+
+    def test_rate_limit_timeouts_keep_circuit_closed(self):
+        client = tunein.TuneIn(5000, session=mock.Mock())
+        client._session.get.side_effect = scheduler.QueueTimeout("queued")
+        for _ in range(5):
+            assert client._tunein("Browse.ashx", "") == {}
+
+        assert client._session.get.call_count == 5
+        assert client.cache_stats()["circuits"]["Browse.ashx"]["state"] == (
+            "closed"
+        )
+
+    def test_revalidates_expired_response(self):
+        body = [{"text": "Music", "key": "music"}]
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(
+            status_code=200,
+            headers={"ETag": '"v1"'},
+            content=b"x" * 100,
+        )
+        session.get.return_value.json.return_value = {"body": body}
+        client = tunein.TuneIn(5000, session=session)
+        client._tunein("Browse.ashx", "")
+        for entry in client._caches["_tunein"]._entries.values():
+            entry.stored -= 7200
+        session.get.return_value = mock.Mock(status_code=304, headers={})
+
+        assert client._tunein("Browse.ashx", "") is body
+        assert session.get.call_args[1]["headers"] == {"If-None-Match": '"v1"'}
+        assert client._tunein("Browse.ashx", "") is body
+        assert session.get.call_count == 2
+        transfer = client.cache_stats()["transfer"]
+        assert transfer["not_modified"] == 1
+        assert transfer["saved_by_revalidation"] == 100
+
+
+class TestInvalidate:
+    def test_invalidates_only_subtree(self):
+        session = FlakySession(
+            [{"text": "Stations", "key": "stations", "children": []}]
+        )
+        client = tunein.TuneIn(5000, session=session)
+        with client.recording("tunein:category:music") as children:
+            client.categories("music")
+            children.add("tunein:section:g22")
+        with client.recording("tunein:section:g22"):
+            client.stations("g22")
+        with client.recording("tunein:category:talk"):
+            client.categories("talk")
+        assert session.calls == 3
+
+        assert client.invalidate("tunein:category:music")
+        client.categories("music")
+        client.stations("g22")
+        client.categories("talk")
+        assert session.calls == 5
+        assert not client.invalidate("tunein:category:music")